@@ -83,6 +83,86 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Packed location history (see core/tracks.py). When enabled, `manage.py pack_locations`
+# moves fixes older than LOCATION_PACK_AFTER_MINUTES into compact segments.
+LOCATION_PACKING_ENABLED = os.getenv('LOCATION_PACKING_ENABLED', 'False') == 'True'
+LOCATION_SEGMENT_SIZE = int(os.getenv('LOCATION_SEGMENT_SIZE', '1000'))
+LOCATION_PACK_AFTER_MINUTES = int(os.getenv('LOCATION_PACK_AFTER_MINUTES', '30'))
+# manage.py downsample_tracks keeps one fix per LOCATION_RETENTION_INTERVAL_SECONDS, plus the turns
+# needed to stay within LOCATION_RETENTION_TOLERANCE_M of the route, for orders finished this long ago
+LOCATION_RETENTION_DAYS = int(os.getenv('LOCATION_RETENTION_DAYS', '30'))
+LOCATION_RETENTION_INTERVAL_SECONDS = int(os.getenv('LOCATION_RETENTION_INTERVAL_SECONDS', '60'))
+LOCATION_RETENTION_TOLERANCE_M = float(os.getenv('LOCATION_RETENTION_TOLERANCE_M', '25'))
+LOCATION_RETENTION_BATCH_SIZE = int(os.getenv('LOCATION_RETENTION_BATCH_SIZE', '5000'))
+
+# Batch GPS uploads (POST /api/orders/<id>/locations/batch/)
+LOCATION_BATCH_MAX_FIXES = int(os.getenv('LOCATION_BATCH_MAX_FIXES', '2000'))
+LOCATION_MAX_CLOCK_SKEW_SECONDS = int(os.getenv('LOCATION_MAX_CLOCK_SKEW_SECONDS', '300'))
+
+# WebSocket location updates are buffered per process and written in batches.
+# Ack mode 'persisted' acks after the flush commits (clients resend on nack),
+# 'received' acks as soon as the fix is buffered.
+LOCATION_WS_FLUSH_INTERVAL_MS = int(os.getenv('LOCATION_WS_FLUSH_INTERVAL_MS', '1000'))
+LOCATION_WS_FLUSH_MAX_FIXES = int(os.getenv('LOCATION_WS_FLUSH_MAX_FIXES', '500'))
+LOCATION_WS_BUFFER_MAX_FIXES = int(os.getenv('LOCATION_WS_BUFFER_MAX_FIXES', '10000'))
+LOCATION_WS_ACK_MODE = os.getenv('LOCATION_WS_ACK_MODE', 'persisted')
+# Each order's tracking group gets at most one location_update per interval and server process,
+# carrying the newest fix and up to LOCATION_BROADCAST_MAX_POINTS of the fixes it replaced; 0 sends
+# every update
+LOCATION_BROADCAST_INTERVAL_MS = int(os.getenv('LOCATION_BROADCAST_INTERVAL_MS', '2000'))
+LOCATION_BROADCAST_MAX_POINTS = int(os.getenv('LOCATION_BROADCAST_MAX_POINTS', '0'))
+
+# Cache for hot reads such as the dashboards. Local memory is per process; set
+# CACHE_REDIS_URL to share it between workers.
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Dashboard statistics are cached per user and dropped when their bids, orders,
+# requirements or trucks change; the timeout only bounds anything missed
+DASHBOARD_STATS_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_STATS_CACHE_TIMEOUT', '300'))
+
+# Requirement searches are ranked by relevance unless they match more than this many
+# requirements; broader searches are listed newest first (see core/search.py)
+SEARCH_RANK_MAX_MATCHES = int(os.getenv('SEARCH_RANK_MAX_MATCHES', '10000'))
+# First pages of cursor-paginated searches are cached; any requirement change retires them
+SEARCH_FIRST_PAGE_CACHE_TIMEOUT = int(os.getenv('SEARCH_FIRST_PAGE_CACHE_TIMEOUT', '30'))
+
+# Owner ratings and on-time ratios used to rank trucks for a requirement (see core/matching.py)
+MATCHING_OWNER_STATS_CACHE_TIMEOUT = int(os.getenv('MATCHING_OWNER_STATS_CACHE_TIMEOUT', '600'))
+
+# manage.py run_scheduler closes requirements whose bidding has ended every this many seconds
+AUCTION_CLOSE_INTERVAL = int(os.getenv('AUCTION_CLOSE_INTERVAL', '60'))
+# Expired requirements closed per transaction
+AUCTION_CLOSE_BATCH_SIZE = int(os.getenv('AUCTION_CLOSE_BATCH_SIZE', '500'))
+# New requirements are announced to matching truck owners this often, this many per transaction
+REQUIREMENT_FANOUT_INTERVAL = int(os.getenv('REQUIREMENT_FANOUT_INTERVAL', '5'))
+REQUIREMENT_FANOUT_CHUNK_SIZE = int(os.getenv('REQUIREMENT_FANOUT_CHUNK_SIZE', '2000'))
+
+# manage.py purge_notifications deletes read notifications older than this, in batches with a pause
+# in between, and keeps only a per-user count of them
+NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', '90'))
+NOTIFICATION_PURGE_BATCH_SIZE = int(os.getenv('NOTIFICATION_PURGE_BATCH_SIZE', '1000'))
+NOTIFICATION_PURGE_PAUSE_MS = int(os.getenv('NOTIFICATION_PURGE_PAUSE_MS', '100'))
+# Unread notifications marked read per UPDATE by mark_all_read
+NOTIFICATION_MARK_READ_CHUNK_SIZE = int(os.getenv('NOTIFICATION_MARK_READ_CHUNK_SIZE', '1000'))
+
+# Tracking sockets opened for the same order within this window share one initial snapshot
+TRACKING_SNAPSHOT_TTL_SECONDS = float(os.getenv('TRACKING_SNAPSHOT_TTL_SECONDS', '2'))
+
+# Order detail embeds only this many of the newest fixes; the rest is paginated
+ORDER_DETAIL_RECENT_LOCATIONS = int(os.getenv('ORDER_DETAIL_RECENT_LOCATIONS', '50'))
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
-from .models import User, Truck, Requirement, Bid, Order, Location, Notification
+from .models import (
+    User, Truck, Requirement, Bid, Order, Location, LocationSegment, OrderRollup, TruckMatch, Notification,
+    NotificationArchive
+)
 
 
 @admin.register(User)
@@ -176,6 +179,53 @@ class LocationAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('order')
 
 
+@admin.register(LocationSegment)
+class LocationSegmentAdmin(admin.ModelAdmin):
+    """Admin configuration for packed location segments (read only)"""
+    list_display = ['order', 'point_count', 'start_time', 'end_time', 'created_at']
+    search_fields = ['order__order_number']
+    ordering = ['-end_time']
+    readonly_fields = ['order', 'start_time', 'end_time', 'point_count', 'created_at']
+    exclude = ['data']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('order').defer('data')
+
+
+@admin.register(OrderRollup)
+class OrderRollupAdmin(admin.ModelAdmin):
+    """Admin configuration for daily order rollups (read only)"""
+    list_display = ['user', 'role', 'day', 'status', 'order_count', 'revenue', 'rating_count']
+    list_filter = ['role', 'status', 'day']
+    search_fields = ['user__username']
+    ordering = ['-day']
+    readonly_fields = ['user', 'role', 'day', 'status', 'order_count', 'revenue', 'rating_sum', 'rating_count']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
+
+@admin.register(TruckMatch)
+class TruckMatchAdmin(admin.ModelAdmin):
+    """Admin configuration for stored truck matches (read only)"""
+    list_display = ['truck', 'rank', 'requirement', 'score', 'distance_km', 'computed_at']
+    search_fields = ['truck__registration_number', 'requirement__title']
+    ordering = ['truck', 'rank']
+    readonly_fields = ['truck', 'requirement', 'rank', 'score', 'distance_km', 'computed_at']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('truck', 'requirement')
+
+
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     """Admin configuration for Notification model"""
@@ -202,6 +252,21 @@ class NotificationAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('user')
 
 
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(admin.ModelAdmin):
+    """Admin configuration for purged notification counts (read only)"""
+    list_display = ['user', 'archived_count', 'updated_at']
+    search_fields = ['user__username']
+    ordering = ['-archived_count']
+    readonly_fields = ['user', 'archived_count', 'updated_at']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
+
 # Add inlines to related models
 RequirementAdmin.inlines = [BidInline]
 OrderAdmin.inlines = [LocationInline]
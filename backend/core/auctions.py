@@ -0,0 +1,160 @@
+"""Bid acceptance and the closing of expired auctions.
+
+``accept_bid`` is the one way a bid gets accepted, by an admin through
+``BidViewSet.respond`` or by ``close_expired_auctions``. It and
+``reject_bid`` lock the requirement row first, so concurrent responses to
+bids on one requirement run one after the other, and refresh the
+requirement's bid stats under that lock.
+
+``close_expired_auctions`` moves open requirements whose bidding window has
+ended to ``closed``, in batches through the (status, bidding_end_date)
+index. Requirements with ``auto_accept`` set are assigned to their lowest
+pending bid instead, if it is within ``budget_max``. ``manage.py run_scheduler`` calls it periodically.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import dashboards, notifications, rollups, search
+from .models import Requirement, Bid, Order, Notification
+
+
+class BidNotAcceptable(Exception):
+    """Raised when a bid can no longer be accepted or rejected"""
+
+
+def _lock(bid):
+    """Lock the bid's requirement and re-read both, so concurrent responses are serialized"""
+    requirement = Requirement.objects.select_for_update().get(pk=bid.requirement_id)
+    bid.refresh_from_db(fields=['status'])
+    if bid.status != 'pending':
+        raise BidNotAcceptable(f'This bid is already {bid.status}')
+    bid.requirement = requirement
+    return requirement
+
+
+def accept_bid(bid, response_message=None):
+    """Accept ``bid``, reject the other bids on its requirement and create the order.
+
+    Call inside a transaction. The requirement row stays locked until it
+    commits, so of two concurrent acceptances only the first succeeds.
+    """
+    requirement = _lock(bid)
+    if requirement.status not in ('open', 'closed'):
+        raise BidNotAcceptable('This requirement has already been assigned')
+
+    bid.status = 'accepted'
+    if response_message is not None:
+        bid.response_message = response_message
+    bid.save()
+
+    # Reject all other bids for this requirement
+    other_bids = Bid.objects.filter(requirement=requirement).exclude(id=bid.id)
+    losers = list(other_bids.filter(status='pending').values_list('id', 'user_id'))
+    other_bids.update(status='rejected', response_message='Another bid was selected')
+    # update() sends no signals, so drop the bidders' dashboards here
+    dashboards.invalidate_dashboards(user_id for _, user_id in losers)
+
+    # Mark requirement as assigned, with its bid stats in the same write
+    requirement.status = 'assigned'
+    requirement.refresh_bid_stats(save=False)
+    requirement.save(update_fields=['status', 'updated_at', *Requirement.BID_STATS_FIELDS])
+
+    order = Order.objects.create(
+        requirement=requirement,
+        user=bid.user,
+        truck=bid.truck,
+        accepted_bid=bid,
+        estimated_delivery_time=timezone.now() + bid.estimated_delivery_time
+    )
+    rollups.record_order_change(None, rollups.order_facts(order))
+
+    notifications.notify_many([
+        Notification(
+            user=bid.user,
+            title='Bid Accepted',
+            message=f'Your bid for "{requirement.title}" has been accepted!',
+            notification_type='bid_accepted',
+            requirement=requirement,
+            order=order,
+            bid=bid
+        ),
+        *(
+            Notification(
+                user_id=user_id,
+                title='Bid Rejected',
+                message=f'Your bid for "{requirement.title}" was not selected.',
+                notification_type='bid_rejected',
+                requirement=requirement,
+                bid_id=bid_id
+            )
+            for bid_id, user_id in losers
+        ),
+    ])
+    return order
+
+
+def reject_bid(bid, response_message=None):
+    """Reject a pending ``bid``; call inside a transaction"""
+    requirement = _lock(bid)
+    bid.status = 'rejected'
+    if response_message is not None:
+        bid.response_message = response_message
+    bid.save()
+    requirement.refresh_bid_stats()
+
+    notifications.notify(
+        bid.user,
+        'Bid Rejected',
+        f'Your bid for "{requirement.title}" has been rejected.',
+        'bid_rejected',
+        requirement=requirement,
+        bid=bid
+    )
+
+
+def _lowest_pending_bid(requirement):
+    bids = requirement.bids.filter(status='pending')
+    if requirement.budget_max is not None:
+        bids = bids.filter(amount__lte=requirement.budget_max)
+    return bids.select_related('user', 'truck').order_by('amount', 'created_at', 'id').first()
+
+
+def close_expired_auctions(now=None, batch_size=500):
+    """Close or auto-assign every open requirement whose bidding has ended; returns (closed, assigned)"""
+    now = now or timezone.now()
+    expired = Requirement.objects.filter(status='open', bidding_end_date__lte=now).order_by('bidding_end_date', 'id')
+    # Requirements locked by an admin responding to a bid are left for the next run
+    expired = expired.select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+
+    closed = assigned = 0
+    while True:
+        with transaction.atomic():
+            batch = list(expired[:batch_size])
+            if not batch:
+                break
+
+            to_close = []
+            for requirement in batch:
+                bid = _lowest_pending_bid(requirement) if requirement.auto_accept else None
+                if bid is not None:
+                    accept_bid(bid, 'Accepted automatically as the lowest bid when bidding ended')
+                    assigned += 1
+                else:
+                    to_close.append(requirement)
+
+            Requirement.objects.filter(id__in=[r.id for r in to_close]).update(status='closed', updated_at=now)
+            # update() sends no signals
+            search.invalidate_search_cache()
+            dashboards.invalidate_dashboards([r.admin_id for r in to_close])
+            notifications.notify_many([
+                Notification(
+                    user_id=requirement.admin_id,
+                    title='Bidding Closed',
+                    message=f'Bidding for "{requirement.title}" has ended. Review the bids to assign it.',
+                    notification_type='bidding_closed',
+                    requirement=requirement,
+                )
+                for requirement in to_close
+            ])
+            closed += len(to_close)
+    return closed, assigned
@@ -0,0 +1,6 @@
+"""Offline performance benchmarks for the core app.
+
+Benchmarks run against a throwaway test database and never need a live
+server, unlike ``backend/test_api.py``. They are driven by management
+commands (see ``benchmark_api``).
+"""
@@ -0,0 +1,472 @@
+"""Query-count and latency benchmark for every REST endpoint in core/urls.py.
+
+Each endpoint is called through the Django test client against datasets
+of increasing size. For every call we record the number of SQL queries,
+p50/p99 latency and response size. The run fails when an endpoint's
+query count grows with the dataset (a N+1 regression) or goes over the
+stored baseline.
+"""
+import json
+import statistics
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Optional
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import gazetteer, matching, rollups, tracks, urls as core_urls
+from core.models import User, Truck, Requirement, Bid, Order, Location, Notification
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'api_baseline.json'
+PASSWORD = 'Bench!pass-2024'
+BULK_BATCH_SIZE = 2000
+
+
+@dataclass
+class Endpoint:
+    """A single endpoint call to benchmark"""
+    url_name: str
+    method: str
+    role: Optional[str]  # 'admin', 'user' or None for anonymous
+    kwargs: Callable[[dict], dict] = lambda ctx: {}
+    data: Callable[[dict], Optional[dict]] = lambda ctx: None
+    query: str = ''
+    expected_status: tuple = (200,)
+    label: str = ''  # tells apart calls that share method, URL and role
+
+    @property
+    def key(self):
+        suffix = f'?{self.query}' if self.query else ''
+        label = f' ({self.label})' if self.label else ''
+        return f'{self.method} {self.url_name}{suffix} [{self.role or "anon"}]{label}'
+
+    @property
+    def mutating(self):
+        return self.method not in ('GET', 'HEAD', 'OPTIONS')
+
+
+@dataclass
+class EndpointResult:
+    """Measurements for one endpoint at one dataset size"""
+    key: str
+    size: int
+    status_code: int
+    queries: int
+    p50_ms: float
+    p99_ms: float
+    response_bytes: int
+    samples_ms: list = field(default_factory=list, repr=False)
+
+    def as_dict(self):
+        return {
+            'key': self.key,
+            'size': self.size,
+            'status_code': self.status_code,
+            'queries': self.queries,
+            'p50_ms': round(self.p50_ms, 3),
+            'p99_ms': round(self.p99_ms, 3),
+            'response_bytes': self.response_bytes,
+        }
+
+
+ENDPOINTS = [
+    # Authentication
+    Endpoint('auth_register', 'POST', None, data=lambda ctx: {
+        'username': 'bench_new_user', 'email': 'bench_new@example.com',
+        'password': PASSWORD, 'password_confirm': PASSWORD, 'role': 'user',
+    }, expected_status=(201,)),
+    Endpoint('auth_login', 'POST', None, data=lambda ctx: {
+        'username': ctx['owner'].username, 'password': PASSWORD,
+    }),
+    Endpoint('token_refresh', 'POST', None, data=lambda ctx: {'refresh': ctx['owner_refresh']}),
+    Endpoint('token_verify', 'POST', None, data=lambda ctx: {'token': ctx['owner_access']}),
+    Endpoint('auth_profile', 'GET', 'user'),
+    Endpoint('auth_profile', 'PATCH', 'user', data=lambda ctx: {'address': 'Benchmark Street'}),
+    Endpoint('auth_change_password', 'PUT', 'user', data=lambda ctx: {
+        'current_password': PASSWORD, 'new_password': PASSWORD + '!', 'confirm_password': PASSWORD + '!',
+    }),
+
+    # Dashboards
+    Endpoint('admin_dashboard', 'GET', 'admin'),
+    Endpoint('truck_owner_dashboard', 'GET', 'user'),
+    Endpoint('admin_dashboard', 'GET', 'admin', query='fresh=1'),
+    Endpoint('truck_owner_dashboard', 'GET', 'user', query='fresh=1'),
+    Endpoint('dashboard_cache_stats', 'GET', 'admin'),
+    Endpoint('admin_timeseries', 'GET', 'admin'),
+    Endpoint('admin_timeseries', 'GET', 'admin', query='granularity=month'),
+    Endpoint('truck_owner_timeseries', 'GET', 'user', query='granularity=week'),
+
+    # Router root
+    Endpoint('api-root', 'GET', 'admin'),
+
+    # Trucks
+    Endpoint('truck-list', 'GET', 'user'),
+    Endpoint('truck-list', 'GET', 'admin'),
+    Endpoint('truck-list', 'POST', 'user', data=lambda ctx: {
+        'truck_type': 'medium', 'capacity': '12.00', 'registration_number': 'BENCHNEW01',
+        'make_model': 'Tata 407', 'year': 2021,
+    }, expected_status=(201,)),
+    Endpoint('truck-detail', 'GET', 'user', kwargs=lambda ctx: {'pk': ctx['truck'].pk}),
+    Endpoint('truck-detail', 'PATCH', 'user', kwargs=lambda ctx: {'pk': ctx['truck'].pk},
+             data=lambda ctx: {'current_location': 'Delhi'}),
+    Endpoint('truck-matches', 'GET', 'user', kwargs=lambda ctx: {'pk': ctx['truck'].pk}),
+    Endpoint('truck-detail', 'DELETE', 'user', kwargs=lambda ctx: {'pk': ctx['spare_truck'].pk},
+             expected_status=(204,)),
+
+    # Requirements
+    Endpoint('requirement-list', 'GET', 'user'),
+    Endpoint('requirement-list', 'GET', 'admin'),
+    Endpoint('requirement-list', 'POST', 'admin', data=lambda ctx: {
+        'title': 'Benchmark load', 'load_type': 'other', 'weight': '5.00', 'truck_type': 'medium',
+        'from_location': 'Delhi, India', 'to_location': 'Mumbai, India',
+        'pickup_date': (ctx['now'] + timedelta(days=5)).isoformat(),
+        'delivery_date': (ctx['now'] + timedelta(days=7)).isoformat(),
+        'bidding_end_date': (ctx['now'] + timedelta(days=3)).isoformat(),
+    }, expected_status=(201,)),
+    Endpoint('requirement-detail', 'GET', 'admin', kwargs=lambda ctx: {'pk': ctx['open_requirement'].pk}),
+    Endpoint('requirement-detail', 'PATCH', 'admin', kwargs=lambda ctx: {'pk': ctx['open_requirement'].pk},
+             data=lambda ctx: {'special_instructions': 'Handle with care'}),
+    Endpoint('requirement-detail', 'DELETE', 'admin', kwargs=lambda ctx: {'pk': ctx['fresh_requirement'].pk},
+             expected_status=(204,)),
+    Endpoint('requirement-bids', 'GET', 'admin', kwargs=lambda ctx: {'pk': ctx['open_requirement'].pk}),
+    Endpoint('requirement-matches', 'GET', 'admin', kwargs=lambda ctx: {'pk': ctx['open_requirement'].pk},
+             query='limit=20'),
+    Endpoint('search_requirements', 'GET', 'user', query='search=Delhi'),
+    Endpoint('search_requirements', 'GET', 'user', query='truck_type=medium&page=2'),
+    Endpoint('search_requirements', 'GET', 'user', query='pagination=cursor&search=Delhi'),
+    Endpoint('nearby_requirements', 'GET', 'user', query='lat=28.5&lng=77.3&radius=50'),
+    Endpoint('nearby_requirements', 'GET', 'user', query='lat=28.5&lng=77.3&truck_type=medium&capacity=10&page=2'),
+
+    # Bids
+    Endpoint('bid-list', 'GET', 'user'),
+    Endpoint('bid-list', 'GET', 'admin'),
+    Endpoint('bid-list', 'POST', 'user', data=lambda ctx: {
+        'requirement': ctx['fresh_requirement'].pk, 'truck': ctx['bid_truck'].pk,
+        'amount': '15000.00', 'estimated_delivery_time': '2 00:00:00',
+    }, expected_status=(201,)),
+    Endpoint('bid-detail', 'GET', 'user', kwargs=lambda ctx: {'pk': ctx['open_bid'].pk}),
+    Endpoint('bid-detail', 'PATCH', 'user', kwargs=lambda ctx: {'pk': ctx['open_bid'].pk},
+             data=lambda ctx: {'message': 'Updated offer'}),
+    Endpoint('bid-respond', 'PATCH', 'admin', kwargs=lambda ctx: {'pk': ctx['open_bid'].pk},
+             data=lambda ctx: {'status': 'accepted', 'response_message': 'Accepted'}, label='accept'),
+    Endpoint('bid-respond', 'PATCH', 'admin', kwargs=lambda ctx: {'pk': ctx['open_bid'].pk},
+             data=lambda ctx: {'status': 'rejected', 'response_message': 'Rejected'}, label='reject'),
+
+    # Orders
+    Endpoint('order-list', 'GET', 'user'),
+    Endpoint('order-list', 'GET', 'admin'),
+    Endpoint('order-detail', 'GET', 'admin', kwargs=lambda ctx: {'pk': ctx['tracked_order'].pk}),
+    Endpoint('order-update-status', 'PATCH', 'user', kwargs=lambda ctx: {'pk': ctx['tracked_order'].pk},
+             data=lambda ctx: {'status': 'delivered'}),
+    Endpoint('update_order_status', 'POST', 'admin', kwargs=lambda ctx: {'order_id': str(ctx['tracked_order'].pk)},
+             data=lambda ctx: {'status': 'on_the_way'}),
+
+    # Locations
+    Endpoint('location-list', 'GET', 'admin'),
+    Endpoint('location-list', 'GET', 'user'),
+    Endpoint('location-list', 'POST', 'user', data=lambda ctx: {
+        'order': ctx['tracked_order'].pk, 'latitude': '28.6139000', 'longitude': '77.2090000',
+        'speed': '55.00', 'heading': '90.00',
+    }, expected_status=(201,)),
+    Endpoint('location_batch', 'POST', 'user', kwargs=lambda ctx: {'order_id': ctx['tracked_order'].pk},
+             data=lambda ctx: {'fixes': [
+                 {'latitude': f'{28.6139 + i / 10000:.7f}', 'longitude': '77.2090000', 'speed': '55.00',
+                  'timestamp': (ctx['now'] + timedelta(milliseconds=500 * (i + 1))).isoformat()}
+                 for i in range(200)
+             ]}, expected_status=(201,)),
+    Endpoint('location-detail', 'GET', 'admin', kwargs=lambda ctx: {'pk': ctx['location'].pk}),
+    Endpoint('current_location', 'GET', 'admin', kwargs=lambda ctx: {'order_id': ctx['tracked_order'].pk}),
+    Endpoint('simulate_location_update', 'POST', 'admin',
+             kwargs=lambda ctx: {'order_id': str(ctx['tracked_order'].pk)}),
+
+    # Notifications
+    Endpoint('notification-list', 'GET', 'admin'),
+    Endpoint('notification-detail', 'GET', 'admin', kwargs=lambda ctx: {'pk': ctx['notification'].pk}),
+    Endpoint('notification-detail', 'DELETE', 'admin', kwargs=lambda ctx: {'pk': ctx['notification'].pk},
+             expected_status=(204,)),
+    Endpoint('notification-mark-read', 'PATCH', 'admin', kwargs=lambda ctx: {'pk': ctx['notification'].pk}),
+    Endpoint('notification-mark-all-read', 'PATCH', 'admin'),
+    Endpoint('notification-summary', 'GET', 'admin'),
+]
+
+
+def iter_url_names(patterns=None):
+    """Yield the name of every URL pattern reachable from core/urls.py"""
+    if patterns is None:
+        patterns = core_urls.urlpatterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_url_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+def uncovered_url_names(endpoints=ENDPOINTS):
+    """URL names in core/urls.py that have no benchmark endpoint"""
+    covered = {endpoint.url_name for endpoint in endpoints}
+    return sorted(set(iter_url_names()) - covered)
+
+
+def duplicate_keys(endpoints=ENDPOINTS):
+    """Endpoint keys used more than once; their measurements would overwrite each other"""
+    counts = Counter(endpoint.key for endpoint in endpoints)
+    return sorted(key for key, count in counts.items() if count > 1)
+
+
+def seed_dataset(size):
+    """Create a dataset with ``size`` rows in every main table and return the fixtures used by ENDPOINTS"""
+    now = timezone.now()
+    # Rolled back datasets reuse primary keys, so cached reads of the previous size would leak in
+    cache.clear()
+    admin = User.objects.create_user('bench_admin', email='bench_admin@example.com', password=PASSWORD, role='admin',
+                                     is_staff=True)
+    owner = User.objects.create_user('bench_owner', email='bench_owner@example.com', password=PASSWORD, role='user')
+
+    truck_types = [choice for choice, _ in Truck.TRUCK_TYPE_CHOICES]
+    trucks = Truck.objects.bulk_create([
+        Truck(
+            user=owner,
+            truck_type=truck_types[i % len(truck_types)],
+            capacity=Decimal('10.00') + i % 15,
+            registration_number=f'BN{i:08d}',
+            make_model='Tata 407',
+            year=2015 + i % 9,
+        )
+        for i in range(size + 2)
+    ], batch_size=BULK_BATCH_SIZE)
+    bid_truck, spare_truck = trucks[-2], trucks[-1]
+
+    route = gazetteer.requirement_coordinates('Delhi, India', 'Mumbai, India')
+
+    def make_requirement(i, status, bid_amount=None):
+        return Requirement(
+            admin=admin,
+            title=f'Transport load {i} from Delhi to Mumbai',
+            description='Benchmark requirement',
+            load_type='other',
+            weight=Decimal('5.00') + i % 10,
+            truck_type=truck_types[i % len(truck_types)],
+            from_location='Delhi, India',
+            to_location='Mumbai, India',
+            pickup_date=now + timedelta(days=5, minutes=i),
+            delivery_date=now + timedelta(days=7, minutes=i),
+            bidding_end_date=now + timedelta(days=3),
+            budget_min=Decimal('10000.00'),
+            budget_max=Decimal('30000.00'),
+            status=status,
+            pending_bids_count=1 if bid_amount is not None else 0,
+            lowest_bid_amount=bid_amount,
+            highest_bid_amount=bid_amount,
+            last_bid_at=now,
+            **route,
+        )
+
+    open_requirements = Requirement.objects.bulk_create(
+        [make_requirement(i, 'open', Decimal('15000.00') + i) for i in range(size)], batch_size=BULK_BATCH_SIZE
+    )
+    assigned_requirements = Requirement.objects.bulk_create(
+        [make_requirement(size + i, 'assigned') for i in range(size)], batch_size=BULK_BATCH_SIZE
+    )
+    fresh_requirement = make_requirement(2 * size, 'open')
+    fresh_requirement.last_bid_at = None
+    fresh_requirement.save()
+
+    open_bids = Bid.objects.bulk_create([
+        Bid(requirement=requirement, user=owner, truck=trucks[i], amount=Decimal('15000.00') + i,
+            estimated_delivery_time=timedelta(days=2))
+        for i, requirement in enumerate(open_requirements)
+    ], batch_size=BULK_BATCH_SIZE)
+    accepted_bids = Bid.objects.bulk_create([
+        Bid(requirement=requirement, user=owner, truck=trucks[i], amount=Decimal('20000.00') + i,
+            estimated_delivery_time=timedelta(days=2), status='accepted')
+        for i, requirement in enumerate(assigned_requirements)
+    ], batch_size=BULK_BATCH_SIZE)
+
+    order_statuses = ['on_the_way', 'completed', 'confirmed', 'delivered']
+    orders = Order.objects.bulk_create([
+        Order(requirement=requirement, user=owner, truck=trucks[i], accepted_bid=bid,
+              order_number=f'ORD-B{i:08d}', status=order_statuses[i % len(order_statuses)],
+              rating=(i % 5) + 1 if order_statuses[i % len(order_statuses)] == 'completed' else None)
+        for i, (requirement, bid) in enumerate(zip(assigned_requirements, accepted_bids))
+    ], batch_size=BULK_BATCH_SIZE)
+    tracked_order = orders[0]
+
+    start = now - timedelta(seconds=size)
+    locations = Location.objects.bulk_create([
+        Location(order=tracked_order, timestamp=start + timedelta(seconds=i),
+                 latitude=Decimal('28.6139000') - Decimal(i) / 100000,
+                 longitude=Decimal('77.2090000') - Decimal(i) / 100000,
+                 speed=Decimal('55.00'), heading=Decimal('200.00'), accuracy=Decimal('10.00'))
+        for i in range(size)
+    ], batch_size=BULK_BATCH_SIZE)
+    with transaction.atomic():
+        # bulk_create bypasses the ingestion paths that keep the track summary
+        tracks.refresh_track_stats(tracked_order.id)
+
+    # bulk_create bypasses the views that maintain the rollups
+    rollups.rebuild_rollups()
+    matching.rebuild_truck_matches()
+
+    notifications = Notification.objects.bulk_create([
+        Notification(user=admin, title=f'Bid placed {i}', message='A new bid was placed',
+                     notification_type='bid_placed', is_read=bool(i % 2))
+        for i in range(size)
+    ], batch_size=BULK_BATCH_SIZE)
+
+    owner_refresh = RefreshToken.for_user(owner)
+    return {
+        'now': now,
+        'admin': admin,
+        'owner': owner,
+        'truck': trucks[0],
+        'bid_truck': bid_truck,
+        'spare_truck': spare_truck,
+        'open_requirement': open_requirements[0],
+        'fresh_requirement': fresh_requirement,
+        'open_bid': open_bids[0],
+        'tracked_order': tracked_order,
+        'location': locations[-1],
+        'notification': notifications[0],
+        'owner_refresh': str(owner_refresh),
+        'owner_access': str(owner_refresh.access_token),
+    }
+
+
+def _client_for(role, ctx):
+    client = APIClient()
+    if role == 'admin':
+        user = ctx['admin']
+    elif role == 'user':
+        user = ctx['owner']
+    else:
+        return client
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _call(client, endpoint, ctx):
+    url = reverse(endpoint.url_name, kwargs=endpoint.kwargs(ctx))
+    if endpoint.query:
+        url = f'{url}?{endpoint.query}'
+    data = endpoint.data(ctx)
+    request = getattr(client, endpoint.method.lower())
+    if endpoint.method == 'GET':
+        return request(url)
+    return request(url, data, format='json')
+
+
+def measure_endpoint(endpoint, ctx, size, repeat):
+    """Call ``endpoint`` ``repeat`` times and return its EndpointResult.
+
+    Mutating calls run inside a transaction that is rolled back, so every
+    iteration sees the same dataset.
+    """
+    client = _client_for(endpoint.role, ctx)
+    samples = []
+    queries = 0
+    response = None
+
+    for _ in range(repeat + 1):  # first call warms up caches and is not timed
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = _call(client, endpoint, ctx)
+                elapsed = (time.perf_counter() - started) * 1000
+            if endpoint.mutating:
+                transaction.set_rollback(True)
+        if response.status_code not in endpoint.expected_status:
+            raise AssertionError(
+                f'{endpoint.key} returned {response.status_code}: {response.content[:500]!r}'
+            )
+        samples.append(elapsed)
+        queries = max(queries, len(captured))
+
+    samples = samples[1:]
+    return EndpointResult(
+        key=endpoint.key,
+        size=size,
+        status_code=response.status_code,
+        queries=queries,
+        p50_ms=statistics.median(samples),
+        p99_ms=_percentile(samples, 0.99),
+        response_bytes=len(response.content),
+        samples_ms=samples,
+    )
+
+
+def run_benchmarks(sizes, repeat=10, endpoints=ENDPOINTS, log=None):
+    """Seed each dataset size in turn and measure every endpoint against it.
+
+    Must run against a disposable database: every size is seeded inside a
+    transaction that is rolled back afterwards.
+    """
+    results = []
+    for size in sizes:
+        with transaction.atomic():
+            if log:
+                log(f'Seeding dataset with {size} rows per table...')
+            ctx = seed_dataset(size)
+            for endpoint in endpoints:
+                result = measure_endpoint(endpoint, ctx, size, repeat)
+                results.append(result)
+                if log:
+                    log(f'  {result.key:<70} {result.queries:>4} queries  '
+                        f'p50 {result.p50_ms:8.2f}ms  p99 {result.p99_ms:8.2f}ms  {result.response_bytes:>9} bytes')
+            transaction.set_rollback(True)
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+
+def build_baseline(results, vendor, existing=None):
+    """Return ``existing`` with the max query count per endpoint for ``vendor`` replaced"""
+    baseline = dict(existing or {})
+    counts = {}
+    for result in results:
+        counts[result.key] = max(counts.get(result.key, 0), result.queries)
+    baseline[vendor] = dict(sorted(counts.items()))
+    return baseline
+
+
+def find_regressions(results, baseline_counts):
+    """Return a list of human readable query-count regressions"""
+    problems = []
+    by_key = {}
+    for result in results:
+        by_key.setdefault(result.key, []).append(result)
+
+    for key, key_results in by_key.items():
+        key_results.sort(key=lambda r: r.size)
+        smallest = key_results[0]
+        for result in key_results[1:]:
+            if result.queries > smallest.queries:
+                problems.append(
+                    f'{key}: query count grows with dataset size '
+                    f'({smallest.queries} at {smallest.size} rows, {result.queries} at {result.size} rows)'
+                )
+        allowed = baseline_counts.get(key)
+        worst = max(r.queries for r in key_results)
+        if allowed is not None and worst > allowed:
+            problems.append(f'{key}: {worst} queries exceeds baseline of {allowed}')
+    return problems
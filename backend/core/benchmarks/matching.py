@@ -0,0 +1,124 @@
+"""Vectorized truck matching against a brute-force scorer.
+
+A synthetic fleet is built in memory, so no database is involved. The
+brute-force scorer computes the same formula one truck at a time in plain
+Python; both must pick the same trucks.
+"""
+import math
+import time
+
+import numpy as np
+
+from core import matching
+from core.geo import EARTH_RADIUS_M
+
+# Roughly the mainland
+LATITUDES = (8.0, 32.0)
+LONGITUDES = (69.0, 89.0)
+
+
+def synthetic_fleet(trucks, seed=0):
+    """Fleet of ``trucks`` random trucks; one in ten has no known position"""
+    rng = np.random.default_rng(seed)
+    latitudes = rng.uniform(*LATITUDES, trucks)
+    longitudes = rng.uniform(*LONGITUDES, trucks)
+    unknown = rng.random(trucks) < 0.1
+    latitudes[unknown] = longitudes[unknown] = np.nan
+    return matching.Fleet(
+        truck_ids=np.arange(1, trucks + 1, dtype=np.int64),
+        owner_ids=rng.integers(1, max(trucks // 3, 2), trucks),
+        sizes=rng.integers(0, len(matching.TRUCK_SIZES), trucks),
+        capacities=np.round(rng.uniform(1, 40, trucks), 2),
+        latitudes=latitudes,
+        longitudes=longitudes,
+        ratings=rng.uniform(0.4, 1.0, trucks),
+        on_time=rng.uniform(0.5, 1.0, trucks),
+    )
+
+
+def synthetic_requirements(count, seed=1):
+    """Truck size index, weight and pickup position arrays of ``count`` random requirements"""
+    rng = np.random.default_rng(seed)
+    return (
+        rng.integers(0, len(matching.TRUCK_SIZES), count),
+        np.round(rng.uniform(0.5, 30, count), 2),
+        rng.uniform(*LATITUDES, count),
+        rng.uniform(*LONGITUDES, count),
+    )
+
+
+def brute_force_top(fleet, size, weight, latitude, longitude, limit):
+    """Truck ids of the best ``limit`` trucks, scoring one truck at a time"""
+    weights = matching.WEIGHTS
+    scored = []
+    for i in range(len(fleet)):
+        steps = int(fleet.sizes[i]) - size
+        capacity = float(fleet.capacities[i])
+        if steps < 0 or capacity < weight or capacity <= 0:
+            continue
+        truck_latitude, truck_longitude = float(fleet.latitudes[i]), float(fleet.longitudes[i])
+        if math.isnan(truck_latitude) or math.isnan(latitude):
+            distance_score = 0.0
+        else:
+            phi1, phi2 = math.radians(latitude), math.radians(truck_latitude)
+            a = (math.sin((phi2 - phi1) / 2) ** 2 +
+                 math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(truck_longitude - longitude) / 2) ** 2)
+            km = 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(max(a, 0.0), 1.0))) / 1000
+            distance_score = math.exp(-km / matching.DISTANCE_SCALE_KM)
+        total = (
+            weights['type'] * max(1 - matching.TYPE_STEP_PENALTY * steps, matching.MIN_TYPE_SCORE) +
+            weights['capacity'] * weight / capacity +
+            weights['distance'] * distance_score +
+            weights['rating'] * float(fleet.ratings[i]) +
+            weights['on_time'] * float(fleet.on_time[i])
+        )
+        scored.append((-total, int(fleet.truck_ids[i])))
+    scored.sort()
+    return [truck_id for _, truck_id in scored[:limit]]
+
+
+def run_benchmark(trucks, requirements, limit, repeat):
+    """Time vectorized and brute-force matching of ``requirements`` requirements against ``trucks`` trucks"""
+    fleet = synthetic_fleet(trucks)
+    sizes, weights, latitudes, longitudes = synthetic_requirements(requirements)
+
+    def vectorized():
+        results = []
+        for i in range(requirements):
+            scores, _, _ = matching.score(fleet, sizes[i:i + 1], weights[i:i + 1], latitudes[i:i + 1], longitudes[i:i + 1])
+            results.append(fleet.truck_ids[matching.top(scores[0], fleet.truck_ids, limit)].tolist())
+        return results
+
+    def blocked():
+        block = max(1, matching.BLOCK_CELLS // trucks)
+        for start in range(0, requirements, block):
+            end = start + block
+            matching.score(fleet, sizes[start:end], weights[start:end], latitudes[start:end], longitudes[start:end])
+
+    timings = {}
+    for name, function in (('vectorized', vectorized), ('blocked', blocked)):
+        best = math.inf
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            best = min(best, time.perf_counter() - started)
+        timings[name] = best * 1000
+        if name == 'vectorized':
+            vectorized_result = result
+
+    started = time.perf_counter()
+    brute_result = [
+        brute_force_top(fleet, int(sizes[i]), float(weights[i]), float(latitudes[i]), float(longitudes[i]), limit)
+        for i in range(requirements)
+    ]
+    timings['brute_force'] = (time.perf_counter() - started) * 1000
+
+    return {
+        'trucks': trucks,
+        'requirements': requirements,
+        'same_results': vectorized_result == brute_result,
+        'vectorized_ms': timings['vectorized'],
+        'blocked_ms': timings['blocked'],
+        'brute_force_ms': timings['brute_force'],
+        'speedup': timings['brute_force'] / timings['vectorized'],
+    }
@@ -0,0 +1,107 @@
+"""Storage and read-time benchmark for packed location history.
+
+A synthetic trip is written as Location rows, measured, packed into
+LocationSegment rows with core.tracks and measured again.
+"""
+import math
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core import tracks
+from core.models import User, Truck, Requirement, Bid, Order, Location
+
+
+def table_bytes(table):
+    """On-disk size of a table including its indexes, or None if the backend can't tell"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+            return cursor.fetchone()[0]
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN "
+                "(SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                [table],
+            )
+            return cursor.fetchone()[0]
+    return None
+
+
+def seed_trip(fixes, interval_seconds=5):
+    """Create an order with a synthetic ``fixes`` point trip and return it"""
+    now = timezone.now()
+    admin = User.objects.create_user('track_bench_admin', role='admin')
+    owner = User.objects.create_user('track_bench_owner', role='user')
+    truck = Truck.objects.create(
+        user=owner, truck_type='large', capacity=Decimal('20.00'),
+        registration_number='TRACKBENCH01', make_model='Tata 407', year=2020,
+    )
+    requirement = Requirement.objects.create(
+        admin=admin, title='Track benchmark', load_type='other', weight=Decimal('10.00'),
+        truck_type='large', from_location='Delhi, India', to_location='Mumbai, India',
+        pickup_date=now, delivery_date=now + timedelta(days=2), bidding_end_date=now, status='assigned',
+    )
+    bid = Bid.objects.create(
+        requirement=requirement, user=owner, truck=truck, amount=Decimal('20000.00'),
+        estimated_delivery_time=timedelta(days=2), status='accepted',
+    )
+    order = Order.objects.create(requirement=requirement, user=owner, truck=truck, accepted_bid=bid, status='on_the_way')
+
+    start = now - timedelta(seconds=fixes * interval_seconds)
+    latitude, longitude, heading = 28.6139, 77.2090, 200.0
+    locations = []
+    for i in range(fixes):
+        heading = (heading + math.sin(i / 50.0) * 3) % 360
+        speed = 55 + 15 * math.sin(i / 120.0)
+        step = speed / 3600 * interval_seconds / 111.0
+        latitude += step * math.cos(math.radians(heading))
+        longitude += step * math.sin(math.radians(heading))
+        locations.append(Location(
+            order=order,
+            timestamp=start + timedelta(seconds=i * interval_seconds),
+            latitude=Decimal(f'{latitude:.7f}'),
+            longitude=Decimal(f'{longitude:.7f}'),
+            speed=Decimal(f'{speed:.2f}'),
+            heading=Decimal(f'{heading:.2f}'),
+            accuracy=Decimal('8.00'),
+        ))
+    Location.objects.bulk_create(locations, batch_size=2000)
+    return order
+
+
+def _time_full_read(order, repeat):
+    samples = []
+    count = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = sum(1 for _ in tracks.order_track(order))
+        samples.append((time.perf_counter() - started) * 1000)
+    return min(samples), count
+
+
+def run_benchmark(fixes, repeat=3, segment_size=1000):
+    """Return storage and full-history read measurements before and after packing"""
+    order = seed_trip(fixes)
+    rows_bytes = table_bytes(Location._meta.db_table)
+    rows_ms, rows_count = _time_full_read(order, repeat)
+
+    with override_settings(LOCATION_PACKING_ENABLED=True):
+        tracks.pack_order(order.pk, timezone.now() + timedelta(seconds=1), segment_size)
+        packed_bytes = table_bytes(tracks.LocationSegment._meta.db_table)
+        packed_ms, packed_count = _time_full_read(order, repeat)
+
+    return {
+        'fixes': fixes,
+        'rows_bytes': rows_bytes,
+        'packed_bytes': packed_bytes,
+        'storage_ratio': rows_bytes / packed_bytes if rows_bytes and packed_bytes else None,
+        'rows_read_ms': rows_ms,
+        'packed_read_ms': packed_ms,
+        'read_ratio': rows_ms / packed_ms if packed_ms else None,
+        'fixes_read': (rows_count, packed_count),
+    }
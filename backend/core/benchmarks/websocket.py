@@ -0,0 +1,75 @@
+"""Frame size and encode cost of tracking location updates, JSON against the binary subprotocol.
+
+Every subscribed TrackingConsumer serializes the JSON message itself, so a
+broadcast to N JSON subscribers costs N encodes of the same event. The
+binary frame is packed once per broadcast by core.broadcasts and sent as is
+by every binary subscriber. The benchmark replays both for a realistic
+serialized fix, alone and with held-back points, through the same encoding
+paths.
+"""
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from core.consumers import pack_location_update
+from core.models import Order, Location
+from core.serializers import LocationSerializer
+
+
+def sample_update(points):
+    """A location_update event as the channel layer delivers it, with ``points`` held-back fixes"""
+    order = Order(id=123456, order_number='ORD-1A2B3C4D')
+    now = timezone.now()
+    fixes = [
+        dict(LocationSerializer(Location(
+            id=987654321 + i, order=order, latitude=Decimal('19.0760000') + Decimal(i) / 10000,
+            longitude=Decimal('72.8777000') + Decimal(i) / 10000, speed=Decimal('61.50'),
+            heading=Decimal('45.00'), altitude=Decimal('14.20'), accuracy=Decimal('4.80'),
+            timestamp=now + timedelta(seconds=i),
+        )).data)
+        for i in range(points + 1)
+    ]
+    held = [[fix['latitude'], fix['longitude'], fix['timestamp']] for fix in fixes[:-1]]
+    return fixes[-1], held
+
+
+def encode_json(data, points):
+    message = {'type': 'location_update', 'data': data}
+    if points:
+        message['points'] = points
+    return json.dumps(message).encode()
+
+
+def encode_binary(data, points):
+    return pack_location_update(data, points)
+
+
+# (name, encoder, encoded by every subscriber rather than once per broadcast)
+ENCODINGS = (('json', encode_json, True), ('binary', encode_binary, False))
+
+
+def run_benchmark(subscribers, points_options=(0, 4)):
+    """Bytes per update and encode time per message for each encoding and number of held-back points"""
+    results = []
+    for points in points_options:
+        data, held = sample_update(points)
+        for name, encode, per_subscriber in ENCODINGS:
+            # A fresh copy per encode, as each consumer gets its own event from the channel layer
+            encodes = subscribers if per_subscriber else 1
+            events = [(dict(data), [list(point) for point in held]) for _ in range(encodes)]
+            started = time.perf_counter()
+            frames = [encode(*event) for event in events]
+            elapsed = time.perf_counter() - started
+            size = len(frames[0]) * subscribers
+            results.append({
+                'encoding': name,
+                'points': points,
+                'bytes_per_update': size // subscribers,
+                'encode_us': elapsed / subscribers * 1e6,
+                'broadcast_bytes': size,
+                'broadcast_seconds': elapsed,
+            })
+    return results
@@ -0,0 +1,141 @@
+"""Latest-wins throttling of location broadcasts, per tracking group.
+
+Location fixes reach ``tracking_<order pk>`` from the WebSocket write
+buffer and from REST uploads. Every ``group_send`` goes through the
+channel layer to every viewer of the order, so the throttling happens
+here, before the send, rather than in each viewer's consumer: one
+coalesced message per group per LOCATION_BROADCAST_INTERVAL_MS however
+many sockets watch the order. Its binary frame is packed here too, once,
+rather than by every consumer on the ``trucking.track`` subprotocol.
+
+State is per process. daphne runs sync views in threads whose
+``async_to_sync`` calls land on the server's event loop, so REST and
+WebSocket producers in one process share a throttle per group. Outside
+the server (tests, management commands) every ``async_to_sync`` call gets
+its own short-lived loop, and each update is simply sent at once.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .consumers import pack_location_update
+
+logger = logging.getLogger(__name__)
+
+
+def _fix_time(data):
+    return parse_datetime(data.get('timestamp') or '') or datetime.min.replace(tzinfo=dt_timezone.utc)
+
+
+class LatestWins:
+    """Throttles one stream of location updates to one per ``interval`` seconds.
+
+    An update arriving after a quiet interval is sent at once. Updates
+    arriving sooner are held, and only the newest by timestamp is sent when
+    the interval has passed. Up to ``max_points`` of the held-back fixes
+    go with it as compact ``[latitude, longitude, timestamp]`` points,
+    oldest first.
+    """
+
+    def __init__(self, interval, send, max_points=0):
+        self.interval = interval
+        self.max_points = max_points
+        self._send = send
+        self._latest = None
+        self._points = []
+        self._last_sent = None
+        self._task = None
+
+    @property
+    def idle(self):
+        """True when nothing is held and the next update would be sent at once"""
+        return self._task is None and (
+            self._last_sent is None or time.monotonic() - self._last_sent >= self.interval
+        )
+
+    async def push(self, data):
+        now = time.monotonic()
+        if self._task is None and (self._last_sent is None or now - self._last_sent >= self.interval):
+            self._last_sent = now
+            await self._send(data, [])
+            return
+
+        if self._latest is not None and _fix_time(data) < _fix_time(self._latest):
+            self._hold(data)
+            return
+        if self._latest is not None:
+            self._hold(self._latest)
+        self._latest = data
+        if self._task is None:
+            delay = self.interval - (now - self._last_sent)
+            self._task = asyncio.get_running_loop().create_task(self._send_later(delay))
+
+    def _hold(self, data):
+        if self.max_points:
+            self._points.append([data.get('latitude'), data.get('longitude'), data.get('timestamp')])
+            self._points.sort(key=lambda point: point[2] or '')
+            del self._points[:-self.max_points]
+
+    async def _send_later(self, delay):
+        await asyncio.sleep(delay)
+        data, points = self._latest, self._points
+        self._latest, self._points, self._task = None, [], None
+        self._last_sent = time.monotonic()
+        try:
+            await self._send(data, points)
+        except Exception:
+            logger.exception('Failed to send a coalesced location update')
+
+
+class GroupBroadcaster:
+    """One LatestWins per tracking group, sending through the channel layer"""
+
+    def __init__(self, interval_ms, max_points, max_groups=10000):
+        self.interval = interval_ms / 1000
+        self.max_points = max_points
+        self.max_groups = max_groups
+        self._groups = {}
+        self._loop = None
+
+    async def push(self, group, data):
+        """Broadcast a location_update to ``group``, coalesced with its recent updates"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Held updates belong to another, possibly closed, loop; start over on this one
+            self._groups = {}
+            self._loop = loop
+        throttle = self._groups.get(group)
+        if throttle is None:
+            if len(self._groups) >= self.max_groups:
+                self._groups = {name: entry for name, entry in self._groups.items() if not entry.idle}
+            throttle = self._groups[group] = LatestWins(
+                self.interval, lambda data, points: self._send(group, data, points), self.max_points
+            )
+        await throttle.push(data)
+
+    async def _send(self, group, data, points):
+        # Sockets on the binary subprotocol all send this frame as is
+        message = {'type': 'location_update', 'data': data, 'frame': pack_location_update(data, points)}
+        if points:
+            message['points'] = points
+        await get_channel_layer().group_send(group, message)
+
+
+_broadcaster = None
+
+
+def get_broadcaster():
+    """The process-wide broadcaster, created from settings on first use"""
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = GroupBroadcaster(settings.LOCATION_BROADCAST_INTERVAL_MS, settings.LOCATION_BROADCAST_MAX_POINTS)
+    return _broadcaster
+
+
+async def broadcast_location(group, data):
+    await get_broadcaster().push(group, data)
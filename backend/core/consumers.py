@@ -1,21 +1,137 @@
+import asyncio
 import json
 import logging
+import time
+from types import SimpleNamespace
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .tracks import FIX_FIELDS, MAX_FIX_BYTES, decode_fixes, encode_fixes
 
 logger = logging.getLogger(__name__)
 
+
+class SnapshotCache:
+    """Per-process TTL cache of serialized ``initial_data`` messages.
+
+    Sockets opening the same order within ``ttl`` seconds share one snapshot,
+    and concurrent misses wait for the build already in flight instead of
+    starting their own.
+    """
+
+    def __init__(self, ttl, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._pending = {}
+
+    async def get(self, key, build):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(key)
+        if pending is not None and pending.get_loop() is loop:
+            return await asyncio.shield(pending)
+
+        future = self._pending[key] = loop.create_future()
+        try:
+            value = await build()
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Only waiters care about the error; don't log it as unretrieved
+            future.exception()
+            raise
+        else:
+            self._store(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def _store(self, key, value):
+        now = time.monotonic()
+        if len(self._entries) >= self.max_entries:
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+        self._entries[key] = (now + self.ttl, value)
+
+    def clear(self):
+        self._entries.clear()
+
+
+tracking_snapshots = SnapshotCache(settings.TRACKING_SNAPSHOT_TTL_SECONDS)
+
+
+BINARY_SUBPROTOCOL = 'trucking.track'
+
+# First byte of every binary frame. The packed fixes after it start with their own format version.
+LOCATION_UPDATE_FRAME = 0x01  # Sent: a location_update
+UPDATE_LOCATION_FRAME = 0x02  # Received: fixes to store, like an update_location message
+
+
+def pack_location_update(data, points=()):
+    """A location_update as a binary frame: LOCATION_UPDATE_FRAME, then fixes packed by core.tracks.encode_fixes.
+
+    The held-back ``points`` come first and the newest fix last. Only the
+    fix fields travel: no id, order number or address. A fix without a
+    usable timestamp is given the time it was packed.
+    """
+    received = timezone.now()
+    fixes = [
+        SimpleNamespace(
+            timestamp=_parse_timestamp(timestamp, received), latitude=latitude, longitude=longitude,
+            **dict.fromkeys(FIX_FIELDS[3:]),
+        )
+        for latitude, longitude, timestamp in points
+    ]
+    fixes.append(SimpleNamespace(
+        timestamp=_parse_timestamp(data.get('timestamp'), received),
+        **{name: data.get(name) for name in FIX_FIELDS[1:]},
+    ))
+    return bytes([LOCATION_UPDATE_FRAME]) + encode_fixes(fixes)
+
+
+def unpack_update_location(frame):
+    """Fix dicts of an UPDATE_LOCATION_FRAME, as in an update_location message.
+
+    Raises ValueError for any other or malformed frame.
+    """
+    max_fixes = settings.LOCATION_BATCH_MAX_FIXES
+    if frame[:1] != bytes([UPDATE_LOCATION_FRAME]):
+        raise ValueError('Unsupported frame type')
+    # Type, version and count bytes plus the largest possible encoding of every fix
+    if len(frame) > 12 + max_fixes * MAX_FIX_BYTES:
+        raise ValueError('Frame too large')
+    try:
+        fixes = decode_fixes(frame[1:], max_fixes=max_fixes)
+    except (IndexError, OverflowError) as exc:
+        raise ValueError(str(exc))
+    return [dict(zip(FIX_FIELDS, fix)) for fix in fixes]
+
+
+def _parse_timestamp(value, default):
+    try:
+        parsed = parse_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if parsed is None:
+        return default
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
 class TrackingConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer for real-time location tracking"""
 
     async def connect(self):
         """Handle WebSocket connection"""
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-
         self.order_id = self.scope['url_route']['kwargs']['order_id']
-        self.room_group_name = f'tracking_{self.order_id}'
 
         print(f"=== WebSocket Connection Attempt ===")
         print(f"Order ID: {self.order_id}")
@@ -30,8 +146,9 @@ class TrackingConsumer(AsyncWebsocketConsumer):
             # await self.close()
             # return
 
-        # Check if user can access this order
-        can_access = await self.check_order_access(user, self.order_id)
+        # Resolve the order once; every later read on this connection uses it
+        self.order = await self.resolve_order(self.order_id)
+        can_access = self.can_access_order(user, self.order)
         print(f"Can access order: {can_access}")
 
         if not can_access:
@@ -39,13 +156,23 @@ class TrackingConsumer(AsyncWebsocketConsumer):
             # await self.close()
             # return
 
+        # Broadcasts are sent to the order's primary key, whichever id the client used
+        if self.order is not None:
+            self.order_pk = self.order.pk
+            self.room_group_name = f'tracking_{self.order_pk}'
+        else:
+            self.order_pk = None
+            self.room_group_name = f'tracking_{self.order_id}'
+
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
-        await self.accept()
+        # Clients offering the binary subprotocol get location updates as packed binary frames
+        self.binary = BINARY_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        await self.accept(subprotocol=BINARY_SUBPROTOCOL if self.binary else None)
         print("✅ WebSocket connection accepted")
 
         # Send initial location data
@@ -61,8 +188,11 @@ class TrackingConsumer(AsyncWebsocketConsumer):
         )
         logger.info(f"Disconnected from tracking for order {self.order_id}")
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle messages received from WebSocket"""
+        if bytes_data is not None:
+            await self.receive_frame(bytes_data)
+            return
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
@@ -70,7 +200,7 @@ class TrackingConsumer(AsyncWebsocketConsumer):
             if message_type == 'ping':
                 await self.send(text_data=json.dumps({'type': 'pong'}))
             elif message_type == 'get_locations':
-                await self.send_locations()
+                await self.send_locations(data.get('simplify'))
             elif message_type == 'update_location':
                 await self.handle_location_update(data)
 
@@ -86,117 +216,103 @@ class TrackingConsumer(AsyncWebsocketConsumer):
                 'message': 'Internal server error'
             }))
 
+    async def receive_frame(self, frame):
+        """Store the fixes of a binary UPDATE_LOCATION_FRAME"""
+        try:
+            fixes = unpack_update_location(frame)
+        except ValueError as exc:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Invalid binary frame: {exc}'
+            }))
+            return
+        await self.handle_location_update({'data': fixes})
+
     async def location_update(self, event):
-        """Send location update to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'location_update',
-            'data': event['data']
-        }))
+        """Send location update to WebSocket; already coalesced per group by core.broadcasts"""
+        data, points = event['data'], event.get('points', [])
+        if self.binary:
+            # core.broadcasts packs the frame once for every socket in the group
+            await self.send(bytes_data=event.get('frame') or pack_location_update(data, points))
+            return
+        message = {'type': 'location_update', 'data': data}
+        if points:
+            message['points'] = points
+        await self.send(text_data=json.dumps(message))
 
     async def order_status_update(self, event):
-        """Send order status update to WebSocket"""
+        """Send order status update to WebSocket; never held back like location updates"""
         await self.send(text_data=json.dumps({
             'type': 'order_status_update',
             'data': event['data']
         }))
 
     @database_sync_to_async
-    def check_order_access(self, user, order_id):
-        """Check if user has permission to access this order"""
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        from .models import Order
+    def resolve_order(self, order_id):
+        """Order for an id or order number from the URL, with what the snapshot needs, or None.
 
-        print(f"Checking access for order_id: {order_id}, type: {type(order_id)}")
+        An all-digit value is tried as an id first, then as an order number.
+        """
+        from .models import Order
+        orders = Order.objects.select_related('requirement', 'truck')
+        order = orders.filter(id=int(order_id)).first() if str(order_id).isdigit() else None
+        return order or orders.filter(order_number=order_id).first()
 
-        try:
-            # Try to get order by ID first
-            try:
-                order = Order.objects.get(id=int(order_id))
-                print(f"Found order by ID: {order.order_number}")
-            except (ValueError, Order.DoesNotExist):
-                # Try to get order by order_number
-                order = Order.objects.get(order_number=order_id)
-                print(f"Found order by order_number: {order.order_number}")
-
-            # Check if user is authenticated and has access
-            if not user.is_authenticated:
-                print("User not authenticated, allowing access for testing")
-                return True  # Allow access for testing
-
-            can_access = user.is_admin or order.user == user
-            print(f"User {user.username} can access: {can_access}")
-            return can_access
-        except ObjectDoesNotExist:
-            print(f"Order not found: {order_id}")
+    def can_access_order(self, user, order):
+        """Check if user has permission to access this order"""
+        if order is None:
+            print(f"Order not found: {self.order_id}")
             return False
 
+        # Check if user is authenticated and has access
+        if not user.is_authenticated:
+            print("User not authenticated, allowing access for testing")
+            return True  # Allow access for testing
+
+        can_access = user.is_admin or order.user_id == user.id
+        print(f"User {user.username} can access: {can_access}")
+        return can_access
+
     @database_sync_to_async
-    def get_order(self):
-        """Get order details"""
-        from .models import Order
+    def get_recent_locations(self, limit=50):
+        """Get recent location history"""
+        from .serializers import LocationSerializer
+        from .tracks import recent_locations
         try:
-            # Try to get order by ID first
-            try:
-                return Order.objects.select_related('requirement', 'truck', 'user').get(id=int(self.order_id))
-            except (ValueError, Order.DoesNotExist):
-                # Try to get order by order_number
-                return Order.objects.select_related('requirement', 'truck', 'user').get(order_number=self.order_id)
-        except Order.DoesNotExist:
-            return None
+            # The related manager hands every fix the connection's order, so
+            # order_number is not loaded once per row
+            return LocationSerializer(recent_locations(self.order, limit), many=True).data
+        except Exception as e:
+            logger.error(f"Error getting recent locations: {str(e)}")
+            return []
 
     @database_sync_to_async
     def get_current_location(self):
-        """Get current location for the order"""
-        from .models import Location, Order
-        from .serializers import LocationSerializer
+        """Newest fix from the order's copy; a missing copy is looked up and stored once"""
+        from .tracks import latest_location_data
         try:
-            # Get order first to get the correct order ID
-            try:
-                order = Order.objects.get(id=int(self.order_id))
-            except (ValueError, Order.DoesNotExist):
-                order = Order.objects.get(order_number=self.order_id)
-
-            location = Location.objects.filter(order=order).first()
-            if location:
-                return LocationSerializer(location).data
-            return None
+            return latest_location_data(self.order)
         except Exception as e:
             logger.error(f"Error getting current location: {str(e)}")
             return None
 
     @database_sync_to_async
-    def get_recent_locations(self, limit=50):
-        """Get recent location history"""
-        from .models import Location, Order
+    def get_simplified_track(self, tolerance):
+        """Get the whole track, simplified to ``tolerance`` meters"""
         from .serializers import LocationSerializer
+        from .tracks import order_track
         try:
-            # Get order first to get the correct order ID
-            try:
-                order = Order.objects.get(id=int(self.order_id))
-            except (ValueError, Order.DoesNotExist):
-                order = Order.objects.get(order_number=self.order_id)
-            
-            locations = Location.objects.filter(order=order).order_by('-timestamp')[:limit]
-            return LocationSerializer(locations, many=True).data
+            return LocationSerializer(order_track(self.order).simplified(tolerance), many=True).data
         except Exception as e:
-            logger.error(f"Error getting recent locations: {str(e)}")
+            logger.error(f"Error getting simplified track: {str(e)}")
             return []
 
-    async def send_initial_data(self):
-        """Send initial data when client connects"""
-        order = await self.get_order()
-        if not order:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': 'Order not found'
-            }))
-            return
-
+    async def build_snapshot(self):
+        """Serialized ``initial_data`` message for the connection's order"""
+        order = self.order
         current_location = await self.get_current_location()
         recent_locations = await self.get_recent_locations()
-
-        await self.send(text_data=json.dumps({
+        return json.dumps({
             'type': 'initial_data',
             'data': {
                 'order': {
@@ -215,19 +331,159 @@ class TrackingConsumer(AsyncWebsocketConsumer):
                 'current_location': current_location,
                 'recent_locations': recent_locations
             }
-        }))
+        })
 
-    async def send_locations(self):
-        """Send recent locations"""
-        recent_locations = await self.get_recent_locations()
+    async def send_initial_data(self):
+        """Send initial data when client connects"""
+        if self.order is None:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Order not found'
+            }))
+            return
+
+        snapshot = await tracking_snapshots.get(self.order_pk, self.build_snapshot)
+        await self.send(text_data=snapshot)
+
+    async def send_locations(self, simplify=None):
+        """Send recent locations, or the whole track simplified to ``simplify`` meters"""
+        from .simplify import parse_tolerance
+        if simplify is None:
+            locations = await self.get_recent_locations()
+        else:
+            try:
+                tolerance = parse_tolerance(simplify)
+            except ValueError as e:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': str(e)
+                }))
+                return
+            locations = await self.get_simplified_track(tolerance)
         await self.send(text_data=json.dumps({
             'type': 'locations',
-            'data': recent_locations
+            'data': locations
         }))
 
+    def get_writable_order(self):
+        """Order this connection may send fixes for, or None.
+
+        Only the truck owner assigned to the order can report its position.
+        """
+        user = self.scope['user']
+        if not user.is_authenticated or not user.is_truck_owner:
+            return None
+        if self.order is None or self.order.user_id != user.id:
+            return None
+        return self.order
+
     async def handle_location_update(self, data):
-        """Handle location update from client (for mobile apps)"""
+        """Buffer fixes sent by the truck owner (mobile apps) for a batched write"""
+        from .location_buffer import ACK_RECEIVED, BufferFull, PendingFix, get_location_buffer
+        from .serializers import LocationBatchSerializer
+
+        message_id = data.get('id')
+        order = self.get_writable_order()
+        if order is None:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'id': message_id,
+                'message': 'Only the assigned truck owner can send location updates'
+            }))
+            return
+
+        fixes = data.get('data')
+        serializer = LocationBatchSerializer(data={'fixes': [fixes] if isinstance(fixes, dict) else fixes})
+        if not serializer.is_valid():
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'id': message_id,
+                'message': 'Invalid location update',
+                'errors': serializer.errors
+            }))
+            return
+
+        buffer = get_location_buffer()
+        group = f'tracking_{order.id}'
+        try:
+            await buffer.add([
+                PendingFix(order=order, fix=fix, group=group, reply_channel=self.channel_name, message_id=message_id)
+                for fix in serializer.validated_data['fixes']
+            ])
+        except BufferFull:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'id': message_id,
+                'message': 'Location buffer is full, retry later'
+            }))
+            return
+
+        if buffer.ack_mode == ACK_RECEIVED:
+            await self.location_ack({'ids': [message_id]})
+
+    async def location_ack(self, event):
+        """Acknowledge buffered fixes to the sending client"""
+        from .location_buffer import get_location_buffer
         await self.send(text_data=json.dumps({
             'type': 'location_update_ack',
-            'message': 'Location update received'
+            'ids': event['ids'],
+            'status': get_location_buffer().ack_mode
+        }))
+
+    async def location_nack(self, event):
+        """Tell the sending client its fixes were not stored and should be resent"""
+        await self.send(text_data=json.dumps({
+            'type': 'location_update_nack',
+            'ids': event['ids'],
+            'message': 'Location update could not be stored, please resend'
         }))
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """Pushes the signed-in user's new notifications and unread count (see core/notifications.py)"""
+
+    async def connect(self):
+        user = self.scope['user']
+        if not user.is_authenticated:
+            await self.close()
+            return
+
+        from .notifications import group_name
+        self.group_name = group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.unread_count({'unread_count': await self.get_unread_count(user.id)})
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Binary frames are not supported'}))
+            return
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Invalid JSON'}))
+            return
+        if isinstance(data, dict) and data.get('type') == 'ping':
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+
+    async def notification_created(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'notification',
+            'data': event['data'],
+            'unread_count': event['unread_count']
+        }))
+
+    async def unread_count(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'unread_count',
+            'unread_count': event['unread_count']
+        }))
+
+    @database_sync_to_async
+    def get_unread_count(self, user_id):
+        from .notifications import unread_counts
+        return unread_counts([user_id])[user_id]
@@ -0,0 +1,115 @@
+"""Dashboard statistics.
+
+Each dashboard is computed with one conditional aggregation per table and
+cached per user for DASHBOARD_STATS_CACHE_TIMEOUT seconds. Writes to bids,
+orders, requirements and trucks drop the cached dashboards of the users they
+affect (see core/signals.py); bulk ``update()`` calls don't send signals and
+must call ``invalidate_dashboards`` themselves.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Q, Sum
+
+from .models import Truck, Requirement, Bid, Order
+
+ADMIN = 'admin'
+TRUCK_OWNER = 'truck_owner'
+DASHBOARDS = (ADMIN, TRUCK_OWNER)
+
+ACTIVE_ORDER_STATUSES = ['pending', 'confirmed', 'pickup_scheduled', 'loaded', 'on_the_way']
+
+HITS_KEY = 'dashboard_stats:hits'
+MISSES_KEY = 'dashboard_stats:misses'
+
+
+def admin_stats(user_id):
+    """Statistics for the requirements an admin posted"""
+    completed = Q(status='completed')
+    orders = Order.objects.filter(requirement__admin_id=user_id).aggregate(
+        active_orders=Count('id', filter=Q(status__in=ACTIVE_ORDER_STATUSES)),
+        completed_orders=Count('id', filter=completed),
+        total_revenue=Sum('accepted_bid__amount', filter=completed),
+    )
+    bids = Bid.objects.filter(requirement__admin_id=user_id).aggregate(
+        total_bids=Count('id'),
+        pending_bids=Count('id', filter=Q(status='pending')),
+    )
+    return {
+        'total_requirements': Requirement.objects.filter(admin_id=user_id).count(),
+        'active_orders': orders['active_orders'],
+        'completed_orders': orders['completed_orders'],
+        'total_bids': bids['total_bids'],
+        'pending_bids': bids['pending_bids'],
+        'total_revenue': orders['total_revenue'] or 0,
+    }
+
+
+def truck_owner_stats(user_id):
+    """Statistics for a truck owner's fleet, orders and bids"""
+    completed = Q(status='completed')
+    orders = Order.objects.filter(user_id=user_id).aggregate(
+        active_orders=Count('id', filter=Q(status__in=ACTIVE_ORDER_STATUSES)),
+        completed_orders=Count('id', filter=completed),
+        total_earnings=Sum('accepted_bid__amount', filter=completed),
+        average_rating=Avg('rating', filter=completed & Q(rating__isnull=False)),
+    )
+    return {
+        'total_trucks': Truck.objects.filter(user_id=user_id, is_active=True).count(),
+        'active_orders': orders['active_orders'],
+        'completed_orders': orders['completed_orders'],
+        'pending_bids': Bid.objects.filter(user_id=user_id, status='pending').count(),
+        'total_earnings': orders['total_earnings'] or 0,
+        'average_rating': orders['average_rating'],
+    }
+
+
+def _serialized(dashboard, user_id):
+    from .serializers import DashboardStatsSerializer, TruckOwnerStatsSerializer
+    if dashboard == ADMIN:
+        return DashboardStatsSerializer(admin_stats(user_id)).data
+    return TruckOwnerStatsSerializer(truck_owner_stats(user_id)).data
+
+
+def _cache_key(dashboard, user_id):
+    return f'dashboard_stats:{dashboard}:{user_id}'
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First count, or the counter was evicted
+        cache.add(key, 1, timeout=None)
+
+
+def get_dashboard(dashboard, user_id, fresh=False):
+    """Serialized statistics of one dashboard, from the cache unless ``fresh``"""
+    key = _cache_key(dashboard, user_id)
+    if not fresh:
+        data = cache.get(key)
+        if data is not None:
+            _count(HITS_KEY)
+            return data
+        _count(MISSES_KEY)
+    data = _serialized(dashboard, user_id)
+    cache.set(key, data, settings.DASHBOARD_STATS_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_dashboards(user_ids):
+    """Drop the cached dashboards of the given users once the transaction commits"""
+    keys = [_cache_key(dashboard, user_id) for user_id in set(user_ids) if user_id for dashboard in DASHBOARDS]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def cache_counters():
+    """Hit and miss counts of the dashboard cache"""
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counters.get(HITS_KEY, 0), counters.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+    }
@@ -0,0 +1,97 @@
+"""``new_requirement`` notifications for the owners of trucks that fit a new requirement.
+
+Creating a requirement only sets its ``fanout_cursor`` to 0, so the POST
+returns at once. ``run_pending_fanouts``, a run_scheduler job, then notifies
+every owner with an active truck of the requirement's type or larger (see
+``matching.carrying_types``) and enough capacity. It walks the owners in
+user id order, ``chunk_size`` at a time through the (truck_type, user)
+index, so memory stays bounded by the chunk whatever the number of
+recipients. Each chunk's notifications are
+bulk-created and the cursor is advanced in the same transaction, so a
+crashed run resumes after the last committed chunk and never notifies an
+owner twice. When no owners are left, or the requirement stops being open,
+the cursor is cleared.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import notifications
+from .matching import carrying_types
+from .models import Requirement, Truck, Notification
+
+logger = logging.getLogger(__name__)
+
+
+def recipients(requirement):
+    """Ids of the owners to notify about ``requirement``, in ascending order"""
+    return (
+        Truck.objects.filter(
+            truck_type__in=carrying_types(requirement.truck_type), capacity__gte=requirement.weight, is_active=True
+        )
+        .exclude(status='inactive')
+        .exclude(user_id=requirement.admin_id)
+        .order_by('user_id')
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+
+
+def build_notification(requirement, user_id):
+    return Notification(
+        user_id=user_id,
+        title='New Load Available',
+        message=(
+            f'{requirement.title}: {requirement.weight} tons from {requirement.from_location} '
+            f'to {requirement.to_location}, pickup {requirement.pickup_date:%d %b %Y}'
+        ),
+        notification_type='new_requirement',
+        requirement=requirement,
+    )
+
+
+def fan_out_chunk(requirement_id, chunk_size):
+    """Notify the next chunk of owners; returns how many, or None when the fan-out is finished"""
+    with transaction.atomic():
+        requirement = (
+            Requirement.objects.select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+            .filter(pk=requirement_id, fanout_cursor__isnull=False)
+            .first()
+        )
+        if requirement is None:
+            return None
+        user_ids = []
+        if requirement.status == 'open' and requirement.is_active:
+            user_ids = list(recipients(requirement).filter(user_id__gt=requirement.fanout_cursor)[:chunk_size])
+        notifications.notify_many([build_notification(requirement, user_id) for user_id in user_ids])
+
+        requirement.fanout_cursor = user_ids[-1] if len(user_ids) == chunk_size else None
+        Requirement.objects.filter(pk=requirement.pk).update(fanout_cursor=requirement.fanout_cursor)
+        return len(user_ids)
+
+
+def fan_out(requirement_id, chunk_size=None):
+    """Finish the fan-out of one requirement; returns (notifications written, seconds taken)"""
+    chunk_size = chunk_size or settings.REQUIREMENT_FANOUT_CHUNK_SIZE
+    started = time.monotonic()
+    written = 0
+    while True:
+        count = fan_out_chunk(requirement_id, chunk_size)
+        if count is None:
+            break
+        written += count
+    elapsed = time.monotonic() - started
+    if written:
+        logger.info(
+            'Notified %d owners about requirement %s in %.2fs (%.0f rows/s)',
+            written, requirement_id, elapsed, written / elapsed if elapsed else 0,
+        )
+    return written, elapsed
+
+
+def run_pending_fanouts(chunk_size=None):
+    """Fan out every requirement with a pending cursor, oldest first; returns notifications written"""
+    pending = Requirement.objects.filter(fanout_cursor__isnull=False).order_by('id').values_list('id', flat=True)
+    return sum(fan_out(requirement_id, chunk_size)[0] for requirement_id in list(pending))
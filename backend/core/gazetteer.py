@@ -0,0 +1,154 @@
+"""Offline geocoding of Indian place names.
+
+core/data/india_places.csv lists cities and towns, and the states with the
+coordinates of their capital. It is loaded once per process into NumPy
+coordinate arrays and a dict from normalized names and aliases to rows.
+
+A location is read as comma separated parts, most specific first, such as
+"Sector 18, Noida, UP". The first part naming a known place wins; a part
+naming a state only picks between places of the same name, and is the answer
+of last resort. A name shared by places in different states, like
+Aurangabad, matches nothing unless a state part picks one of them. Parts
+without an exact name match are matched fuzzily, to absorb misspellings like
+"Ahmedbad".
+"""
+import csv
+import difflib
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from .geo import haversine_m
+
+DATA_FILE = Path(__file__).resolve().parent / 'data' / 'india_places.csv'
+
+CITY = 'city'
+STATE = 'state'
+
+FUZZY_CUTOFF = 0.8
+FUZZY_MIN_LENGTH = 4
+FUZZY_CANDIDATES = 8
+
+Place = namedtuple('Place', 'name state kind latitude longitude')
+
+
+def normalize(text):
+    """Lowercase ASCII words of a place name, so "Gurgaon (HR)" and "gurgaon hr" are the same key"""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+    return ' '.join(re.findall(r'[a-z]+', text))
+
+
+def _trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    def __init__(self, rows):
+        self.places = []
+        self.names = defaultdict(list)  # normalized name or alias -> row numbers, in file order
+        self.states = {}  # normalized state name or alias -> state name
+        for row in rows:
+            place = Place(row['name'], row['state'], row['kind'], float(row['latitude']), float(row['longitude']))
+            number = len(self.places)
+            self.places.append(place)
+            keys = {normalize(place.name)} | {normalize(alias) for alias in row['aliases'].split('|') if alias}
+            for key in keys:
+                self.names[key].append(number)
+            self.states[normalize(place.state)] = place.state
+            if place.kind == STATE:
+                self.states.update((key, place.state) for key in keys)
+
+        self.latitudes = np.array([place.latitude for place in self.places])
+        self.longitudes = np.array([place.longitude for place in self.places])
+        self.cities = np.array([place.kind == CITY for place in self.places])
+
+        self.trigrams = defaultdict(list)
+        for key in self.names:
+            for trigram in _trigrams(key):
+                self.trigrams[trigram].append(key)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline='', encoding='utf-8') as data:
+            return cls(csv.DictReader(data))
+
+    def _pick(self, key, state, allow_state):
+        """The place named ``key``, or None if there is none or ``state`` can't tell them apart"""
+        numbers = [n for n in self.names.get(key, ()) if allow_state or self.places[n].kind == CITY]
+        if len(numbers) > 1 and state:
+            numbers = [n for n in numbers if self.places[n].state == state]
+        return self.places[numbers[0]] if len(numbers) == 1 else None
+
+    def _names_city(self, key):
+        return any(self.places[n].kind == CITY for n in self.names.get(key, ()))
+
+    def _fuzzy_key(self, key):
+        if len(key) < FUZZY_MIN_LENGTH:
+            return None
+        shared = defaultdict(int)
+        for trigram in _trigrams(key):
+            for candidate in self.trigrams.get(trigram, ()):
+                shared[candidate] += 1
+        candidates = sorted(shared, key=shared.get, reverse=True)[:FUZZY_CANDIDATES]
+        scored = [(difflib.SequenceMatcher(None, key, candidate).ratio(), candidate) for candidate in candidates]
+        ratio, best = max(scored, default=(0, None))
+        return best if ratio >= FUZZY_CUTOFF else None
+
+    def geocode(self, text, allow_state=True):
+        """Best matching Place for a free-text location, or None.
+
+        With ``allow_state=False`` a location that only names a state is not
+        matched.
+        """
+        keys = [key for key in (normalize(part) for part in text.split(',')) if key]
+        state = next((self.states[key] for key in reversed(keys[1:]) if key in self.states), None)
+        places = [key for key in keys if key not in self.states or self._names_city(key)]
+
+        for key in places:
+            place = self._pick(key, state, False)
+            if place:
+                return place
+        for key in places:
+            fuzzy_key = self._fuzzy_key(key)
+            place = fuzzy_key and self._pick(fuzzy_key, state, allow_state)
+            if place:
+                return place
+        if allow_state:
+            for key in keys:
+                place = self._pick(key, state, True)
+                if place:
+                    return place
+        return None
+
+    def nearest(self, latitude, longitude):
+        """City closest to the given coordinates, and its distance in meters"""
+        distances = haversine_m(latitude, longitude, self.latitudes, self.longitudes)
+        distances = np.where(self.cities, distances, np.inf)
+        number = int(np.argmin(distances))
+        return self.places[number], float(distances[number])
+
+
+@lru_cache(maxsize=None)
+def get_gazetteer():
+    return Gazetteer.from_csv(DATA_FILE)
+
+
+@lru_cache(maxsize=10000)
+def geocode(text, allow_state=True):
+    """Module level ``Gazetteer.geocode``, memoized per location text"""
+    return get_gazetteer().geocode(text, allow_state)
+
+
+def requirement_coordinates(from_location, to_location):
+    """Pickup and drop coordinates for Requirement fields; None where a location is not a known city"""
+    coordinates = {}
+    for prefix, text in (('from', from_location), ('to', to_location)):
+        place = geocode(text, allow_state=False) if text else None
+        coordinates[f'{prefix}_latitude'] = place.latitude if place else None
+        coordinates[f'{prefix}_longitude'] = place.longitude if place else None
+    return coordinates
@@ -0,0 +1,36 @@
+"""Great-circle distances over NumPy arrays"""
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Distance in meters between points given in degrees; accepts scalars or arrays"""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = np.radians(np.asarray(lng2, dtype=float) - np.asarray(lng1, dtype=float))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def path_length_m(latitudes, longitudes):
+    """Length in meters of the path through the points, in the order given"""
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    if len(latitudes) < 2:
+        return 0.0
+    return float(haversine_m(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:]).sum())
+
+
+def bounding_box(latitude, longitude, radius_m):
+    """(min_lat, max_lat, min_lng, max_lng) of a box containing every point within ``radius_m`` of the given one.
+
+    The box does not wrap around the antimeridian.
+    """
+    angle = radius_m / EARTH_RADIUS_M
+    dlat = np.degrees(angle)
+    min_lat, max_lat = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    if min_lat == -90.0 or max_lat == 90.0 or angle >= np.pi / 2:
+        return float(min_lat), float(max_lat), -180.0, 180.0
+    dlng = np.degrees(np.arcsin(min(np.sin(angle) / np.cos(np.radians(latitude)), 1.0)))
+    return float(min_lat), float(max_lat), float(longitude - dlng), float(longitude + dlng)
@@ -0,0 +1,209 @@
+"""Per-process buffered writer for location fixes received over WebSocket.
+
+TrackingConsumer puts validated fixes on the buffer instead of writing
+them one by one. A background task on the event loop flushes the buffer
+every LOCATION_WS_FLUSH_INTERVAL_MS, or sooner once
+LOCATION_WS_FLUSH_MAX_FIXES are waiting, with one bulk_create and
+transaction per order. It then rebroadcasts the newest fix per tracking
+group through core.broadcasts. A failed order write (say the order was deleted mid-trip) fails
+only that order's fixes.
+
+Acknowledgements depend on LOCATION_WS_ACK_MODE:
+
+- ``persisted``: fixes are acked once their flush has committed. A failed
+  flush is reported back so the client can resend (at-least-once).
+- ``received``: fixes are acked as soon as they are buffered. A failed
+  flush is retried on the next interval while the buffer has room.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .broadcasts import broadcast_location
+
+logger = logging.getLogger(__name__)
+
+ACK_PERSISTED = 'persisted'
+ACK_RECEIVED = 'received'
+
+
+class BufferFull(Exception):
+    """Raised when accepting more fixes would exceed LOCATION_WS_BUFFER_MAX_FIXES"""
+
+
+@dataclass
+class PendingFix:
+    """A validated fix waiting to be written"""
+    order: Any
+    fix: dict
+    group: str
+    reply_channel: Optional[str] = None
+    message_id: Any = None
+    attempts: int = field(default=0)
+
+
+def _write_order(entries):
+    from .models import Location
+    from .tracks import record_fixes
+
+    # One transaction per order: deferred foreign key checks (an order deleted
+    # mid-trip) only fail at commit, so a savepoint could not isolate them
+    with transaction.atomic():
+        locations = Location.objects.bulk_create(
+            [Location(order=entry.order, **entry.fix) for entry in entries],
+            batch_size=500,
+        )
+        record_fixes(entries[0].order.pk, locations)
+    return locations
+
+
+def _write_batch(entries):
+    """Insert the fixes order by order.
+
+    Returns ``([(group, newest fix data), ...], written entries, failed
+    entries)``. An order whose write fails only fails its own fixes.
+    """
+    from .serializers import LocationSerializer
+
+    by_order = {}
+    for entry in entries:
+        by_order.setdefault(entry.order.pk, []).append(entry)
+
+    newest = {}
+    written = []
+    failed = []
+    for order_id, order_entries in by_order.items():
+        try:
+            locations = _write_order(order_entries)
+        except Exception:
+            logger.exception('Failed to write %d location fixes for order %s', len(order_entries), order_id)
+            failed.extend(order_entries)
+            continue
+        written.extend(order_entries)
+        for entry, location in zip(order_entries, locations):
+            current = newest.get(entry.group)
+            if current is None or location.timestamp >= current.timestamp:
+                newest[entry.group] = location
+    broadcasts = [(group, LocationSerializer(location).data) for group, location in newest.items()]
+    return broadcasts, written, failed
+
+
+class LocationWriteBuffer:
+    """Collects fixes from all consumers in this process and writes them in batches"""
+
+    def __init__(self, flush_interval_ms, flush_max_fixes, max_fixes, ack_mode, max_attempts=3):
+        if ack_mode not in (ACK_PERSISTED, ACK_RECEIVED):
+            raise ValueError(f'Unknown location ack mode: {ack_mode}')
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_fixes = flush_max_fixes
+        self.max_fixes = max_fixes
+        self.ack_mode = ack_mode
+        self.max_attempts = max_attempts
+        self._entries = []
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def add(self, entries):
+        """Queue fixes for the next flush; raises BufferFull instead of growing unbounded"""
+        if len(self._entries) + len(entries) > self.max_fixes:
+            raise BufferFull()
+        self._ensure_task()
+        self._entries.extend(entries)
+        if len(self._entries) >= self.flush_max_fixes:
+            self._wakeup.set()
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Unexpected error while flushing location buffer')
+
+    async def flush(self):
+        """Write everything currently buffered; returns the number of fixes written"""
+        if not self._entries:
+            return 0
+        batch, self._entries = self._entries, []
+        channel_layer = get_channel_layer()
+
+        try:
+            broadcasts, written, failed = await database_sync_to_async(_write_batch)(batch)
+        except Exception:
+            logger.exception('Failed to write %d buffered location fixes', len(batch))
+            await self._handle_failure(batch, channel_layer)
+            return 0
+
+        for group, data in broadcasts:
+            await broadcast_location(group, data)
+        if self.ack_mode == ACK_PERSISTED:
+            await self._send_acks(written, channel_layer, 'location_ack')
+        if failed:
+            await self._handle_failure(failed, channel_layer)
+        return len(written)
+
+    async def _handle_failure(self, batch, channel_layer):
+        if self.ack_mode == ACK_PERSISTED:
+            # Nothing was acked yet, the clients will resend
+            await self._send_acks(batch, channel_layer, 'location_nack')
+            return
+        # Already acked to the clients: retry while there is room
+        retry = []
+        for entry in batch:
+            entry.attempts += 1
+            if entry.attempts < self.max_attempts:
+                retry.append(entry)
+        dropped = len(batch) - len(retry)
+        room = self.max_fixes - len(self._entries)
+        if len(retry) > room:
+            dropped += len(retry) - room
+            retry = retry[:room]
+        if dropped:
+            logger.error('Dropped %d acknowledged location fixes after failed flushes', dropped)
+        self._entries[:0] = retry
+
+    async def _send_acks(self, batch, channel_layer, message_type):
+        message_ids = {}
+        for entry in batch:
+            if entry.reply_channel and entry.message_id is not None:
+                message_ids.setdefault(entry.reply_channel, []).append(entry.message_id)
+        for reply_channel, ids in message_ids.items():
+            try:
+                await channel_layer.send(reply_channel, {'type': message_type, 'ids': list(dict.fromkeys(ids))})
+            except Exception:
+                logger.warning('Could not deliver %s to %s', message_type, reply_channel)
+
+
+_buffer = None
+
+
+def get_location_buffer():
+    """The process-wide buffer, created from settings on first use"""
+    global _buffer
+    if _buffer is None:
+        _buffer = LocationWriteBuffer(
+            flush_interval_ms=settings.LOCATION_WS_FLUSH_INTERVAL_MS,
+            flush_max_fixes=settings.LOCATION_WS_FLUSH_MAX_FIXES,
+            max_fixes=settings.LOCATION_WS_BUFFER_MAX_FIXES,
+            ack_mode=settings.LOCATION_WS_ACK_MODE,
+        )
+    return _buffer
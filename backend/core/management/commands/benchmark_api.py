@@ -0,0 +1,108 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, setup_test_environment, \
+    teardown_databases, teardown_test_environment
+
+from core.benchmarks import api
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every REST endpoint offline: query count, p50/p99 latency and response size '
+        'at several dataset sizes. Fails on N+1 growth or when a query count exceeds the baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10,1000',
+            help='Comma separated dataset sizes (rows per table), e.g. 10,1000,100000',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='Timed calls per endpoint and dataset size',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=str(api.BASELINE_PATH),
+            help='Path of the stored query-count baseline',
+        )
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Write the measured query counts to the baseline instead of checking them',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write all measurements as JSON to this file',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Reuse the test database between runs',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',') if size.strip()})
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of integers')
+        if not sizes:
+            raise CommandError('At least one dataset size is required')
+
+        missing = api.uncovered_url_names()
+        if missing:
+            raise CommandError(f'No benchmark defined for URL names: {", ".join(missing)}')
+        duplicates = api.duplicate_keys()
+        if duplicates:
+            raise CommandError(f'Benchmark endpoints share a key: {", ".join(duplicates)}')
+
+        verbosity = options['verbosity']
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            # Run offline: in-memory channel layer and a fast password hasher
+            with override_settings(
+                CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+            ):
+                results = api.run_benchmarks(
+                    sizes,
+                    repeat=options['repeat'],
+                    log=self.stdout.write if verbosity >= 1 else None,
+                )
+            vendor = connection.vendor
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump({
+                    'vendor': vendor,
+                    'database': settings.DATABASES['default']['ENGINE'],
+                    'results': [result.as_dict() for result in results],
+                }, output_file, indent=2)
+
+        baseline = api.load_baseline(options['baseline'])
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as baseline_file:
+                json.dump(api.build_baseline(results, vendor, baseline), baseline_file, indent=2)
+                baseline_file.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline for {vendor} written to {options["baseline"]}'))
+            return
+
+        regressions = api.find_regressions(results, baseline.get(vendor, {}))
+        if regressions:
+            for problem in regressions:
+                self.stderr.write(problem)
+            raise CommandError(f'{len(regressions)} query-count regression(s) found')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(results)} endpoint measurements within query budget on {vendor}'
+        ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import matching
+
+
+class Command(BaseCommand):
+    help = 'Compare vectorized truck matching with a brute-force scorer on a synthetic fleet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trucks', type=int, default=100000, help='Number of trucks in the synthetic fleet')
+        parser.add_argument('--requirements', type=int, default=20, help='Requirements matched against the fleet')
+        parser.add_argument('--limit', type=int, default=10, help='Trucks kept per requirement')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed vectorized runs (best is reported)')
+        parser.add_argument(
+            '--min-speedup',
+            type=float,
+            default=None,
+            help='Fail unless the vectorized matcher is at least this many times faster',
+        )
+
+    def handle(self, *args, **options):
+        result = matching.run_benchmark(
+            max(options['trucks'], 1), max(options['requirements'], 1), max(options['limit'], 1),
+            max(options['repeat'], 1),
+        )
+        per_requirement = result['requirements']
+        self.stdout.write(f"Fleet:        {result['trucks']} trucks, {per_requirement} requirements")
+        self.stdout.write(
+            f"Brute force:  {result['brute_force_ms']:.1f}ms "
+            f"({result['brute_force_ms'] / per_requirement:.1f}ms per requirement)"
+        )
+        self.stdout.write(
+            f"Vectorized:   {result['vectorized_ms']:.1f}ms "
+            f"({result['vectorized_ms'] / per_requirement:.1f}ms per requirement, {result['speedup']:.1f}x faster)"
+        )
+        self.stdout.write(f"Blocked:      {result['blocked_ms']:.1f}ms for all requirements at once (bulk job)")
+
+        if not result['same_results']:
+            raise CommandError('Vectorized and brute-force matching picked different trucks')
+        if options['min_speedup'] is not None and result['speedup'] < options['min_speedup']:
+            raise CommandError(f"Vectorized matching was less than {options['min_speedup']}x faster")
+        self.stdout.write(self.style.SUCCESS('Vectorized and brute-force matching picked the same trucks'))
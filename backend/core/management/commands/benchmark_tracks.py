@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+from core.benchmarks import tracks
+
+
+class Command(BaseCommand):
+    help = 'Compare storage size and full-history read time of Location rows against packed segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixes', type=int, default=20000, help='Number of fixes in the benchmark trip')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed reads per storage mode (best is reported)')
+        parser.add_argument('--segment-size', type=int, default=1000, help='Fixes per packed segment')
+        parser.add_argument(
+            '--min-ratio',
+            type=float,
+            default=5.0,
+            help='Fail unless both storage and read time improve by at least this factor (0 to only report)',
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with transaction.atomic():
+                result = tracks.run_benchmark(options['fixes'], options['repeat'], options['segment_size'])
+                transaction.set_rollback(True)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"Fixes:            {result['fixes']}")
+        if result['storage_ratio'] is not None:
+            self.stdout.write(
+                f"Storage:          {result['rows_bytes']} bytes as rows, "
+                f"{result['packed_bytes']} bytes packed ({result['storage_ratio']:.1f}x smaller)"
+            )
+        else:
+            self.stdout.write('Storage:          not measurable on this database backend')
+        self.stdout.write(
+            f"Full history read: {result['rows_read_ms']:.1f}ms as rows, "
+            f"{result['packed_read_ms']:.1f}ms packed ({result['read_ratio']:.1f}x faster)"
+        )
+
+        if options['min_ratio']:
+            ratios = [r for r in (result['storage_ratio'], result['read_ratio']) if r is not None]
+            if any(ratio < options['min_ratio'] for ratio in ratios):
+                raise CommandError(f"Packed storage improved by less than {options['min_ratio']}x")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import websocket
+
+
+class Command(BaseCommand):
+    help = 'Compare frame size and encode cost of tracking location updates as JSON and as binary frames'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=10000, help='Tracking sockets receiving each update')
+        parser.add_argument(
+            '--points',
+            type=int,
+            nargs='+',
+            default=[0, 4],
+            help='Held-back points carried with the latest fix (one run per value)',
+        )
+
+    def handle(self, *args, **options):
+        subscribers = max(options['subscribers'], 1)
+        results = websocket.run_benchmark(subscribers, [max(points, 0) for points in options['points']])
+
+        self.stdout.write(f'Subscribers: {subscribers}')
+        for result in results:
+            self.stdout.write(
+                f"{result['encoding']:<7} {result['points']} points: "
+                f"{result['bytes_per_update']} bytes/update, {result['encode_us']:.2f}us/message, "
+                f"{result['broadcast_bytes'] / 1e6:.2f}MB and {result['broadcast_seconds'] * 1000:.1f}ms per broadcast"
+            )
+        self.stdout.write(self.style.SUCCESS('Successfully benchmarked the tracking WebSocket encodings'))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
+from core import gazetteer
 from core.models import User, Truck, Requirement
 import random
 
@@ -116,7 +117,8 @@ class Command(BaseCommand):
                 budget_min=random.uniform(5000, 25000),
                 budget_max=random.uniform(25000, 50000),
                 bidding_end_date=bidding_end,
-                special_instructions='Handle with care. Contact before pickup.'
+                special_instructions='Handle with care. Contact before pickup.',
+                **gazetteer.requirement_coordinates(from_city, to_city)
             )
             self.stdout.write(f'Created requirement: {requirement.title}')
         
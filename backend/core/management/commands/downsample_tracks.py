@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core import tracks
+from core.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Thin the location history of orders finished long ago to one fix per interval plus turning points'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.LOCATION_RETENTION_DAYS,
+            help='Only orders delivered or cancelled more than this many days ago',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=settings.LOCATION_RETENTION_INTERVAL_SECONDS,
+            help='Keep the first fix of every this many seconds',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=settings.LOCATION_RETENTION_TOLERANCE_M,
+            help='Also keep the fixes needed to stay within this many meters of the route',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.LOCATION_RETENTION_BATCH_SIZE,
+            help='Location rows deleted per transaction',
+        )
+        parser.add_argument(
+            '--order',
+            type=int,
+            action='append',
+            dest='order_ids',
+            help='Only process the given order id (can be repeated), even if downsampled before',
+        )
+
+    def handle(self, *args, **options):
+        if options['order_ids']:
+            queryset = Order.objects.filter(id__in=options['order_ids'])
+        else:
+            cutoff = timezone.now() - timedelta(days=max(options['days'], 0))
+            queryset = Order.objects.annotate(
+                finished_at=Coalesce('actual_delivery_time', 'updated_at')
+            ).filter(
+                status__in=tracks.FINISHED_STATUSES, finished_at__lt=cutoff, track_downsampled_at__isnull=True
+            )
+        order_ids = list(queryset.order_by('id').values_list('id', flat=True))
+
+        row_bytes = tracks.location_row_bytes()
+        total_rows = total_packed = total_bytes = 0
+        for order_id in order_ids:
+            rows, packed, saved = tracks.downsample_order(
+                order_id, max(options['interval'], 1), options['tolerance'], max(options['batch_size'], 1)
+            )
+            total_rows, total_packed, total_bytes = total_rows + rows, total_packed + packed, total_bytes + saved
+            if options['verbosity'] > 1 and (rows or packed):
+                self.stdout.write(f'Order {order_id}: deleted {rows} rows and {packed} packed fixes')
+
+        reclaimed = total_rows * row_bytes + total_bytes
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully downsampled {len(order_ids)} orders: deleted {total_rows} location rows and '
+            f'{total_packed} packed fixes, about {reclaimed / 1e6:.1f} MB reclaimed'
+        ))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import fanout
+from core.models import Requirement
+
+
+class Command(BaseCommand):
+    help = 'Send the pending new requirement notifications to matching truck owners'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.REQUIREMENT_FANOUT_CHUNK_SIZE,
+            help='Notifications created per transaction',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = max(options['chunk_size'], 1)
+        pending = list(Requirement.objects.filter(fanout_cursor__isnull=False).order_by('id').values_list('id', flat=True))
+        total = seconds = 0
+        for requirement_id in pending:
+            written, elapsed = fanout.fan_out(requirement_id, chunk_size)
+            total, seconds = total + written, seconds + elapsed
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Requirement {requirement_id}: {written} notifications in {elapsed:.2f}s')
+
+        rate = f' ({total / seconds:.0f} rows/s)' if seconds else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully sent {total} notifications for {len(pending)} requirements{rate}'
+        ))
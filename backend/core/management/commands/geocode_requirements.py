@@ -0,0 +1,67 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from core import gazetteer
+from core.models import Requirement
+
+COORDINATE_FIELDS = ['from_latitude', 'from_longitude', 'to_latitude', 'to_longitude']
+
+
+class Command(BaseCommand):
+    help = 'Fill in requirement pickup and drop coordinates from the offline gazetteer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Geocode every requirement again, not only those missing coordinates',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of requirements to update per transaction',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        queryset = Requirement.objects.order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(Q(from_latitude__isnull=True) | Q(to_latitude__isnull=True))
+
+        processed = 0
+        unknown = Counter()
+        last_id = 0
+        while True:
+            rows = list(
+                queryset.filter(id__gt=last_id).values_list('id', 'from_location', 'to_location')[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            requirements = []
+            for requirement_id, from_location, to_location in rows:
+                coordinates = gazetteer.requirement_coordinates(from_location, to_location)
+                if coordinates['from_latitude'] is None:
+                    unknown[from_location] += 1
+                if coordinates['to_latitude'] is None:
+                    unknown[to_location] += 1
+                requirements.append(Requirement(id=requirement_id, **coordinates))
+            with transaction.atomic():
+                Requirement.objects.bulk_update(requirements, COORDINATE_FIELDS)
+            processed += len(requirements)
+            self.stdout.write(f'Geocoded {processed} requirements')
+
+        if unknown:
+            self.stdout.write(self.style.WARNING(
+                f'{sum(unknown.values())} locations are not in the gazetteer and were left empty'
+            ))
+            if options['verbosity'] > 1:
+                for location, count in unknown.most_common(20):
+                    self.stdout.write(f'  {count:6d}  {location}')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully geocoded {processed} requirements'))
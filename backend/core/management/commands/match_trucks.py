@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core import matching
+
+
+class Command(BaseCommand):
+    help = 'Score every open requirement for every available truck and store the best matches per truck'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--per-truck',
+            type=int,
+            default=matching.DEFAULT_LIMIT,
+            help=f'Matches kept per truck (default {matching.DEFAULT_LIMIT})',
+        )
+
+    def handle(self, *args, **options):
+        rows = matching.rebuild_truck_matches(
+            per_truck=max(options['per_truck'], 1),
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Successfully stored {rows} truck matches'))
@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import tracks
+from core.models import Location, LocationSegment
+
+
+class Command(BaseCommand):
+    help = 'Pack older location fixes into compact track segments (or unpack them again)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-minutes',
+            type=int,
+            default=settings.LOCATION_PACK_AFTER_MINUTES,
+            help='Only pack fixes recorded more than this many minutes ago',
+        )
+        parser.add_argument(
+            '--segment-size',
+            type=int,
+            default=settings.LOCATION_SEGMENT_SIZE,
+            help='Maximum number of fixes per segment',
+        )
+        parser.add_argument(
+            '--order',
+            type=int,
+            action='append',
+            dest='order_ids',
+            help='Only process the given order id (can be repeated)',
+        )
+        parser.add_argument(
+            '--unpack',
+            action='store_true',
+            help='Restore packed segments to Location rows, e.g. before disabling packing',
+        )
+
+    def handle(self, *args, **options):
+        if options['unpack']:
+            order_ids = options['order_ids'] or LocationSegment.objects.values_list(
+                'order_id', flat=True
+            ).distinct().order_by()
+            restored = sum(tracks.unpack_order(order_id) for order_id in list(order_ids))
+            self.stdout.write(self.style.SUCCESS(f'Restored {restored} fixes to location rows'))
+            return
+
+        if not tracks.packing_enabled():
+            raise CommandError(
+                'LOCATION_PACKING_ENABLED is off; readers would not see packed fixes. '
+                'Enable it before packing.'
+            )
+
+        cutoff = timezone.now() - timedelta(minutes=options['older_than_minutes'])
+        order_ids = options['order_ids'] or Location.objects.filter(
+            timestamp__lt=cutoff
+        ).values_list('order_id', flat=True).distinct().order_by()
+
+        total_fixes = total_segments = 0
+        for order_id in list(order_ids):
+            packed, segments = tracks.pack_order(order_id, cutoff, options['segment_size'])
+            if packed:
+                self.stdout.write(f'Order {order_id}: packed {packed} fixes into {segments} segments')
+            total_fixes += packed
+            total_segments += segments
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Packed {total_fixes} fixes into {total_segments} segments')
+        )
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import notifications
+
+
+class Command(BaseCommand):
+    help = 'Delete old read notifications in batches, keeping a per-user count of them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.NOTIFICATION_RETENTION_DAYS,
+            help=f'Purge read notifications older than this many days (default {settings.NOTIFICATION_RETENTION_DAYS})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.NOTIFICATION_PURGE_BATCH_SIZE,
+            help='Notifications deleted per transaction',
+        )
+        parser.add_argument(
+            '--pause-ms',
+            type=int,
+            default=settings.NOTIFICATION_PURGE_PAUSE_MS,
+            help='Milliseconds to sleep between transactions',
+        )
+
+    def handle(self, *args, **options):
+        purged = notifications.purge_read(
+            older_than=timezone.now() - timedelta(days=max(options['days'], 0)),
+            batch_size=max(options['batch_size'], 1),
+            pause=max(options['pause_ms'], 0) / 1000,
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Successfully purged {purged} read notifications'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily order rollups behind the dashboard timeseries from the orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Orders aggregated per query, by id range (default 10000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Chunks aggregated in parallel, each on its own database connection (default 4)',
+        )
+
+    def handle(self, *args, **options):
+        rows = rollups.rebuild_rollups(
+            chunk_size=max(options['chunk_size'], 1),
+            workers=max(options['workers'], 1),
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {rows} order rollup rows'))
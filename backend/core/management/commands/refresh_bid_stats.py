@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Requirement, Bid
+
+
+def recompute_bid_stats(requirement_ids):
+    """Write the bid stats of the given requirements from one aggregate query; returns how many"""
+    stats_by_requirement = {
+        row.pop('requirement_id'): row
+        for row in Bid.objects.filter(requirement_id__in=requirement_ids)
+        .values('requirement_id')
+        .annotate(**Requirement.bid_stats_aggregates())
+        .order_by()
+    }
+
+    requirements = []
+    for requirement_id in requirement_ids:
+        stats = stats_by_requirement.get(requirement_id, {})
+        requirement = Requirement(id=requirement_id)
+        requirement.pending_bids_count = stats.get('pending_bids_count', 0)
+        requirement.lowest_bid_amount = stats.get('lowest_bid_amount')
+        requirement.highest_bid_amount = stats.get('highest_bid_amount')
+        requirement.last_bid_at = stats.get('last_bid_at')
+        requirements.append(requirement)
+
+    Requirement.objects.bulk_update(requirements, Requirement.BID_STATS_FIELDS)
+    return len(requirements)
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized bid statistics stored on requirements'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of requirements to recompute per transaction',
+        )
+        parser.add_argument(
+            '--requirement',
+            type=int,
+            action='append',
+            dest='requirement_ids',
+            help='Only recompute the given requirement id (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Requirement.objects.order_by('id')
+        if options['requirement_ids']:
+            queryset = queryset.filter(id__in=options['requirement_ids'])
+
+        requirement_ids = list(queryset.values_list('id', flat=True))
+        updated = 0
+
+        for start in range(0, len(requirement_ids), batch_size):
+            chunk = requirement_ids[start:start + batch_size]
+            with transaction.atomic():
+                # Lock the chunk so concurrent bid writes wait for the repair
+                list(Requirement.objects.select_for_update().filter(id__in=chunk).values_list('id', flat=True))
+
+                updated += recompute_bid_stats(chunk)
+
+            self.stdout.write(f'Recomputed bid stats for {updated}/{len(requirement_ids)} requirements')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully recomputed bid stats for {updated} requirements')
+        )
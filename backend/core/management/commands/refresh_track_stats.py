@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import tracks
+from core.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized track summary (fix count, first/last fix, distance) stored on orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--order',
+            type=int,
+            action='append',
+            dest='order_ids',
+            help='Only recompute the given order id (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Order.objects.order_by('id')
+        if options['order_ids']:
+            queryset = queryset.filter(id__in=options['order_ids'])
+
+        order_ids = list(queryset.values_list('id', flat=True))
+        for count, order_id in enumerate(order_ids, start=1):
+            # One transaction per order: a long trip is read in full while its row is locked
+            with transaction.atomic():
+                tracks.refresh_track_stats(order_id)
+            if count % 100 == 0:
+                self.stdout.write(f'Recomputed track stats for {count}/{len(order_ids)} orders')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully recomputed track stats for {len(order_ids)} orders')
+        )
@@ -0,0 +1,32 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from core import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Run periodic jobs, such as closing requirements whose bidding has ended'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run every job once and exit instead of looping',
+        )
+
+    def handle(self, *args, **options):
+        jobs = scheduler.default_jobs()
+        if not options['once']:
+            names = ', '.join(f'{job.name} every {job.interval}s' for job in jobs)
+            self.stdout.write(f'Running {names}')
+            try:
+                asyncio.run(scheduler.run_forever(jobs))
+            except KeyboardInterrupt:
+                pass
+            return
+
+        for job in jobs:
+            result = asyncio.run(scheduler.run_job(job))
+            self.stdout.write(f'{job.name}: {result}')
+        self.stdout.write(self.style.SUCCESS('Successfully ran scheduled jobs'))
@@ -0,0 +1,282 @@
+"""Truck-to-requirement matching.
+
+Every available, active truck that can carry a requirement scores between
+0 and 1. The score is a weighted sum of:
+
+- type: 1 for the requested truck type, less for each size larger; smaller
+  types cannot carry the load
+- capacity: how fully the load uses the truck, ``weight / capacity``; trucks
+  smaller than the load cannot carry it
+- distance: ``exp(-km / DISTANCE_SCALE_KM)`` from the truck to the pickup,
+  0 when either position is unknown
+- rating: the owner's average order rating, out of 5
+- on_time: the share of the owner's delivered orders that arrived by their
+  estimated delivery time
+
+Rating and on-time ratio are pulled toward a prior, so an owner with one
+order is not ranked on that order alone. Trucks are read into a Fleet of
+NumPy arrays and scored against many requirements at once.
+``rebuild_truck_matches`` stores the best open requirements of every truck
+in TruckMatch.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, F, FloatField, OuterRef, Q, Subquery
+from django.db.models.functions import Cast
+
+from . import gazetteer
+from .geo import haversine_m
+from .models import Truck, Requirement, Order, TruckMatch
+
+TRUCK_SIZES = [truck_type for truck_type, _ in Requirement.TRUCK_TYPE_CHOICES]  # Smallest first
+
+WEIGHTS = {'type': 0.2, 'capacity': 0.2, 'distance': 0.3, 'rating': 0.15, 'on_time': 0.15}
+TYPE_STEP_PENALTY = 0.3  # Type score lost per size above the requested one
+MIN_TYPE_SCORE = 0.1
+DISTANCE_SCALE_KM = 150
+
+PRIOR_ORDERS = 3  # Weight of the prior, in orders
+RATING_PRIOR = 3.5
+ON_TIME_PRIOR = 0.8
+
+OWNER_STATS_KEY = 'matching:owner_stats'
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+BLOCK_CELLS = 1_000_000  # Requirement x truck scores computed at once by the bulk job
+
+
+def carrying_types(truck_type):
+    """Truck types that can carry a load asking for ``truck_type``: it and every larger type"""
+    return TRUCK_SIZES[TRUCK_SIZES.index(truck_type):] if truck_type in TRUCK_SIZES else []
+
+
+def carried_types(truck_type):
+    """Requested truck types a truck of ``truck_type`` can carry: it and every smaller type"""
+    return TRUCK_SIZES[:TRUCK_SIZES.index(truck_type) + 1] if truck_type in TRUCK_SIZES else []
+
+
+@dataclass
+class Fleet:
+    """Trucks as parallel arrays; positions are NaN where unknown"""
+    truck_ids: np.ndarray
+    owner_ids: np.ndarray
+    sizes: np.ndarray
+    capacities: np.ndarray
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    ratings: np.ndarray  # Out of 1
+    on_time: np.ndarray
+
+    def __len__(self):
+        return len(self.truck_ids)
+
+
+def owner_stats():
+    """Smoothed rating (out of 1) and on-time ratio per truck owner, as arrays sorted by owner id.
+
+    Cached for MATCHING_OWNER_STATS_CACHE_TIMEOUT seconds.
+    """
+    stats = cache.get(OWNER_STATS_KEY)
+    if stats is not None:
+        return stats
+    rows = (
+        Order.objects.values('user_id')
+        .annotate(
+            rating_avg=Avg('rating'),
+            rating_count=Count('rating'),
+            delivered=Count('id', filter=Q(actual_delivery_time__isnull=False, estimated_delivery_time__isnull=False)),
+            on_time=Count('id', filter=Q(actual_delivery_time__lte=F('estimated_delivery_time'))),
+        )
+        .order_by('user_id')
+        .values_list('user_id', 'rating_avg', 'rating_count', 'delivered', 'on_time')
+    )
+    table = np.array([
+        (user_id, rating_avg or 0, rating_count, delivered, on_time)
+        for user_id, rating_avg, rating_count, delivered, on_time in rows
+    ], dtype=float).reshape(-1, 5)
+    user_ids, rating_avg, rating_count, delivered, on_time = table.T
+    stats = (
+        user_ids.astype(np.int64),
+        (rating_avg * rating_count + RATING_PRIOR * PRIOR_ORDERS) / (rating_count + PRIOR_ORDERS) / 5,
+        (on_time + ON_TIME_PRIOR * PRIOR_ORDERS) / (delivered + PRIOR_ORDERS),
+    )
+    cache.set(OWNER_STATS_KEY, stats, settings.MATCHING_OWNER_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def _owner_values(owner_ids, stat_ids, values, default):
+    if not len(stat_ids):
+        return np.full(len(owner_ids), default)
+    positions = np.minimum(np.searchsorted(stat_ids, owner_ids), len(stat_ids) - 1)
+    found = stat_ids[positions] == owner_ids
+    return np.where(found, values[positions], default)
+
+
+def load_fleet(queryset=None):
+    """Fleet of the trucks in ``queryset``, by default every available, active truck.
+
+    A truck is placed at the last GPS fix of its orders, or else at its
+    ``current_location`` geocoded.
+    """
+    if queryset is None:
+        queryset = Truck.objects.filter(status='available', is_active=True)
+    last_fixes = Order.objects.filter(truck=OuterRef('pk'), last_latitude__isnull=False).order_by('-last_fix_at')
+    rows = list(
+        queryset.annotate(
+            capacity_float=Cast('capacity', FloatField()),
+            fix_latitude=Cast(Subquery(last_fixes.values('last_latitude')[:1]), FloatField()),
+            fix_longitude=Cast(Subquery(last_fixes.values('last_longitude')[:1]), FloatField()),
+        )
+        .order_by('id')
+        .values_list('id', 'user_id', 'truck_type', 'capacity_float', 'fix_latitude', 'fix_longitude',
+                     'current_location')
+    )
+
+    sizes = {truck_type: size for size, truck_type in enumerate(TRUCK_SIZES)}
+    latitudes, longitudes = np.full(len(rows), np.nan), np.full(len(rows), np.nan)
+    for number, (*_, fix_latitude, fix_longitude, current_location) in enumerate(rows):
+        if fix_latitude is not None:
+            latitudes[number], longitudes[number] = fix_latitude, fix_longitude
+        elif current_location:
+            place = gazetteer.geocode(current_location)
+            if place:
+                latitudes[number], longitudes[number] = place.latitude, place.longitude
+
+    owner_ids = np.array([row[1] for row in rows], dtype=np.int64)
+    stat_ids, ratings, on_time = owner_stats()
+    return Fleet(
+        truck_ids=np.array([row[0] for row in rows], dtype=np.int64),
+        owner_ids=owner_ids,
+        sizes=np.array([sizes.get(row[2], -1) for row in rows], dtype=np.int64),
+        capacities=np.array([row[3] for row in rows], dtype=float),
+        latitudes=latitudes,
+        longitudes=longitudes,
+        ratings=_owner_values(owner_ids, stat_ids, ratings, RATING_PRIOR / 5),
+        on_time=_owner_values(owner_ids, stat_ids, on_time, ON_TIME_PRIOR),
+    )
+
+
+def score(fleet, sizes, weights, latitudes, longitudes):
+    """Scores of every truck for each requirement, shaped (requirements, trucks).
+
+    Requirements are given as arrays of their truck size index, weight and
+    pickup position (NaN if unknown). Trucks that cannot carry a requirement
+    score -inf. Also returns the components and the distances in km.
+    """
+    sizes, weights, latitudes, longitudes = (
+        np.asarray(values, dtype=float)[:, None] for values in (sizes, weights, latitudes, longitudes)
+    )
+    steps = fleet.sizes - sizes
+    capable = (steps >= 0) & (fleet.capacities >= weights) & (fleet.capacities > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distances = haversine_m(latitudes, longitudes, fleet.latitudes, fleet.longitudes) / 1000
+        components = {
+            'type': np.maximum(1 - TYPE_STEP_PENALTY * steps, MIN_TYPE_SCORE),
+            'capacity': np.where(capable, weights / fleet.capacities, 0.0),
+            'distance': np.nan_to_num(np.exp(-distances / DISTANCE_SCALE_KM)),
+            'rating': np.broadcast_to(fleet.ratings, capable.shape),
+            'on_time': np.broadcast_to(fleet.on_time, capable.shape),
+        }
+    total = sum(WEIGHTS[name] * values for name, values in components.items())
+    return np.where(capable, total, -np.inf), components, distances
+
+
+def top(scores, ids, limit):
+    """Positions of the best ``limit`` finite scores, best first; ties go to the lower id"""
+    candidates = np.flatnonzero(np.isfinite(scores))
+    if len(candidates) > limit:
+        candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        # Scores tied with the last one kept may have been left out arbitrarily
+        cutoff = scores[candidates].min()
+        candidates = np.union1d(candidates, np.flatnonzero(scores == cutoff))
+    best_first = np.lexsort((ids[candidates], -scores[candidates]))
+    return candidates[best_first][:limit]
+
+
+def requirement_features(requirements):
+    """Arrays of truck size index, weight and pickup position of requirements, for ``score``"""
+    sizes = {truck_type: size for size, truck_type in enumerate(TRUCK_SIZES)}
+    return (
+        [sizes.get(r.truck_type, len(TRUCK_SIZES)) for r in requirements],
+        [float(r.weight) for r in requirements],
+        [float(r.from_latitude) if r.from_latitude is not None else np.nan for r in requirements],
+        [float(r.from_longitude) if r.from_longitude is not None else np.nan for r in requirements],
+    )
+
+
+def match_trucks(requirement, limit=DEFAULT_LIMIT):
+    """Best available trucks for a requirement, as dicts with the truck id, score, distance and components"""
+    fleet = load_fleet(Truck.objects.filter(
+        status='available', is_active=True, truck_type__in=carrying_types(requirement.truck_type),
+        capacity__gte=requirement.weight,
+    ))
+    if not len(fleet):
+        return []
+    scores, components, distances = score(fleet, *requirement_features([requirement]))
+    matches = []
+    for position in top(scores[0], fleet.truck_ids, limit):
+        distance = distances[0, position]
+        matches.append({
+            'truck_id': int(fleet.truck_ids[position]),
+            'score': round(float(scores[0, position]), 4),
+            'distance_km': None if np.isnan(distance) else round(float(distance), 1),
+            'components': {name: round(float(values[0, position]), 4) for name, values in components.items()},
+        })
+    return matches
+
+
+def rebuild_truck_matches(per_truck=DEFAULT_LIMIT, log=None):
+    """Store the best ``per_truck`` open requirements of every available truck in TruckMatch.
+
+    Requirements are scored against the whole fleet in blocks of at most
+    BLOCK_CELLS scores, keeping a running top list per truck. The table is
+    replaced in one transaction at the end. Returns the number of rows.
+    """
+    fleet = load_fleet()
+    requirements = list(
+        Requirement.objects.filter(is_active=True, status='open')
+        .only('id', 'truck_type', 'weight', 'from_latitude', 'from_longitude')
+        .order_by('id')
+    )
+    best_scores = np.full((len(fleet), per_truck), -np.inf)
+    best_requirements = np.zeros((len(fleet), per_truck), dtype=np.int64)
+    best_distances = np.full((len(fleet), per_truck), np.nan)
+
+    block = max(1, BLOCK_CELLS // max(len(fleet), 1))
+    for start in range(0, len(requirements) if len(fleet) else 0, block):
+        chunk = requirements[start:start + block]
+        scores, _, distances = score(fleet, *requirement_features(chunk))
+        chunk_ids = np.broadcast_to(np.array([r.id for r in chunk], dtype=np.int64)[:, None], scores.shape)
+        # Trucks are rows from here on
+        merged_scores = np.hstack([best_scores, scores.T])
+        merged_requirements = np.hstack([best_requirements, chunk_ids.T])
+        merged_distances = np.hstack([best_distances, distances.T])
+        # Higher score first, then the older requirement
+        order = np.lexsort((merged_requirements, -merged_scores), axis=1)[:, :per_truck]
+        best_scores = np.take_along_axis(merged_scores, order, axis=1)
+        best_requirements = np.take_along_axis(merged_requirements, order, axis=1)
+        best_distances = np.take_along_axis(merged_distances, order, axis=1)
+        if log:
+            log(f'Scored {min(start + block, len(requirements))}/{len(requirements)} requirements')
+
+    rows, columns = np.nonzero(np.isfinite(best_scores))
+    matches = [
+        TruckMatch(
+            truck_id=int(fleet.truck_ids[row]),
+            requirement_id=int(best_requirements[row, column]),
+            rank=int(column) + 1,
+            score=round(float(best_scores[row, column]), 4),
+            distance_km=None if np.isnan(best_distances[row, column]) else round(float(best_distances[row, column]), 1),
+        )
+        for row, column in zip(rows, columns)
+    ]
+    with transaction.atomic():
+        TruckMatch.objects.all().delete()
+        TruckMatch.objects.bulk_create(matches, batch_size=1000)
+    return len(matches)
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:35
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_bid_stats(apps, schema_editor):
+    # The aggregation is frozen here rather than imported, so later changes to
+    # the model or the refresh_bid_stats command don't change this migration
+    Requirement = apps.get_model('core', 'Requirement')
+    Bid = apps.get_model('core', 'Bid')
+    pending = models.Q(status='pending')
+    requirement_ids = list(Requirement.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(requirement_ids), BATCH_SIZE):
+        chunk = requirement_ids[start:start + BATCH_SIZE]
+        stats_by_requirement = {
+            row.pop('requirement_id'): row
+            for row in Bid.objects.filter(requirement_id__in=chunk)
+            .values('requirement_id')
+            .annotate(
+                pending_bids_count=models.Count('id', filter=pending),
+                lowest_bid_amount=models.Min('amount', filter=pending),
+                highest_bid_amount=models.Max('amount', filter=pending),
+                last_bid_at=models.Max('created_at'),
+            )
+            .order_by()
+        }
+        requirements = []
+        for requirement_id in chunk:
+            stats = stats_by_requirement.get(requirement_id, {})
+            requirements.append(Requirement(
+                id=requirement_id,
+                pending_bids_count=stats.get('pending_bids_count', 0),
+                lowest_bid_amount=stats.get('lowest_bid_amount'),
+                highest_bid_amount=stats.get('highest_bid_amount'),
+                last_bid_at=stats.get('last_bid_at'),
+            ))
+        Requirement.objects.bulk_update(
+            requirements, ['pending_bids_count', 'lowest_bid_amount', 'highest_bid_amount', 'last_bid_at'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requirement',
+            name='highest_bid_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='requirement',
+            name='last_bid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='requirement',
+            name='lowest_bid_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='requirement',
+            name='pending_bids_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        # Existing requirements already have bids; fill the new columns from them
+        migrations.RunPython(backfill_bid_stats, migrations.RunPython.noop),
+    ]
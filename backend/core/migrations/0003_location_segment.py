@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_requirement_bid_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_segments', to='core.order')),
+            ],
+            options={
+                'ordering': ['-end_time'],
+                'indexes': [models.Index(fields=['order', 'end_time'], name='core_locati_order_i_7c6456_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:44
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_location_segment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='location',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Time the fix was recorded'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:56
+
+import math
+from decimal import Decimal
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(max(a, 0.0), 1.0)))
+
+
+def backfill_track_stats(apps, schema_editor):
+    # Frozen here rather than calling core.tracks, so later changes to the track
+    # store don't change this migration. Segments were added in this same
+    # release (0003) and are still empty, so every fix is a Location row.
+    Order = apps.get_model('core', 'Order')
+    Location = apps.get_model('core', 'Location')
+    fields = ['fix_count', 'first_fix_at', 'last_fix_at', 'last_latitude', 'last_longitude', 'distance_travelled']
+    orders = []
+    order = previous = None
+    distance = 0.0
+
+    def finish():
+        order.distance_travelled = Decimal(str(distance)).quantize(Decimal('0.1'))
+        orders.append(order)
+        if len(orders) >= BATCH_SIZE:
+            Order.objects.bulk_update(orders, fields)
+            orders.clear()
+
+    rows = Location.objects.order_by('order_id', 'timestamp', 'id').values_list(
+        'order_id', 'timestamp', 'latitude', 'longitude'
+    )
+    for order_id, timestamp, latitude, longitude in rows.iterator(chunk_size=2000):
+        if order is None or order.id != order_id:
+            if order is not None:
+                finish()
+            order = Order(id=order_id, fix_count=0, first_fix_at=timestamp)
+            previous, distance = None, 0.0
+        if previous is not None:
+            distance += haversine_m(float(previous[0]), float(previous[1]), float(latitude), float(longitude))
+        previous = (latitude, longitude)
+        order.fix_count += 1
+        order.last_fix_at = timestamp
+        order.last_latitude = latitude
+        order.last_longitude = longitude
+    if order is not None:
+        finish()
+    Order.objects.bulk_update(orders, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_location_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='distance_travelled',
+            field=models.DecimalField(decimal_places=1, default=0, help_text='Meters along the recorded fixes', max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='first_fix_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='fix_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='last_fix_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='last_latitude',
+            field=models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='last_longitude',
+            field=models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True),
+        ),
+        # Existing orders already have fixes; summarize them into the new columns
+        migrations.RunPython(backfill_track_stats, migrations.RunPython.noop),
+    ]
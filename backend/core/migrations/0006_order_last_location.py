@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:00
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def _decimal(value, places):
+    return None if value is None else str(Decimal(value).quantize(Decimal(1).scaleb(-places)))
+
+
+def _datetime(value):
+    value = timezone.localtime(value).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def backfill_last_location(apps, schema_editor):
+    # The newest fix serialized the way LocationSerializer did at this
+    # migration, frozen here so later serializer changes don't alter it
+    Order = apps.get_model('core', 'Order')
+    Location = apps.get_model('core', 'Location')
+    newest = Location.objects.filter(order_id=OuterRef('pk')).order_by('-timestamp', '-id').values('id')[:1]
+    location_ids = list(
+        Order.objects.annotate(newest_id=Subquery(newest)).filter(newest_id__isnull=False)
+        .order_by('id').values_list('newest_id', flat=True)
+    )
+    for start in range(0, len(location_ids), BATCH_SIZE):
+        orders = []
+        for location in Location.objects.filter(id__in=location_ids[start:start + BATCH_SIZE]).select_related('order'):
+            orders.append(Order(id=location.order_id, last_location={
+                'id': location.id,
+                'order': location.order_id,
+                'order_number': location.order.order_number,
+                'latitude': _decimal(location.latitude, 7),
+                'longitude': _decimal(location.longitude, 7),
+                'address': location.address,
+                'speed': _decimal(location.speed, 2),
+                'heading': _decimal(location.heading, 2),
+                'altitude': _decimal(location.altitude, 2),
+                'accuracy': _decimal(location.accuracy, 2),
+                'timestamp': _datetime(location.timestamp),
+            }))
+        Order.objects.bulk_update(orders, ['last_location'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_order_track_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='last_location',
+            field=models.JSONField(blank=True, help_text='Serialized newest fix', null=True),
+        ),
+        # Existing orders already have fixes; copy the newest onto each
+        migrations.RunPython(backfill_last_location, migrations.RunPython.noop),
+    ]
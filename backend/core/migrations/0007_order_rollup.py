@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_order_last_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('admin', 'Admin'), ('user', 'Truck Owner')], max_length=10)),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('pickup_scheduled', 'Pickup Scheduled'), ('loaded', 'Loaded'), ('on_the_way', 'On The Way'), ('delivered', 'Delivered'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, help_text='Sum of accepted bid amounts', max_digits=14)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='orderrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'role', 'day', 'status'), name='unique_order_rollup'),
+        ),
+    ]
@@ -0,0 +1,108 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+# The SQL lives here, frozen with the migration. core.search's post_migrate repair
+# reruns SQLITE_INSTALL when SQLite has dropped the triggers.
+
+POSTGRESQL_INSTALL = [
+    """
+    ALTER TABLE core_requirement ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple'::regconfig, coalesce(from_location, '') || ' ' || coalesce(to_location, '')), 'A') ||
+        setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'B') ||
+        setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS core_requirement_search_idx ON core_requirement USING gin (search_vector)',
+    # icontains compiles to UPPER(column::text) LIKE UPPER(%s)
+    'CREATE INDEX IF NOT EXISTS core_requirement_from_trgm_idx '
+    'ON core_requirement USING gin (UPPER(from_location::text) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS core_requirement_to_trgm_idx '
+    'ON core_requirement USING gin (UPPER(to_location::text) gin_trgm_ops)',
+]
+
+POSTGRESQL_UNINSTALL = [
+    'DROP INDEX IF EXISTS core_requirement_to_trgm_idx',
+    'DROP INDEX IF EXISTS core_requirement_from_trgm_idx',
+    'DROP INDEX IF EXISTS core_requirement_search_idx',
+    'ALTER TABLE core_requirement DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_requirement_fts USING fts5(
+        title, description, from_location, to_location,
+        content='core_requirement', content_rowid='id', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_requirement_fts_insert AFTER INSERT ON core_requirement BEGIN
+        INSERT INTO core_requirement_fts(rowid, title, description, from_location, to_location)
+        VALUES (new.id, new.title, new.description, new.from_location, new.to_location);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_requirement_fts_delete AFTER DELETE ON core_requirement BEGIN
+        INSERT INTO core_requirement_fts(core_requirement_fts, rowid, title, description, from_location, to_location)
+        VALUES ('delete', old.id, old.title, old.description, old.from_location, old.to_location);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_requirement_fts_update
+    AFTER UPDATE OF title, description, from_location, to_location ON core_requirement BEGIN
+        INSERT INTO core_requirement_fts(core_requirement_fts, rowid, title, description, from_location, to_location)
+        VALUES ('delete', old.id, old.title, old.description, old.from_location, old.to_location);
+        INSERT INTO core_requirement_fts(rowid, title, description, from_location, to_location)
+        VALUES (new.id, new.title, new.description, new.from_location, new.to_location);
+    END
+    """,
+    "INSERT INTO core_requirement_fts(core_requirement_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS core_requirement_fts_insert',
+    'DROP TRIGGER IF EXISTS core_requirement_fts_delete',
+    'DROP TRIGGER IF EXISTS core_requirement_fts_update',
+    'DROP TABLE IF EXISTS core_requirement_fts',
+]
+
+
+class CreateTrigramExtension(TrigramExtension):
+    """pg_trgm is kept when the migration is reversed; other schemas may use it.
+
+    Django 4.2's CreateExtension also queries pg_extension on every database
+    when reversed, which fails on SQLite.
+    """
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        pass
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql, params=None)
+
+
+def install(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRESQL_INSTALL, 'sqlite': SQLITE_INSTALL})
+
+
+def uninstall(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRESQL_UNINSTALL, 'sqlite': SQLITE_UNINSTALL})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_order_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='requirement',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='core_requir_status_dc9d63_idx'),
+        ),
+        # Needs a role allowed to create extensions (superuser, or trusted extensions on PostgreSQL 13+),
+        # unless pg_trgm is already installed. Does nothing on other databases.
+        CreateTrigramExtension(),
+        migrations.RunPython(install, uninstall),
+    ]
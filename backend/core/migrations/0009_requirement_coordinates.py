@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_requirement_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requirement',
+            name='from_latitude',
+            field=models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='requirement',
+            name='from_longitude',
+            field=models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='requirement',
+            name='to_latitude',
+            field=models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='requirement',
+            name='to_longitude',
+            field=models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='requirement',
+            index=models.Index(fields=['from_latitude', 'from_longitude'], name='core_requir_from_la_46b9cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requirement',
+            index=models.Index(fields=['to_latitude', 'to_longitude'], name='core_requir_to_lati_080d8e_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_requirement_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TruckMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(help_text='1 for the best match of the truck')),
+                ('score', models.FloatField()),
+                ('distance_km', models.FloatField(blank=True, help_text='From the truck to the pickup', null=True)),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+                ('requirement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='truck_matches', to='core.requirement')),
+                ('truck', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='core.truck')),
+            ],
+            options={
+                'ordering': ['truck', 'rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='truckmatch',
+            constraint=models.UniqueConstraint(fields=('truck', 'requirement'), name='unique_truck_match'),
+        ),
+    ]
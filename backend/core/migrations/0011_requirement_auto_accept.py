@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_truck_match'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requirement',
+            name='auto_accept',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('bid_placed', 'Bid Placed'), ('bid_accepted', 'Bid Accepted'), ('bid_rejected', 'Bid Rejected'), ('order_status_changed', 'Order Status Changed'), ('new_requirement', 'New Requirement'), ('bidding_closed', 'Bidding Closed'), ('payment_received', 'Payment Received'), ('system', 'System Notification')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='requirement',
+            index=models.Index(fields=['status', 'bidding_end_date'], name='core_requir_status_eb7c37_idx'),
+        ),
+    ]
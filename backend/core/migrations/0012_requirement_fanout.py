@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_requirement_auto_accept'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requirement',
+            name='fanout_cursor',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='requirement',
+            index=models.Index(condition=models.Q(('fanout_cursor__isnull', False)), fields=['fanout_cursor'], name='core_requirement_fanout_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='truck',
+            index=models.Index(fields=['truck_type', 'user'], name='core_truck_truck_t_9d65b2_idx'),
+        ),
+    ]
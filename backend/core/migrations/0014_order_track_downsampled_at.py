@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_notification_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='track_downsampled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
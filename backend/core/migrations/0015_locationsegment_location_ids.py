@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_order_track_downsampled_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locationsegment',
+            name='location_ids',
+            field=models.BinaryField(default=b'', help_text='Delta-encoded ids of the packed rows; empty if not kept'),
+        ),
+    ]
@@ -63,6 +63,8 @@ class Truck(models.Model):
         indexes = [
             models.Index(fields=['user', 'status']),
             models.Index(fields=['truck_type', 'status']),
+            # Owners of trucks of a type in user order, for new requirement notifications
+            models.Index(fields=['truck_type', 'user']),
         ]
 
     def __str__(self):
@@ -117,12 +119,40 @@ class Requirement(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     bidding_end_date = models.DateTimeField()
+    # Assign the lowest pending bid within budget_max when bidding ends (core/auctions.py)
+    auto_accept = models.BooleanField(default=False)
+
+    # Denormalized bid aggregates, kept in sync by refresh_bid_stats()
+    pending_bids_count = models.PositiveIntegerField(default=0)
+    lowest_bid_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    highest_bid_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    last_bid_at = models.DateTimeField(null=True, blank=True)
+
+    # Geocoded from the gazetteer (core/gazetteer.py); null when the location is not a known city
+    from_latitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    from_longitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    to_latitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    to_longitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+
+    # new_requirement notifications still to send (core/fanout.py): the last owner id notified,
+    # 0 before the first, null once every matching owner has been notified
+    fanout_cursor = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         indexes = [
             models.Index(fields=['status', 'pickup_date']),
+            # Open requirements whose bidding has ended, for the auction closer
+            models.Index(fields=['status', 'bidding_end_date']),
             models.Index(fields=['truck_type', 'status']),
             models.Index(fields=['admin', 'status']),
+            # Newest open requirements first, for search and the load board
+            models.Index(fields=['status', 'created_at', 'id']),
+            # Bounding-box lookups of pickups near a point
+            models.Index(fields=['from_latitude', 'from_longitude']),
+            models.Index(fields=['to_latitude', 'to_longitude']),
+            # Requirements whose notifications are still being sent
+            models.Index(fields=['fanout_cursor'], condition=models.Q(fanout_cursor__isnull=False),
+                         name='core_requirement_fanout_idx'),
         ]
         ordering = ['-created_at']
 
@@ -133,6 +163,32 @@ class Requirement(models.Model):
     def is_bidding_open(self):
         return self.status == 'open' and self.bidding_end_date > timezone.now()
 
+    BID_STATS_FIELDS = ['pending_bids_count', 'lowest_bid_amount', 'highest_bid_amount', 'last_bid_at']
+
+    @staticmethod
+    def bid_stats_aggregates():
+        """Aggregate expressions used to compute the denormalized bid stats"""
+        pending = models.Q(status='pending')
+        return {
+            'pending_bids_count': models.Count('id', filter=pending),
+            'lowest_bid_amount': models.Min('amount', filter=pending),
+            'highest_bid_amount': models.Max('amount', filter=pending),
+            'last_bid_at': models.Max('created_at'),
+        }
+
+    def refresh_bid_stats(self, save=True):
+        """Recompute the denormalized bid stats from the bids table.
+
+        Call inside the transaction that changed the bids so the stored
+        values never drift from the rows they summarize.
+        """
+        stats = Bid.objects.filter(requirement_id=self.pk).aggregate(**self.bid_stats_aggregates())
+        for field in self.BID_STATS_FIELDS:
+            setattr(self, field, stats[field])
+        if save:
+            self.save(update_fields=self.BID_STATS_FIELDS)
+        return stats
+
 
 class Bid(models.Model):
     """Bid placed by truck owners on requirements"""
@@ -206,9 +262,26 @@ class Order(models.Model):
         help_text="Rating out of 5"
     )
     review = models.TextField(blank=True, null=True)
+    # Denormalized track summary, maintained by core.tracks.record_fixes
+    fix_count = models.PositiveIntegerField(default=0)
+    first_fix_at = models.DateTimeField(null=True, blank=True)
+    last_fix_at = models.DateTimeField(null=True, blank=True)
+    last_latitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    last_longitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    distance_travelled = models.DecimalField(
+        max_digits=12, decimal_places=1, default=0, help_text="Meters along the recorded fixes"
+    )
+    last_location = models.JSONField(null=True, blank=True, help_text="Serialized newest fix")
+    # Set once core.tracks.downsample_order has thinned the finished track
+    track_downsampled_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    TRACK_STATS_FIELDS = [
+        'fix_count', 'first_fix_at', 'last_fix_at', 'last_latitude', 'last_longitude', 'distance_travelled',
+        'last_location',
+    ]
+
     class Meta:
         indexes = [
             models.Index(fields=['user', 'status']),
@@ -237,7 +310,7 @@ class Location(models.Model):
     heading = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, help_text="Direction in degrees")
     altitude = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, help_text="Altitude in meters")
     accuracy = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, help_text="GPS accuracy in meters")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, help_text="Time the fix was recorded")
 
     class Meta:
         indexes = [
@@ -249,6 +322,81 @@ class Location(models.Model):
         return f"Location for {self.order.order_number} at {self.timestamp}"
 
 
+class LocationSegment(models.Model):
+    """Packed run of consecutive location fixes for an order.
+
+    ``data`` holds the fixes delta-encoded by core.tracks; the unpacked tail
+    of a track still lives in Location rows. ``location_ids`` keeps the ids
+    of the rows the fixes were packed from, so a fix keeps its place in
+    ``(timestamp, id)`` order once packed.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='location_segments')
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    point_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    location_ids = models.BinaryField(default=b'', help_text="Delta-encoded ids of the packed rows; empty if not kept")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'end_time']),
+        ]
+        ordering = ['-end_time']
+
+    def __str__(self):
+        return f"{self.point_count} fixes for order {self.order_id} from {self.start_time} to {self.end_time}"
+
+
+class OrderRollup(models.Model):
+    """Daily order totals for one admin or truck owner and one order status.
+
+    Orders count on the day they were created, under their current status.
+    Maintained by core.rollups; ``manage.py rebuild_order_rollups`` recomputes
+    the table from the orders.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_rollups')
+    role = models.CharField(max_length=10, choices=User.ROLE_CHOICES)
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Sum of accepted bid amounts")
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'role', 'day', 'status'], name='unique_order_rollup'),
+        ]
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"{self.order_count} {self.status} orders for user {self.user_id} ({self.role}) on {self.day}"
+
+
+class TruckMatch(models.Model):
+    """One of the best open requirements for a truck, as scored by core.matching.
+
+    ``manage.py match_trucks`` replaces the whole table; rows are not kept in
+    sync with requirement or truck changes in between.
+    """
+    truck = models.ForeignKey(Truck, on_delete=models.CASCADE, related_name='matches')
+    requirement = models.ForeignKey(Requirement, on_delete=models.CASCADE, related_name='truck_matches')
+    rank = models.PositiveSmallIntegerField(help_text="1 for the best match of the truck")
+    score = models.FloatField()
+    distance_km = models.FloatField(null=True, blank=True, help_text="From the truck to the pickup")
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['truck', 'requirement'], name='unique_truck_match'),
+        ]
+        ordering = ['truck', 'rank']
+
+    def __str__(self):
+        return f"Requirement {self.requirement_id} for truck {self.truck_id} (#{self.rank}, {self.score:.3f})"
+
+
 class Notification(models.Model):
     """Notification system for users"""
     TYPE_CHOICES = [
@@ -257,6 +405,7 @@ class Notification(models.Model):
         ('bid_rejected', 'Bid Rejected'),
         ('order_status_changed', 'Order Status Changed'),
         ('new_requirement', 'New Requirement'),
+        ('bidding_closed', 'Bidding Closed'),
         ('payment_received', 'Payment Received'),
         ('system', 'System Notification'),
     ]
@@ -282,3 +431,13 @@ class Notification(models.Model):
 
     def __str__(self):
         return f"Notification for {self.user.username}: {self.title}"
+
+
+class NotificationArchive(models.Model):
+    """How many of a user's read notifications were purged by ``manage.py purge_notifications``"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_archive')
+    archived_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.archived_count} archived notifications for user {self.user_id}"
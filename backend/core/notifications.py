@@ -0,0 +1,160 @@
+"""Creating notifications and pushing them to the user's open sockets.
+
+Every notification is written through ``notify`` or ``notify_many``. Once
+the transaction commits, each one is sent to the ``notifications_<user id>``
+group that NotificationConsumer joins, together with the user's new unread
+count. A failure to reach the channel layer is logged and otherwise
+ignored, since the rows are already saved and the REST API still lists them.
+
+Read notifications past NOTIFICATION_RETENTION_DAYS are deleted by
+``purge_read`` (``manage.py purge_notifications``). It adds them to the
+user's NotificationArchive count in the same transaction, so a user's
+total stays known while the table and its indexes stop growing.
+"""
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.utils import timezone
+
+from .models import User, Notification, NotificationArchive
+
+logger = logging.getLogger(__name__)
+
+
+def group_name(user_id):
+    return f'notifications_{user_id}'
+
+
+def unread_counts(user_ids):
+    """Unread notification count per user id"""
+    counts = dict.fromkeys(user_ids, 0)
+    rows = (
+        Notification.objects.filter(user_id__in=counts, is_read=False)
+        .values('user_id').annotate(unread=Count('id')).values_list('user_id', 'unread').order_by()
+    )
+    counts.update(rows)
+    return counts
+
+
+def notify(user, title, message, notification_type, **related):
+    """Create one notification for ``user`` and push it once the transaction commits"""
+    notification = Notification.objects.create(
+        user=user, title=title, message=message, notification_type=notification_type, **related
+    )
+    push([notification])
+    return notification
+
+
+def notify_many(notifications):
+    """Bulk-create unsaved Notification instances and push them once the transaction commits"""
+    notifications = Notification.objects.bulk_create(notifications)
+    push(notifications)
+    return notifications
+
+
+def push(notifications):
+    """Send saved notifications to their users' sockets after the current transaction commits"""
+    if notifications:
+        transaction.on_commit(lambda: _send(notifications))
+
+
+def push_unread_count(user_id):
+    """Tell a user's sockets the unread count changed, e.g. after marking notifications read"""
+    transaction.on_commit(lambda: _send([], user_ids=[user_id]))
+
+
+def _send(notifications, user_ids=()):
+    from .serializers import NotificationSerializer
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    counts = unread_counts({notification.user_id for notification in notifications} | set(user_ids))
+    # One list serializer builds its fields once, instead of once per notification
+    messages = [
+        (group_name(notification.user_id), {
+            'type': 'notification_created',
+            'data': dict(data),
+            'unread_count': counts[notification.user_id],
+        })
+        for notification, data in zip(notifications, NotificationSerializer(notifications, many=True).data)
+    ]
+    messages += [
+        (group_name(user_id), {'type': 'unread_count', 'unread_count': counts[user_id]})
+        for user_id in user_ids
+    ]
+
+    async def send_all():
+        for group, message in messages:
+            await channel_layer.group_send(group, message)
+
+    try:
+        async_to_sync(send_all)()
+    except Exception:
+        logger.exception('Could not push %d notifications', len(notifications))
+
+
+def mark_all_read(user_id, chunk_size):
+    """Mark a user's unread notifications read, ``chunk_size`` per UPDATE; returns how many"""
+    unread = Notification.objects.filter(user_id=user_id, is_read=False).order_by().values_list('id', flat=True)
+    updated = 0
+    while True:
+        ids = list(unread[:chunk_size])
+        if ids:
+            updated += Notification.objects.filter(id__in=ids).update(is_read=True)
+        if len(ids) < chunk_size:
+            return updated
+
+
+def _archive(user_ids):
+    """Add purged notifications to their users' archive counts"""
+    counts = Counter(user_ids)
+    existing = set(NotificationArchive.objects.filter(user_id__in=counts).values_list('user_id', flat=True))
+    if existing:
+        NotificationArchive.objects.filter(user_id__in=existing).update(
+            archived_count=F('archived_count') + Case(
+                *(When(user_id=user_id, then=Value(counts[user_id])) for user_id in existing), default=Value(0)
+            ),
+            updated_at=timezone.now(),
+        )
+    NotificationArchive.objects.bulk_create([
+        NotificationArchive(user_id=user_id, archived_count=count)
+        for user_id, count in counts.items() if user_id not in existing
+    ])
+
+
+def purge_read(older_than, batch_size, pause=0, users_per_batch=500, log=None):
+    """Delete read notifications created before ``older_than``; returns how many.
+
+    Users are taken ``users_per_batch`` at a time, so every lookup goes
+    through the (user, created_at) index. At most ``batch_size`` rows are
+    deleted per transaction, with ``pause`` seconds between transactions.
+    """
+    purged = 0
+    last_user_id = 0
+    while True:
+        user_ids = list(
+            User.objects.filter(id__gt=last_user_id).order_by('id').values_list('id', flat=True)[:users_per_batch]
+        )
+        if not user_ids:
+            return purged
+        last_user_id = user_ids[-1]
+        expired = Notification.objects.filter(user_id__in=user_ids, created_at__lt=older_than, is_read=True)
+        while True:
+            rows = list(expired.order_by().values_list('id', 'user_id')[:batch_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                Notification.objects.filter(id__in=[row[0] for row in rows]).delete()
+                _archive(row[1] for row in rows)
+            purged += len(rows)
+            if log:
+                log(f'Purged {purged} notifications')
+            if len(rows) < batch_size:
+                break
+            time.sleep(pause)
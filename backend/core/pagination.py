@@ -0,0 +1,186 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .tracks import stream_key
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination on a ``(datetime, id)`` key given by ``ordering``.
+
+    The cursor holds the key of the last item returned and each page reads
+    ``page_size + 1`` items after it, however deep it is. Subclasses name
+    the key fields in ``ordering`` (all descending or all ascending) and
+    may override ``get_key``, ``order`` and ``after`` for sources that are
+    not plain querysets.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        queryset = self.order(queryset)
+        if self.cursor is not None:
+            queryset = self.after(queryset, self.cursor)
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_cursor = self.get_key(page[-1]) if self.has_next else None
+        return page
+
+    def get_key(self, item):
+        return tuple(getattr(item, field.lstrip('-')) for field in self.ordering)
+
+    def order(self, queryset):
+        return queryset.order_by(*self.ordering)
+
+    def after(self, queryset, cursor):
+        time_field, id_field = (field.lstrip('-') for field in self.ordering)
+        moment, item_id = cursor
+        lookup = 'lt' if self.ordering[0].startswith('-') else 'gt'
+        return queryset.filter(
+            Q(**{f'{time_field}__{lookup}': moment}) | Q(**{time_field: moment, f'{id_field}__{lookup}': item_id})
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            moment, item_id = b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            moment = parse_datetime(moment)
+            item_id = int(item_id)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if moment is None or item_id < 0:
+            raise NotFound(self.invalid_cursor_message)
+        return moment, item_id
+
+    def encode_cursor(self, cursor):
+        moment, item_id = cursor
+        encoded = b64encode(f'{moment.isoformat()}|{item_id}'.encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.next_cursor)
+
+
+class LocationCursorPagination(KeysetPagination):
+    """Keyset pagination of a TrackHistory on ``(timestamp, id)``.
+
+    Packed fixes keep the id of their row, so the key survives packing and
+    downsampling between requests. No total count is taken.
+
+    Oldest-first pages also carry ``last``, a link to the fixes after the
+    last one returned, even on the final page; polling it tails a live track
+    without reading any fix twice. An empty page hands back the cursor it
+    was given.
+    """
+    max_page_size = 1000
+
+    def paginate_queryset(self, history, request, view=None):
+        page = super().paginate_queryset(history, request, view)
+        self.last_cursor = None
+        if not history.descending:
+            self.last_cursor = self.get_key(page[-1]) if page else self.cursor
+        return page
+
+    def get_key(self, location):
+        return stream_key(location)
+
+    def order(self, history):
+        # A TrackHistory is already in stream order
+        return history
+
+    def after(self, history, cursor):
+        return history.after(*cursor)
+
+    def get_last_link(self):
+        if self.last_cursor is None:
+            return None
+        return self.encode_cursor(self.last_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('last', self.get_last_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'last': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class RequirementCursorPagination(KeysetPagination):
+    """Keyset pagination of requirements on ``(created_at, id)``, newest first.
+
+    Instead of an exact count, the first page carries ``count``: exact up to
+    ``count_cap`` rows, beyond that the planner's estimate (PostgreSQL) or
+    the cap itself, flagged by ``count_is_estimate``. Later pages skip the
+    count and carry None for both.
+    """
+    page_size = 20
+    count_cap = 1000
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = super().paginate_queryset(queryset, request, view)
+        self.count, self.count_is_estimate = self.estimate_count(queryset) if self.cursor is None else (None, None)
+        return page
+
+    def estimate_count(self, queryset):
+        """``(count, is_estimate)`` without counting more than ``count_cap`` rows"""
+        capped = queryset.order_by()[:self.count_cap + 1].count()
+        if capped <= self.count_cap:
+            return capped, False
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return max(int(plan[0]['Plan']['Plan Rows']), capped), True
+        return capped, True
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('count', self.count),
+            ('count_is_estimate', self.count_is_estimate),
+            ('results', data),
+        ])
@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .tracks import FIX_FIELDS, MAX_FIX_BYTES, decode_fixes
+
+
+class TrackParser(BaseParser):
+    """Parser for location fixes packed with core.tracks.encode_fixes.
+
+    Lets devices upload buffered fixes as a compact binary body instead of
+    JSON. Produces the same ``{'fixes': [...]}`` structure as the JSON body.
+    """
+    media_type = 'application/vnd.trucking.track'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        max_fixes = settings.LOCATION_BATCH_MAX_FIXES
+        # Header (version byte and count) plus the largest possible encoding of every fix
+        max_bytes = 11 + max_fixes * MAX_FIX_BYTES
+        data = stream.read(max_bytes + 1) if stream is not None else b''
+        if len(data) > max_bytes:
+            raise ParseError(f'Track payload larger than {max_bytes} bytes')
+        try:
+            fixes = decode_fixes(data, max_fixes=max_fixes)
+        except (ValueError, IndexError, OverflowError) as exc:
+            raise ParseError(f'Malformed track payload: {exc}')
+        return {'fixes': [dict(zip(FIX_FIELDS, fix)) for fix in fixes]}
@@ -0,0 +1,55 @@
+"""Requirements picking up near a point.
+
+Candidates are read through the (from_latitude, from_longitude) index with
+a bounding box around the search circle. Their great-circle distances are
+then computed in one NumPy pass, so the database never sorts by distance.
+Requirements without coordinates (see core/gazetteer.py) are never found.
+"""
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from . import gazetteer
+from .geo import bounding_box, haversine_m
+from .models import Order
+
+DEFAULT_RADIUS_KM = 50
+MAX_RADIUS_KM = 500
+
+
+def requirements_near(queryset, latitude, longitude, radius_km):
+    """Ids of the requirements in ``queryset`` picking up within ``radius_km``, and their distances in km.
+
+    Both are NumPy arrays, nearest first.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km * 1000)
+    rows = (
+        queryset.filter(from_latitude__range=(min_lat, max_lat), from_longitude__range=(min_lng, max_lng))
+        .annotate(lat=Cast('from_latitude', FloatField()), lng=Cast('from_longitude', FloatField()))
+        .values_list('id', 'lat', 'lng')
+        .order_by()
+    )
+    candidates = np.array(list(rows), dtype=float).reshape(-1, 3)
+    distances = haversine_m(latitude, longitude, candidates[:, 1], candidates[:, 2]) / 1000
+    inside = distances <= radius_km
+    ids, distances = candidates[inside, 0].astype(np.int64), distances[inside]
+    nearest_first = np.lexsort((ids, distances))
+    return ids[nearest_first], distances[nearest_first]
+
+
+def truck_position(truck):
+    """(latitude, longitude) of a truck, or None.
+
+    The last GPS fix of its orders if it has one, otherwise its
+    ``current_location`` geocoded.
+    """
+    last_fix = (
+        Order.objects.filter(truck=truck, last_latitude__isnull=False)
+        .order_by('-last_fix_at')
+        .values_list('last_latitude', 'last_longitude')
+        .first()
+    )
+    if last_fix:
+        return float(last_fix[0]), float(last_fix[1])
+    place = gazetteer.geocode(truck.current_location) if truck.current_location else None
+    return (place.latitude, place.longitude) if place else None
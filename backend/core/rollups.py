@@ -0,0 +1,242 @@
+"""Daily order rollups for trend charts.
+
+Every order adds one to the OrderRollup row of its admin and of its truck
+owner for the day it was created and its current status, together with its
+accepted bid amount and rating. Views that change an order or its
+accepted bid take its ``order_facts`` before and after the change and hand
+both to ``record_order_change``. Deleted orders, cascades included, are
+taken out by ``record_order_deleted`` from a post_delete signal.
+``rebuild_rollups`` recomputes the table from the orders. Timeseries only
+read the rollups.
+"""
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, DateField, F, Max, Min, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderRollup
+
+ADMIN = 'admin'
+TRUCK_OWNER = 'user'
+
+GRANULARITIES = ('day', 'week', 'month')
+REVENUE_STATUS = 'completed'  # Same as the dashboards: only completed orders earn
+
+OrderFacts = namedtuple('OrderFacts', 'admin_id owner_id day status amount rating')
+
+TOTAL_FIELDS = ('order_count', 'revenue', 'rating_sum', 'rating_count')
+
+
+def order_facts(order):
+    """What an order contributes to the rollups; needs its requirement and accepted bid"""
+    return OrderFacts(
+        admin_id=order.requirement.admin_id,
+        owner_id=order.user_id,
+        day=timezone.localdate(order.created_at),
+        status=order.status,
+        amount=order.accepted_bid.amount,
+        rating=order.rating,
+    )
+
+
+def _contributions(facts, sign):
+    totals = (
+        sign,
+        sign * facts.amount,
+        sign * (facts.rating or 0),
+        sign if facts.rating is not None else 0,
+    )
+    yield (facts.admin_id, ADMIN, facts.day, facts.status), totals
+    yield (facts.owner_id, TRUCK_OWNER, facts.day, facts.status), totals
+
+
+def record_order_change(before, after):
+    """Move an order's contribution from ``before`` to ``after``.
+
+    Either may be None for a created or deleted order. Call inside the
+    transaction that saved the order.
+    """
+    if before == after:
+        return
+    deltas = defaultdict(lambda: [0, Decimal('0'), 0, 0])
+    for facts, sign in ((before, -1), (after, 1)):
+        if facts is None:
+            continue
+        for key, totals in _contributions(facts, sign):
+            deltas[key] = [current + change for current, change in zip(deltas[key], totals)]
+
+    for key, totals in deltas.items():
+        if any(totals):
+            _add(key, totals)
+
+
+def record_order_deleted(order):
+    """Take a deleted order out of the rollups.
+
+    Also runs when a requirement, bid or user deletion cascades to the
+    order, inside that transaction. Rows already deleted with their user
+    are not recreated.
+    """
+    for key, totals in _contributions(order_facts(order), -1):
+        OrderRollup.objects.filter(**_lookup(key)).update(**_increments(totals))
+
+
+def _lookup(key):
+    user_id, role, day, status = key
+    return {'user_id': user_id, 'role': role, 'day': day, 'status': status}
+
+
+def _increments(totals):
+    return {field: F(field) + value for field, value in zip(TOTAL_FIELDS, totals)}
+
+
+def _add(key, totals):
+    lookup = _lookup(key)
+    increments = _increments(totals)
+    if OrderRollup.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            OrderRollup.objects.create(**lookup, **dict(zip(TOTAL_FIELDS, totals)))
+    except IntegrityError:
+        # Created by a concurrent transaction in the meantime
+        OrderRollup.objects.filter(**lookup).update(**increments)
+
+
+# Rebuild
+
+def rollup_orders(first_id, last_id):
+    """Rollup totals of the orders with ids in ``[first_id, last_id]``, keyed like OrderRollup"""
+    rows = (
+        Order.objects.filter(id__gte=first_id, id__lte=last_id)
+        .annotate(day=TruncDate('created_at'))
+        .values('requirement__admin_id', 'user_id', 'day', 'status')
+        .annotate(
+            order_count=Count('id'),
+            revenue=Sum('accepted_bid__amount'),
+            rating_sum=Sum('rating'),
+            rating_count=Count('rating'),
+        )
+        .order_by()
+    )
+    totals = defaultdict(lambda: [0, Decimal('0'), 0, 0])
+    for row in rows:
+        values = (row['order_count'], row['revenue'] or Decimal('0'), row['rating_sum'] or 0, row['rating_count'])
+        for key in ((row['requirement__admin_id'], ADMIN, row['day'], row['status']),
+                    (row['user_id'], TRUCK_OWNER, row['day'], row['status'])):
+            totals[key] = [current + value for current, value in zip(totals[key], values)]
+    return totals
+
+
+def _rollup_chunk(bounds):
+    try:
+        return rollup_orders(*bounds)
+    finally:
+        # Worker threads open their own connection
+        connection.close()
+
+
+def rebuild_rollups(chunk_size=10000, workers=1, log=None):
+    """Recompute every OrderRollup row from the orders and return the number of rows.
+
+    Orders are aggregated in id ranges of ``chunk_size``, on ``workers``
+    threads in parallel; the table is replaced in one transaction at the end.
+    Order changes made while it runs may be lost, so run it when order
+    statuses are not being updated, or run it twice.
+    """
+    bounds = Order.objects.aggregate(first=Min('id'), last=Max('id'))
+    chunks = []
+    if bounds['first'] is not None:
+        chunks = [
+            (first, min(first + chunk_size - 1, bounds['last']))
+            for first in range(bounds['first'], bounds['last'] + 1, chunk_size)
+        ]
+
+    totals = defaultdict(lambda: [0, Decimal('0'), 0, 0])
+
+    def merge(partial):
+        for key, values in partial.items():
+            totals[key] = [current + value for current, value in zip(totals[key], values)]
+
+    if workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for count, partial in enumerate(executor.map(_rollup_chunk, chunks), start=1):
+                merge(partial)
+                if log:
+                    log(f'Aggregated {count}/{len(chunks)} chunks')
+    else:
+        for count, chunk in enumerate(chunks, start=1):
+            merge(rollup_orders(*chunk))
+            if log:
+                log(f'Aggregated {count}/{len(chunks)} chunks')
+
+    with transaction.atomic():
+        OrderRollup.objects.all().delete()
+        OrderRollup.objects.bulk_create([
+            OrderRollup(user_id=user_id, role=role, day=day, status=status, **dict(zip(TOTAL_FIELDS, values)))
+            for (user_id, role, day, status), values in totals.items()
+        ], batch_size=1000)
+    return len(totals)
+
+
+# Timeseries
+
+def period_start(day, granularity):
+    """First day of the day, ISO week or month containing ``day``"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def timeseries(user_id, role, granularity, since, until):
+    """Order counts, revenue and average rating per period between two dates, oldest first.
+
+    Periods without orders are included with zeros.
+    """
+    rows = (
+        OrderRollup.objects.filter(user_id=user_id, role=role, day__gte=since, day__lte=until)
+        .annotate(period=Trunc('day', granularity, output_field=DateField()))
+        .values('period', 'status')
+        .annotate(
+            order_count=Sum('order_count'),
+            revenue=Sum('revenue'),
+            rating_sum=Sum('rating_sum'),
+            rating_count=Sum('rating_count'),
+        )
+        .order_by()
+    )
+    by_period = defaultdict(list)
+    for row in rows:
+        by_period[row['period']].append(row)
+
+    series = []
+    start = period_start(since, granularity)
+    while start <= until:
+        statuses = {row['status']: row['order_count'] for row in by_period[start] if row['order_count']}
+        earning = [row for row in by_period[start] if row['status'] == REVENUE_STATUS]
+        rating_sum = sum(row['rating_sum'] for row in earning)
+        rating_count = sum(row['rating_count'] for row in earning)
+        series.append({
+            'period': start,
+            'orders': sum(statuses.values()),
+            'statuses': statuses,
+            'revenue': sum((row['revenue'] for row in earning), Decimal('0')),
+            'average_rating': Decimal(rating_sum) / rating_count if rating_count else None,
+        })
+        start = _next_period(start, granularity)
+    return series
@@ -0,0 +1,61 @@
+"""In-process periodic jobs, run by ``manage.py run_scheduler``.
+
+Each job is a synchronous function called every ``interval`` seconds on an
+asyncio loop. Calls go through ``database_sync_to_async``, which closes
+stale database connections around them. A job that raises is logged and
+runs again on its next tick; a job still running when its next tick comes
+is not started twice.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    name: str
+    interval: float
+    function: Callable[[], object]
+
+
+def default_jobs():
+    from . import auctions, fanout
+
+    return [
+        Job(
+            'close_expired_auctions',
+            settings.AUCTION_CLOSE_INTERVAL,
+            lambda: auctions.close_expired_auctions(batch_size=settings.AUCTION_CLOSE_BATCH_SIZE),
+        ),
+        Job('run_pending_fanouts', settings.REQUIREMENT_FANOUT_INTERVAL, fanout.run_pending_fanouts),
+    ]
+
+
+async def run_job(job):
+    """Run ``job`` once; returns its result, or None when it failed"""
+    started = time.monotonic()
+    try:
+        result = await database_sync_to_async(job.function)()
+    except Exception:
+        logger.exception('Scheduled job %s failed', job.name)
+        return None
+    logger.info('Scheduled job %s returned %r in %.2fs', job.name, result, time.monotonic() - started)
+    return result
+
+
+async def _loop(job):
+    while True:
+        started = time.monotonic()
+        await run_job(job)
+        await asyncio.sleep(max(job.interval - (time.monotonic() - started), 0))
+
+
+async def run_forever(jobs):
+    await asyncio.gather(*(_loop(job) for job in jobs))
@@ -0,0 +1,161 @@
+"""Full-text search over requirements.
+
+PostgreSQL keeps a generated ``search_vector`` tsvector column on
+core_requirement with a GIN index. It also keeps trigram indexes that serve
+the ``from_location``/``to_location`` substring filters. SQLite keeps an
+FTS5 table, core_requirement_fts, which triggers keep in sync. Neither is
+part of the model; migration 0008 creates them. ``repair_search_index``
+runs after every migrate and reruns that migration's SQLite statements
+when a trigger is missing, because SQLite drops a table's triggers when
+Django rebuilds the table. Other databases fall back to ``icontains``.
+
+Every word of the search text has to match the start of a word in the
+title, description or locations. Results are ranked with location matches
+weighted highest, then the title, then the description.
+"""
+import hashlib
+import re
+from importlib import import_module
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+WORD_RE = re.compile(r'[^\W_]+')
+MAX_TERMS = 8
+
+FTS_TABLE = 'core_requirement_fts'
+FTS_TRIGGERS = ('core_requirement_fts_insert', 'core_requirement_fts_delete', 'core_requirement_fts_update')
+
+
+def install_search_index(db_connection):
+    """Create the SQLite FTS table and its triggers if any trigger is missing; idempotent"""
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)", FTS_TRIGGERS
+        )
+        if cursor.fetchone()[0] == len(FTS_TRIGGERS):
+            return
+        # The migration's statements end with a rebuild, which indexes rows
+        # written while the triggers were missing
+        migration = import_module('core.migrations.0008_requirement_search_index')
+        for sql in migration.SQLITE_INSTALL:
+            cursor.execute(sql)
+
+
+def repair_search_index(db_connection):
+    """Put back SQLite triggers dropped by a table rebuild, if the search index was installed"""
+    if db_connection.vendor != 'sqlite' or FTS_TABLE not in db_connection.introspection.table_names():
+        return
+    install_search_index(db_connection)
+
+
+def search_terms(text):
+    """Lowercased words of a search text, at most MAX_TERMS"""
+    return WORD_RE.findall(text.lower())[:MAX_TERMS]
+
+
+def _tsquery(terms):
+    return ' & '.join(f"'{term}':*" for term in terms)
+
+
+def _fts_match(terms):
+    return ' AND '.join(f'"{term}"*' for term in terms)
+
+
+def _fallback_condition(terms):
+    condition = Q()
+    for term in terms:
+        condition &= (
+            Q(title__icontains=term) | Q(description__icontains=term) |
+            Q(from_location__icontains=term) | Q(to_location__icontains=term)
+        )
+    return condition
+
+
+def match_requirements(queryset, text):
+    """Filter ``queryset`` to requirements matching ``text``, without ranking them"""
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        return queryset.filter(RawSQL(
+            f"{table}.search_vector @@ to_tsquery('simple', %s)", [_tsquery(terms)], output_field=BooleanField()
+        ))
+    if connection.vendor == 'sqlite':
+        return queryset.filter(RawSQL(
+            f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)',
+            [_fts_match(terms)], output_field=BooleanField(),
+        ))
+    return queryset.filter(_fallback_condition(terms))
+
+
+def count_matches(queryset, text, limit):
+    """Number of requirements in ``queryset`` matching ``text``, counting at most ``limit``"""
+    return match_requirements(queryset.order_by(), text)[:limit].count()
+
+
+def search_requirements(queryset, text):
+    """Filter ``queryset`` to requirements matching ``text``, best match first.
+
+    Ranking costs a pass over every match, so a search matching more than
+    SEARCH_RANK_MAX_MATCHES requirements is returned newest first instead.
+    Text without any words leaves the queryset as it is.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return queryset.filter(_fallback_condition(terms))
+
+    max_matches = settings.SEARCH_RANK_MAX_MATCHES
+    if count_matches(queryset, text, max_matches + 1) > max_matches:
+        return match_requirements(queryset, text).order_by('-created_at', '-id')
+
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        queryset = match_requirements(queryset, text).annotate(search_rank=RawSQL(
+            f"ts_rank({table}.search_vector, to_tsquery('simple', %s))", [_tsquery(terms)], output_field=FloatField()
+        ))
+    else:
+        # Joined, so bm25 comes from the one MATCH scan. The unary + keeps
+        # SQLite from probing the FTS table once per requirement row.
+        # bm25 is lower for better matches; column weights follow the declaration order.
+        queryset = queryset.extra(
+            select={'search_rank': f'-bm25({FTS_TABLE}, 2.0, 1.0, 4.0, 4.0)'},
+            tables=[FTS_TABLE],
+            where=[f'{table}.id = +{FTS_TABLE}.rowid', f'{FTS_TABLE} MATCH %s'],
+            params=[_fts_match(terms)],
+        )
+    return queryset.order_by('-search_rank', '-created_at', '-id')
+
+
+# First-page cache of keyset searches
+
+VERSION_KEY = 'requirement_search:version'
+
+
+def first_page_cache_key(params):
+    """Cache key of a first page for the given query parameters, under the current version"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    filters = sorted((key, value) for key, value in params.items() if key != 'cursor')
+    digest = hashlib.sha1(urlencode(filters).encode()).hexdigest()
+    return f'requirement_search:{version}:{digest}'
+
+
+def invalidate_search_cache():
+    """Retire every cached first page, once the current transaction commits"""
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 1, timeout=None)
+    transaction.on_commit(bump)
@@ -1,8 +1,15 @@
+from datetime import timedelta
+from urllib.parse import urlencode
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from .models import User, Truck, Requirement, Bid, Order, Location, Notification
+from django.urls import reverse
+from django.utils import timezone
+from .models import User, Truck, Requirement, Bid, Order, Location, TruckMatch, Notification
+from .simplify import simplify_track
+from .tracks import recent_locations
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -117,7 +124,7 @@ class RequirementSerializer(serializers.ModelSerializer):
     truck_type_display = serializers.CharField(source='get_truck_type_display', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     is_bidding_open = serializers.BooleanField(read_only=True)
-    bids_count = serializers.SerializerMethodField()
+    bids_count = serializers.IntegerField(source='pending_bids_count', read_only=True)
     
     class Meta:
         model = Requirement
@@ -126,12 +133,21 @@ class RequirementSerializer(serializers.ModelSerializer):
                  'truck_type_display', 'from_location', 'to_location', 
                  'pickup_date', 'delivery_date', 'budget_min', 'budget_max',
                  'status', 'status_display', 'special_instructions', 
-                 'is_active', 'bidding_end_date', 'is_bidding_open',
-                 'bids_count', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'admin', 'created_at', 'updated_at']
+                 'is_active', 'bidding_end_date', 'auto_accept', 'is_bidding_open',
+                 'bids_count', 'lowest_bid_amount', 'highest_bid_amount',
+                 'last_bid_at', 'from_latitude', 'from_longitude',
+                 'to_latitude', 'to_longitude', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'admin', 'lowest_bid_amount', 'highest_bid_amount',
+                          'last_bid_at', 'from_latitude', 'from_longitude',
+                          'to_latitude', 'to_longitude', 'created_at', 'updated_at']
+
+
+class NearbyRequirementSerializer(RequirementSerializer):
+    """Requirement with the distance from the search point to its pickup"""
+    distance_km = serializers.FloatField(read_only=True)
     
-    def get_bids_count(self, obj):
-        return obj.bids.filter(status='pending').count()
+    class Meta(RequirementSerializer.Meta):
+        fields = RequirementSerializer.Meta.fields + ['distance_km']
 
 
 class BidSerializer(serializers.ModelSerializer):
@@ -201,6 +217,7 @@ class OrderSerializer(serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     payment_status_display = serializers.CharField(source='get_payment_status_display', read_only=True)
     bid_amount = serializers.DecimalField(source='accepted_bid.amount', max_digits=10, decimal_places=2, read_only=True)
+    current_location = serializers.JSONField(source='last_location', read_only=True)
     
     class Meta:
         model = Order
@@ -211,7 +228,7 @@ class OrderSerializer(serializers.ModelSerializer):
                  'actual_pickup_time', 'actual_delivery_time', 
                  'estimated_delivery_time', 'driver_name', 'driver_phone',
                  'driver_license', 'notes', 'rating', 'review',
-                 'created_at', 'updated_at']
+                 'current_location', 'created_at', 'updated_at']
         read_only_fields = ['id', 'order_number', 'requirement', 'user', 
                           'truck', 'accepted_bid', 'created_at', 'updated_at']
 
@@ -234,6 +251,26 @@ class LocationSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'timestamp']
 
 
+class LocationFixSerializer(serializers.ModelSerializer):
+    """Serializer for a single fix in a batch location upload"""
+    
+    class Meta:
+        model = Location
+        fields = ['latitude', 'longitude', 'address', 'speed', 'heading', 
+                 'altitude', 'accuracy', 'timestamp']
+        extra_kwargs = {'timestamp': {'required': False}}
+    
+    def validate_timestamp(self, value):
+        if value > timezone.now() + timedelta(seconds=settings.LOCATION_MAX_CLOCK_SKEW_SECONDS):
+            raise serializers.ValidationError("Fix timestamp is in the future")
+        return value
+
+
+class LocationBatchSerializer(serializers.Serializer):
+    """Serializer for uploading many location fixes for one order"""
+    fixes = LocationFixSerializer(many=True, allow_empty=False, max_length=settings.LOCATION_BATCH_MAX_FIXES)
+
+
 class NotificationSerializer(serializers.ModelSerializer):
     """Serializer for Notification model"""
     notification_type_display = serializers.CharField(source='get_notification_type_display', read_only=True)
@@ -255,18 +292,47 @@ class RequirementDetailSerializer(RequirementSerializer):
         fields = RequirementSerializer.Meta.fields + ['bids']
 
 
+class TrackSummarySerializer(serializers.Serializer):
+    """Summary of an order's recorded track, read from the fields denormalized on Order"""
+    fix_count = serializers.IntegerField()
+    first_fix_at = serializers.DateTimeField()
+    last_fix_at = serializers.DateTimeField()
+    distance_km = serializers.SerializerMethodField()
+    
+    def get_distance_km(self, obj):
+        return round(float(obj.distance_travelled) / 1000, 3)
+
+
 class OrderDetailSerializer(OrderSerializer):
-    """Detailed serializer for Order with locations"""
-    locations = LocationSerializer(many=True, read_only=True)
+    """Detailed serializer for Order with recent locations and a track summary.
+
+    Only the newest ORDER_DETAIL_RECENT_LOCATIONS fixes are embedded; the
+    full history is paginated behind ``locations_url``.
+    """
+    locations = serializers.SerializerMethodField()
     requirement_details = RequirementSerializer(source='requirement', read_only=True)
-    current_location = serializers.SerializerMethodField()
+    track_summary = TrackSummarySerializer(source='*', read_only=True)
+    locations_url = serializers.SerializerMethodField()
     
     class Meta(OrderSerializer.Meta):
-        fields = OrderSerializer.Meta.fields + ['locations', 'requirement_details', 'current_location']
+        fields = OrderSerializer.Meta.fields + [
+            'locations', 'requirement_details', 'track_summary', 'locations_url'
+        ]
     
-    def get_current_location(self, obj):
-        latest_location = obj.locations.first()  # Already ordered by -timestamp
-        return LocationSerializer(latest_location).data if latest_location else None
+    def get_locations(self, obj):
+        locations = recent_locations(obj, settings.ORDER_DETAIL_RECENT_LOCATIONS)
+        tolerance = self.context.get('simplify')
+        if tolerance is not None:
+            locations = simplify_track(locations, tolerance)
+        return LocationSerializer(locations, many=True).data
+    
+    def get_locations_url(self, obj):
+        query = {'order_id': obj.pk}
+        if self.context.get('simplify') is not None:
+            query['simplify'] = self.context['simplify']
+        url = f"{reverse('location-list')}?{urlencode(query)}"
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
 
 class DashboardStatsSerializer(serializers.Serializer):
@@ -287,3 +353,29 @@ class TruckOwnerStatsSerializer(serializers.Serializer):
     pending_bids = serializers.IntegerField()
     total_earnings = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
     average_rating = serializers.DecimalField(max_digits=3, decimal_places=2, allow_null=True)
+
+
+class OrderTimeseriesSerializer(serializers.Serializer):
+    """Serializer for one period of a dashboard timeseries"""
+    period = serializers.DateField()
+    orders = serializers.IntegerField()
+    statuses = serializers.DictField(child=serializers.IntegerField())
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    average_rating = serializers.DecimalField(max_digits=3, decimal_places=2, allow_null=True)
+
+
+class TruckMatchSerializer(serializers.Serializer):
+    """Serializer for an available truck scored against a requirement"""
+    truck = TruckSerializer()
+    score = serializers.FloatField()
+    distance_km = serializers.FloatField(allow_null=True)
+    components = serializers.DictField(child=serializers.FloatField())
+
+
+class RequirementMatchSerializer(serializers.ModelSerializer):
+    """Serializer for a stored best open requirement of a truck"""
+    requirement = RequirementSerializer()
+    
+    class Meta:
+        model = TruckMatch
+        fields = ['rank', 'score', 'distance_km', 'computed_at', 'requirement']
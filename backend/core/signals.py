@@ -0,0 +1,48 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .dashboards import invalidate_dashboards
+from .models import Truck, Requirement, Bid, Order
+from .rollups import record_order_deleted
+from .search import invalidate_search_cache, repair_search_index
+
+
+def requirement_admin_id(instance):
+    """Admin of the requirement a bid or order belongs to; reuses the loaded requirement if there is one"""
+    if instance._meta.get_field('requirement').is_cached(instance):
+        return instance.requirement.admin_id
+    return Requirement.objects.filter(pk=instance.requirement_id).values_list('admin_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Bid)
+def bid_changed(sender, instance, **kwargs):
+    invalidate_dashboards([instance.user_id, requirement_admin_id(instance)])
+
+
+@receiver([post_save, post_delete], sender=Order)
+def order_changed(sender, instance, **kwargs):
+    invalidate_dashboards([instance.user_id, requirement_admin_id(instance)])
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # Sent for cascades too; the requirement and bid are deleted after the order
+    record_order_deleted(instance)
+
+
+@receiver([post_save, post_delete], sender=Requirement)
+def requirement_changed(sender, instance, **kwargs):
+    invalidate_dashboards([instance.admin_id])
+    invalidate_search_cache()
+
+
+@receiver([post_save, post_delete], sender=Truck)
+def truck_changed(sender, instance, **kwargs):
+    invalidate_dashboards([instance.user_id])
+
+
+@receiver(post_migrate)
+def search_index_migrated(sender, using, **kwargs):
+    if sender.name == 'core':
+        repair_search_index(connections[using])
@@ -0,0 +1,97 @@
+"""Track simplification for map polylines.
+
+Douglas-Peucker over NumPy arrays. Fixes are projected to meters around
+the track (sinusoidal projection about its mean longitude, accurate to a
+few percent over a trip across India). A fix is dropped when the
+simplified line passes within ``tolerance`` meters of it. The first and
+last fix of every order are always kept.
+"""
+import math
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_M
+
+MAX_TOLERANCE_M = 100000
+
+
+def parse_tolerance(value):
+    """Validate a ``simplify`` parameter in meters; raises ValueError"""
+    try:
+        tolerance = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('simplify must be a number of meters')
+    if not math.isfinite(tolerance) or tolerance <= 0 or tolerance > MAX_TOLERANCE_M:
+        raise ValueError(f'simplify must be between 0 and {MAX_TOLERANCE_M} meters')
+    return tolerance
+
+
+def project(latitudes, longitudes):
+    """Project degrees to x/y meters around the track"""
+    phi = np.radians(latitudes)
+    lam = np.radians(longitudes)
+    x = EARTH_RADIUS_M * (lam - lam.mean()) * np.cos(phi)
+    y = EARTH_RADIUS_M * phi
+    return x, y
+
+
+def _segment_distances(x, y, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return np.hypot(x - ax, y - ay)
+    t = np.clip(((x - ax) * dx + (y - ay) * dy) / length_sq, 0.0, 1.0)
+    return np.hypot(x - (ax + t * dx), y - (ay + t * dy))
+
+
+def douglas_peucker(x, y, tolerance):
+    """Boolean mask of the points to keep"""
+    count = len(x)
+    keep = np.zeros(count, dtype=bool)
+    if count == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        distances = _segment_distances(
+            x[start + 1:end], y[start + 1:end], x[start], y[start], x[end], y[end]
+        )
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def simplify_mask(order_ids, latitudes, longitudes, tolerance):
+    """Boolean mask of the fixes needed to draw each order's route within ``tolerance`` meters.
+
+    The fixes must be time ordered (either direction) and may belong to
+    several orders.
+    """
+    order_ids = np.asarray(order_ids)
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    keep = np.zeros(len(order_ids), dtype=bool)
+    for order_id in np.unique(order_ids):
+        indices = np.flatnonzero(order_ids == order_id)
+        x, y = project(latitudes[indices], longitudes[indices])
+        keep[indices[douglas_peucker(x, y, tolerance)]] = True
+    return keep
+
+
+def simplify_track(locations, tolerance):
+    """The subset of time ordered Location instances needed to draw their routes"""
+    locations = list(locations)
+    keep = simplify_mask(
+        [location.order_id for location in locations],
+        [float(location.latitude) for location in locations],
+        [float(location.longitude) for location in locations],
+        tolerance,
+    )
+    return [location for location, kept in zip(locations, keep) if kept]
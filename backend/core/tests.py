@@ -1,3 +1,1329 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import threading
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+
+from . import auctions, dashboards, fanout, gazetteer, matching, notifications, rollups, search, simplify, tracks
+from .broadcasts import GroupBroadcaster, LatestWins
+from .consumers import (
+    LOCATION_UPDATE_FRAME, UPDATE_LOCATION_FRAME, NotificationConsumer, TrackingConsumer, pack_location_update,
+)
+from .location_buffer import PendingFix, _write_batch
+from .models import User, Truck, Requirement, Bid, Order, OrderRollup, Location, Notification, NotificationArchive
+from .parsers import TrackParser
+from .serializers import LocationSerializer
+from .tracks import decode_fixes, encode_fixes, order_track, pack_order
+
+
+def create_requirement():
+    admin = User.objects.create_user('admin', password='x', role='admin')
+    now = timezone.now()
+    requirement = Requirement.objects.create(
+        admin=admin, title='Electronics', load_type='electronics', weight=5, truck_type='medium',
+        from_location='Mumbai, India', to_location='Delhi, India', pickup_date=now + timedelta(days=3),
+        delivery_date=now + timedelta(days=5), bidding_end_date=now + timedelta(days=2),
+    )
+    return admin, requirement
+
+
+def create_trucks(owners):
+    """One medium truck for each of ``owners`` new truck owners"""
+    trucks = []
+    for i in range(owners):
+        owner = User.objects.create_user(f'owner{i}', password='x', role='user')
+        trucks.append(Truck.objects.create(
+            user=owner, truck_type='medium', capacity=10, registration_number=f'MH01AB{i:04d}',
+            make_model='Tata 1109', year=2020,
+        ))
+    return trucks
+
+
+def create_auction(bidders):
+    """A requirement with one pending bid from each of ``bidders`` new truck owners"""
+    admin, requirement = create_requirement()
+    bids = [
+        Bid.objects.create(
+            requirement=requirement, user=truck.user, truck=truck, amount=20000 + i,
+            estimated_delivery_time=timedelta(days=2),
+        )
+        for i, truck in enumerate(create_trucks(bidders))
+    ]
+    return admin, requirement, bids
+
+
+def create_order():
+    """An order for the only bid of a new auction"""
+    admin, requirement, bids = create_auction(1)
+    return Order.objects.create(
+        requirement=requirement, user=bids[0].user, truck=bids[0].truck, accepted_bid=bids[0],
+    )
+
+
+def respond(admin, bid, status):
+    client = APIClient()
+    client.force_authenticate(admin)
+    return client.patch(f'/api/bids/{bid.id}/respond/', {'status': status}, format='json')
+
+
+class BidResponseTests(TestCase):
+    def test_accept_rejects_and_notifies_other_bidders(self):
+        admin, requirement, bids = create_auction(3)
+
+        response = respond(admin, bids[1], 'accepted')
+
+        self.assertEqual(response.status_code, 200)
+        requirement.refresh_from_db()
+        self.assertEqual(requirement.status, 'assigned')
+        self.assertEqual(Order.objects.get().accepted_bid, bids[1])
+        self.assertEqual(
+            set(Bid.objects.filter(status='rejected').values_list('id', flat=True)), {bids[0].id, bids[2].id}
+        )
+        self.assertEqual(
+            set(Notification.objects.filter(notification_type='bid_rejected').values_list('user_id', flat=True)),
+            {bids[0].user_id, bids[2].user_id},
+        )
+
+    def test_reject_refreshes_bid_stats(self):
+        admin, requirement, bids = create_auction(2)
+        requirement.refresh_bid_stats()
+
+        respond(admin, bids[0], 'rejected')
+
+        requirement.refresh_from_db()
+        self.assertEqual(requirement.pending_bids_count, 1)
+        self.assertEqual(requirement.lowest_bid_amount, bids[1].amount)
+
+    def test_auto_accept_refreshes_bid_stats(self):
+        admin, requirement, bids = create_auction(3)
+        requirement.refresh_bid_stats()
+        Requirement.objects.filter(pk=requirement.pk).update(
+            auto_accept=True, bidding_end_date=timezone.now() - timedelta(minutes=1)
+        )
+
+        auctions.close_expired_auctions()
+
+        requirement.refresh_from_db()
+        self.assertEqual(requirement.status, 'assigned')
+        self.assertEqual(Order.objects.get().accepted_bid, bids[0])
+        self.assertEqual(requirement.pending_bids_count, 0)
+        self.assertIsNone(requirement.lowest_bid_amount)
+
+    def test_second_acceptance_is_refused(self):
+        admin, requirement, bids = create_auction(2)
+        respond(admin, bids[0], 'accepted')
+
+        self.assertEqual(respond(admin, bids[1], 'accepted').status_code, 400)
+        self.assertEqual(respond(admin, bids[0], 'rejected').status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.user, self.other = create_trucks(2)[0].user, User.objects.create_user('other', password='x')
+        self.layer = mock.Mock(group_send=mock.AsyncMock())
+        patcher = mock.patch('core.notifications.get_channel_layer', return_value=self.layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def build(self, user, number):
+        return Notification(user=user, title=f'N{number}', message='m', notification_type='new_requirement')
+
+    def sent(self):
+        return [call.args for call in self.layer.group_send.await_args_list]
+
+    def test_notify_pushes_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            notification = notifications.notify(self.user, 'Bid accepted', 'm', 'bid_accepted')
+        self.assertEqual(self.sent(), [])
+
+        callbacks[0]()
+
+        (group, message), = self.sent()
+        self.assertEqual(group, f'notifications_{self.user.id}')
+        self.assertEqual(message['type'], 'notification_created')
+        self.assertEqual((message['data']['id'], message['unread_count']), (notification.id, 1))
+
+    def test_notify_many_sends_each_user_their_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.notify_many([self.build(self.user, 1), self.build(self.user, 2), self.build(self.other, 3)])
+
+        self.assertEqual(
+            [(group, message['data']['title'], message['unread_count']) for group, message in self.sent()],
+            [(f'notifications_{self.user.id}', 'N1', 2), (f'notifications_{self.user.id}', 'N2', 2),
+             (f'notifications_{self.other.id}', 'N3', 1)],
+        )
+
+    def test_mark_all_read_in_chunks(self):
+        Notification.objects.bulk_create([self.build(self.user, i) for i in range(5)] + [self.build(self.other, 5)])
+
+        self.assertEqual(notifications.mark_all_read(self.user.id, 2), 5)
+        self.assertEqual(notifications.mark_all_read(self.user.id, 2), 0)
+        self.assertEqual(
+            notifications.unread_counts([self.user.id, self.other.id]), {self.user.id: 0, self.other.id: 1}
+        )
+
+    def test_binary_frames_get_an_error_reply(self):
+        consumer = NotificationConsumer()
+        consumer.send = mock.AsyncMock()
+
+        async_to_sync(consumer.receive)(bytes_data=b'\x01')
+        async_to_sync(consumer.receive)(text_data='{"type": "ping"}')
+
+        self.assertEqual(
+            [json.loads(call.kwargs['text_data'])['type'] for call in consumer.send.await_args_list], ['error', 'pong']
+        )
+
+    def test_mark_all_read_endpoint_pushes_the_unread_count(self):
+        Notification.objects.bulk_create([self.build(self.user, i) for i in range(3)])
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch('/api/notifications/mark_all_read/')
+
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(self.sent(), [(f'notifications_{self.user.id}', {'type': 'unread_count', 'unread_count': 0})])
+
+
+class PurgeNotificationsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        NotificationArchive.objects.create(user=self.other, archived_count=5)
+        old = timezone.now() - timedelta(days=100)
+        self.kept = [
+            self.create(self.user, read=False, created_at=old),
+            self.create(self.user, read=True, created_at=timezone.now()),
+        ]
+        for user, count in ((self.user, 3), (self.other, 2)):
+            for _ in range(count):
+                self.create(user, read=True, created_at=old)
+
+    def create(self, user, read, created_at):
+        notification = Notification.objects.create(
+            user=user, title='T', message='m', notification_type='new_requirement', is_read=read,
+        )
+        Notification.objects.filter(pk=notification.pk).update(created_at=created_at)
+        return notification.pk
+
+    def archived(self):
+        return dict(NotificationArchive.objects.values_list('user_id', 'archived_count'))
+
+    def test_purged_read_notifications_are_counted_per_user(self):
+        older_than = timezone.now() - timedelta(days=30)
+
+        purged = notifications.purge_read(older_than, batch_size=2, users_per_batch=1)
+
+        self.assertEqual(purged, 5)
+        self.assertEqual(sorted(Notification.objects.values_list('id', flat=True)), sorted(self.kept))
+        self.assertEqual(self.archived(), {self.user.id: 3, self.other.id: 7})
+        self.assertEqual(notifications.purge_read(older_than, batch_size=2), 0)
+        self.assertEqual(self.archived(), {self.user.id: 3, self.other.id: 7})
+
+    def test_command_and_summary(self):
+        out = io.StringIO()
+
+        call_command('purge_notifications', days=30, batch_size=10, pause_ms=0, stdout=out)
+
+        self.assertIn('Successfully purged 5 read notifications', out.getvalue())
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/notifications/summary/')
+        self.assertEqual(response.data, {'unread_count': 1, 'archived_count': 3})
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin, self.requirement, self.bids = create_auction(2)
+        self.owner = self.bids[0].user
+
+    def admin_stats(self):
+        return dashboards.get_dashboard(dashboards.ADMIN, self.admin.id)
+
+    def owner_stats(self):
+        return dashboards.get_dashboard(dashboards.TRUCK_OWNER, self.owner.id)
+
+    def test_cached_until_a_write_commits(self):
+        self.assertEqual(self.admin_stats()['pending_bids'], 2)
+        Bid.objects.filter(pk=self.bids[1].pk).update(status='rejected')
+
+        self.assertEqual(self.admin_stats()['pending_bids'], 2)
+        self.assertEqual(dashboards.cache_counters()['hits'], 1)
+        self.assertEqual(dashboards.get_dashboard(dashboards.ADMIN, self.admin.id, fresh=True)['pending_bids'], 1)
+
+    def test_bid_save_drops_the_admin_and_bidder_dashboards(self):
+        self.assertEqual((self.admin_stats()['pending_bids'], self.owner_stats()['pending_bids']), (2, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bids[0].status = 'rejected'
+            self.bids[0].save()
+
+        self.assertEqual((self.admin_stats()['pending_bids'], self.owner_stats()['pending_bids']), (1, 0))
+
+    def test_order_save_drops_the_admin_and_owner_dashboards(self):
+        self.assertEqual((self.admin_stats()['active_orders'], self.owner_stats()['active_orders']), (0, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                requirement=self.requirement, user=self.owner, truck=self.bids[0].truck, accepted_bid=self.bids[0],
+            )
+        self.assertEqual((self.admin_stats()['active_orders'], self.owner_stats()['active_orders']), (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'completed'
+            order.save()
+        self.assertEqual(self.owner_stats()['completed_orders'], 1)
+
+    def test_requirement_save_drops_the_admin_dashboard(self):
+        self.assertEqual(self.admin_stats()['total_requirements'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Requirement.objects.create(
+                admin=self.admin, title='Steel', load_type='other', weight=5, truck_type='medium',
+                from_location='Pune', to_location='Nagpur', pickup_date=self.requirement.pickup_date,
+                delivery_date=self.requirement.delivery_date, bidding_end_date=self.requirement.bidding_end_date,
+            )
+
+        self.assertEqual(self.admin_stats()['total_requirements'], 2)
+
+
+@unittest.skipUnless(connection.features.has_select_for_update, 'needs row locks (PostgreSQL)')
+class ConcurrentBidAcceptanceTests(TransactionTestCase):
+    THREADS = 16
+
+    def test_one_order_per_requirement(self):
+        admin, requirement, bids = create_auction(self.THREADS)
+        # Every thread accepts a different bid, and half of them race on the same one (a double click)
+        targets = [bids[i // 2 * 2] if i % 2 else bids[i] for i in range(self.THREADS)]
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+
+        def accept(bid):
+            try:
+                barrier.wait()
+                statuses.append(respond(admin, bid, 'accepted').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept, args=(bid,)) for bid in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [200] + [400] * (self.THREADS - 1))
+        self.assertEqual(Order.objects.filter(requirement=requirement).count(), 1)
+        self.assertEqual(Bid.objects.filter(requirement=requirement, status='accepted').count(), 1)
+        self.assertEqual(Bid.objects.filter(requirement=requirement, status='rejected').count(), self.THREADS - 1)
+        self.assertEqual(Notification.objects.filter(notification_type='bid_rejected').count(), self.THREADS - 1)
+
+
+@unittest.skipUnless(connection.features.has_select_for_update, 'needs row locks (PostgreSQL)')
+class ConcurrentBidCreationTests(TransactionTestCase):
+    THREADS = 16
+
+    def test_bid_stats_count_every_bid(self):
+        admin, requirement = create_requirement()
+        trucks = create_trucks(self.THREADS)
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+
+        def place_bid(i, truck):
+            try:
+                client = APIClient()
+                client.force_authenticate(truck.user)
+                barrier.wait()
+                statuses.append(client.post('/api/bids/', {
+                    'requirement': requirement.id, 'truck': truck.id, 'amount': 20000 + i,
+                    'estimated_delivery_time': '2 00:00:00',
+                }, format='json').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=place_bid, args=(i, truck)) for i, truck in enumerate(trucks)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [201] * self.THREADS)
+        requirement.refresh_from_db()
+        self.assertEqual(requirement.pending_bids_count, self.THREADS)
+        self.assertEqual(requirement.lowest_bid_amount, 20000)
+        self.assertEqual(requirement.highest_bid_amount, 20000 + self.THREADS - 1)
+
+
+class FanoutTests(TestCase):
+    def setUp(self):
+        self.admin, self.requirement = create_requirement()
+        self.trucks = create_trucks(5)
+        Truck.objects.filter(pk=self.trucks[4].pk).update(is_active=False)
+        Requirement.objects.filter(pk=self.requirement.pk).update(fanout_cursor=0)
+        self.owners = [truck.user_id for truck in self.trucks[:4]]
+
+    def notified(self):
+        notified = Notification.objects.filter(notification_type='new_requirement').values_list('user_id', flat=True)
+        return sorted(notified)
+
+    def cursor(self):
+        return Requirement.objects.get(pk=self.requirement.pk).fanout_cursor
+
+    def test_posting_a_requirement_only_queues_the_fanout(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/api/requirements/', {
+            'title': 'Steel', 'load_type': 'other', 'weight': 5, 'truck_type': 'medium',
+            'from_location': 'Pune', 'to_location': 'Nagpur', 'pickup_date': '2030-01-03T00:00:00Z',
+            'delivery_date': '2030-01-05T00:00:00Z', 'bidding_end_date': '2030-01-02T00:00:00Z',
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Requirement.objects.get(pk=response.data['id']).fanout_cursor, 0)
+        self.assertEqual(self.notified(), [])
+
+    def test_chunks_advance_the_cursor_and_resume_after_it(self):
+        self.assertEqual(fanout.fan_out_chunk(self.requirement.pk, 3), 3)
+        self.assertEqual(self.cursor(), self.owners[2])
+
+        # A later run, e.g. after a crash, carries on from the committed cursor
+        with mock.patch.object(notifications, 'notify_many', wraps=notifications.notify_many) as notify_many:
+            self.assertEqual(fanout.run_pending_fanouts(chunk_size=3), 1)
+
+        self.assertEqual([len(call.args[0]) for call in notify_many.call_args_list], [1])
+        self.assertEqual(self.notified(), self.owners)
+        self.assertIsNone(self.cursor())
+        self.assertIsNone(fanout.fan_out_chunk(self.requirement.pk, 3))
+
+    def test_full_chunks_then_an_empty_one(self):
+        with mock.patch.object(notifications, 'notify_many', wraps=notifications.notify_many) as notify_many:
+            self.assertEqual(fanout.fan_out(self.requirement.pk, chunk_size=2)[0], 4)
+
+        self.assertEqual([len(call.args[0]) for call in notify_many.call_args_list], [2, 2, 0])
+        self.assertEqual(self.notified(), self.owners)
+
+    def test_closed_requirement_clears_the_cursor(self):
+        Requirement.objects.filter(pk=self.requirement.pk).update(status='assigned')
+
+        self.assertEqual(fanout.fan_out_chunk(self.requirement.pk, 3), 0)
+        self.assertIsNone(self.cursor())
+        self.assertEqual(self.notified(), [])
+
+
+@unittest.skipUnless(connection.features.has_select_for_update_skip_locked, 'needs SKIP LOCKED (PostgreSQL)')
+class ConcurrentFanoutTests(TransactionTestCase):
+    def test_locked_requirement_is_skipped(self):
+        admin, requirement = create_requirement()
+        create_trucks(3)
+        Requirement.objects.filter(pk=requirement.pk).update(fanout_cursor=0)
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    Requirement.objects.select_for_update().get(pk=requirement.pk)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait(10)
+        try:
+            # Another worker holds this requirement's batch; this one moves on instead of waiting
+            self.assertIsNone(fanout.fan_out_chunk(requirement.pk, 2))
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(fanout.fan_out(requirement.pk, chunk_size=2)[0], 3)
+
+
+class OrderRollupTests(TestCase):
+    def setUp(self):
+        self.admin, self.requirement, bids = create_auction(2)
+        self.bid = bids[0]
+        self.assertEqual(respond(self.admin, self.bid, 'accepted').status_code, 200)
+        self.order = Order.objects.get(accepted_bid=self.bid)
+        self.assertTrue(self.rollup_rows())
+
+    def rollup_rows(self):
+        rows = OrderRollup.objects.exclude(order_count=0, revenue=0, rating_sum=0, rating_count=0)
+        return sorted(rows.values_list('user_id', 'role', 'day', 'status', *rollups.TOTAL_FIELDS))
+
+    def assertMatchesRebuild(self):
+        rows = self.rollup_rows()
+        rollups.rebuild_rollups()
+        self.assertEqual(rows, self.rollup_rows())
+
+    def test_accepted_bid_amount_edit(self):
+        client = APIClient()
+        client.force_authenticate(self.bid.user)
+        response = client.patch(f'/api/bids/{self.bid.id}/', {'amount': '27500.00'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertMatchesRebuild()
+
+    def test_order_deleted_through_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        self.assertEqual(client.delete(f'/api/orders/{self.order.id}/').status_code, 204)
+        self.assertMatchesRebuild()
+        self.assertEqual(self.rollup_rows(), [])
+
+    def test_requirement_deletion_cascades(self):
+        self.requirement.delete()
+
+        self.assertMatchesRebuild()
+        self.assertEqual(self.rollup_rows(), [])
+
+    def test_truck_owner_deletion_cascades(self):
+        self.bid.user.delete()
+
+        self.assertMatchesRebuild()
+        self.assertEqual(self.rollup_rows(), [])
+
+    def test_timeseries_endpoints(self):
+        today = timezone.localdate()
+        since = today - timedelta(days=1)
+        params = {'granularity': 'day', 'since': since.isoformat(), 'until': today.isoformat()}
+        client = APIClient()
+        for user, url, other_url in (
+            (self.admin, '/api/dashboard/admin/timeseries/', '/api/dashboard/truck-owner/timeseries/'),
+            (self.bid.user, '/api/dashboard/truck-owner/timeseries/', '/api/dashboard/admin/timeseries/'),
+        ):
+            client.force_authenticate(user)
+
+            response = client.get(url, params)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([period['period'] for period in response.data], [since.isoformat(), today.isoformat()])
+            self.assertEqual(response.data[0]['orders'], 0)
+            self.assertEqual(
+                (response.data[1]['orders'], response.data[1]['statuses']), (1, {self.order.status: 1})
+            )
+            self.assertEqual(set(response.data[1]), {'period', 'orders', 'statuses', 'revenue', 'average_rating'})
+            self.assertEqual(client.get(other_url, params).status_code, 403)
+            reversed_range = {'since': today.isoformat(), 'until': since.isoformat()}
+            for bad in ({'granularity': 'year'}, {'since': 'yesterday'}, reversed_range):
+                self.assertEqual(client.get(url, bad).status_code, 400, bad)
+
+
+class RequirementSearchTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x', role='admin')
+
+    def create(self, title, description='', from_location='Pune, India', status='open'):
+        now = timezone.now()
+        return Requirement.objects.create(
+            admin=self.admin, title=title, description=description, load_type='other', weight=5,
+            truck_type='medium', from_location=from_location, to_location='Delhi, India', status=status,
+            pickup_date=now + timedelta(days=3), delivery_date=now + timedelta(days=5),
+            bidding_end_date=now + timedelta(days=2),
+        )
+
+    def test_matches_word_prefixes_ranked_location_title_description(self):
+        described = self.create('Steel coils', description='Stacked at Nashik warehouse')
+        titled = self.create('Nashik grapes')
+        located = self.create('Furniture', from_location='Nashik, India')
+        self.create('Cement')
+
+        results = list(search.search_requirements(Requirement.objects.all(), 'nash'))
+
+        self.assertEqual(results, [located, titled, described])
+
+    def test_every_word_has_to_match(self):
+        wanted = self.create('Nashik grapes')
+        self.create('Nashik onions')
+
+        self.assertEqual(list(search.match_requirements(Requirement.objects.all(), 'grapes nashik')), [wanted])
+
+    @override_settings(SEARCH_RANK_MAX_MATCHES=2)
+    def test_rank_threshold_counts_the_filtered_queryset(self):
+        for i in range(3):
+            self.create(f'Nashik load {i}', status='closed')
+        wanted = self.create('Nashik grapes')
+        queryset = Requirement.objects.filter(status='open')
+
+        self.assertEqual(search.count_matches(queryset, 'nashik', 3), 1)
+        results = list(search.search_requirements(queryset, 'nashik'))
+        self.assertEqual(results, [wanted])
+        self.assertTrue(hasattr(results[0], 'search_rank'))
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite drops triggers on table rebuilds')
+    def test_repair_puts_back_dropped_triggers(self):
+        requirement = self.create('Cement')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER core_requirement_fts_update')
+        Requirement.objects.filter(pk=requirement.pk).update(title='Nashik grapes')
+
+        search.repair_search_index(connection)
+
+        self.assertEqual(list(search.match_requirements(Requirement.objects.all(), 'grapes')), [requirement])
+        Requirement.objects.filter(pk=requirement.pk).update(title='Cement')
+        self.assertEqual(list(search.match_requirements(Requirement.objects.all(), 'grapes')), [])
+
+
+class GazetteerTests(SimpleTestCase):
+    def geocode(self, text, allow_state=True):
+        place = gazetteer.get_gazetteer().geocode(text, allow_state)
+        return place and (place.name, place.state)
+
+    def test_names_aliases_and_misspellings(self):
+        self.assertEqual(self.geocode('Sector 18, Noida, UP'), ('Noida', 'Uttar Pradesh'))
+        self.assertEqual(self.geocode('Bombay'), ('Mumbai', 'Maharashtra'))
+        self.assertEqual(self.geocode('Ahmedbad, Gujarat'), ('Ahmedabad', 'Gujarat'))
+        self.assertIsNone(self.geocode('Atlantis'))
+
+    def test_state_only_locations(self):
+        self.assertEqual(self.geocode('Somewhere, Maharashtra'), ('Maharashtra', 'Maharashtra'))
+        self.assertIsNone(self.geocode('Somewhere, Maharashtra', allow_state=False))
+
+    def test_shared_names_need_a_state(self):
+        self.assertIsNone(self.geocode('Aurangabad'))
+        self.assertIsNone(self.geocode('Aurangabad, India'))
+        self.assertEqual(self.geocode('Aurangabad, Maharashtra'), ('Aurangabad', 'Maharashtra'))
+        self.assertEqual(self.geocode('Aurangabad, Bihar'), ('Aurangabad', 'Bihar'))
+        self.assertEqual(self.geocode('Sambhajinagar'), ('Aurangabad', 'Maharashtra'))
+
+    def test_nearest_city(self):
+        place, distance = gazetteer.get_gazetteer().nearest(19.08, 72.88)
+
+        self.assertEqual(place.name, 'Mumbai')
+        self.assertLess(distance, 1000)
+
+
+class SimulateLocationUpdateTests(TestCase):
+    def simulate(self, from_location):
+        order = create_order()
+        Requirement.objects.filter(pk=order.requirement_id).update(from_location=from_location)
+        client = APIClient()
+        client.force_authenticate(order.user)
+        return client.post(f'/api/orders/{order.id}/simulate-location/')
+
+    def test_unresolved_place_is_a_bad_request(self):
+        response = self.simulate('Aurangabad')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Unknown location: Aurangabad'})
+        self.assertFalse(Location.objects.exists())
+
+    def test_resolved_places_record_a_fix(self):
+        response = self.simulate('Aurangabad, Maharashtra')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Location.objects.count(), 1)
+
+
+class LocationBatchTests(TestCase):
+    def setUp(self):
+        self.order = create_order()
+        self.url = f'/api/orders/{self.order.pk}/locations/batch/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.order.user)
+        self.start = timezone.now() - timedelta(minutes=10)
+        patcher = mock.patch('core.views.send_tracking_update')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fixes(self, count):
+        return [
+            Location(timestamp=self.start + timedelta(seconds=i), latitude=Decimal('19.0760000') + i,
+                     longitude=Decimal('72.8777000'))
+            for i in range(count)
+        ]
+
+    def post_track(self, fixes):
+        return self.client.post(self.url, encode_fixes(fixes), content_type=TrackParser.media_type)
+
+    def test_batch_is_stored_with_one_broadcast_of_the_newest_fix(self):
+        fixes = [
+            {'latitude': '19.0760000', 'longitude': '72.8777000',
+             'timestamp': (self.start + timedelta(seconds=i)).isoformat()}
+            for i in (2, 0, 1)
+        ]
+
+        response = self.client.post(self.url, fixes, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(Location.objects.filter(order=self.order).count(), 3)
+        self.send.assert_called_once_with(self.order.pk, 'location_update', response.data['latest'])
+        self.assertEqual(response.data['latest']['timestamp'], fixes[0]['timestamp'].replace('+00:00', 'Z'))
+
+    def test_binary_batch_is_stored(self):
+        response = self.post_track(self.fixes(3))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).fix_count, 3)
+        self.send.assert_called_once()
+
+    @override_settings(LOCATION_BATCH_MAX_FIXES=2)
+    def test_oversized_or_malformed_batches_are_refused(self):
+        for response in (
+            self.post_track(self.fixes(3)),
+            self.client.post(self.url, b'\x01\x01\x00', content_type=TrackParser.media_type),
+            self.client.post(self.url, [{'latitude': '19.0760000'}], format='json'),
+            self.client.post(self.url, [], format='json'),
+        ):
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Location.objects.exists())
+        self.send.assert_not_called()
+
+    def test_other_owners_are_forbidden(self):
+        self.client.force_authenticate(User.objects.create_user('other', password='x', role='user'))
+
+        response = self.post_track(self.fixes(1))
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Location.objects.exists())
+
+
+class TruckCompatibilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin, self.requirement = create_requirement()
+        Requirement.objects.filter(pk=self.requirement.pk).update(from_latitude=19.076, from_longitude=72.8777)
+        self.trucks = create_trucks(5)
+        for truck, truck_type in zip(self.trucks, ['small', 'medium', 'large', 'trailer', 'medium']):
+            truck.truck_type = truck_type
+            truck.save()
+        Truck.objects.filter(pk=self.trucks[4].pk).update(capacity=4)
+
+    def test_a_type_carries_itself_and_smaller_types(self):
+        self.assertEqual(matching.carrying_types('medium'), ['medium', 'large', 'trailer'])
+        self.assertEqual(matching.carried_types('medium'), ['mini', 'small', 'medium'])
+        self.assertEqual(matching.carrying_types('unknown'), [])
+        self.assertEqual(matching.carried_types('unknown'), [])
+
+    def test_matches_rank_the_requested_type_before_larger_ones(self):
+        matches = matching.match_trucks(self.requirement)
+
+        self.assertEqual([match['truck_id'] for match in matches], [truck.id for truck in self.trucks[1:4]])
+        self.assertEqual([match['components']['type'] for match in matches], [1, 0.7, 0.4])
+        self.assertEqual(sorted(matches, key=lambda match: -match['score']), matches)
+
+    def test_fanout_notifies_owners_of_larger_trucks(self):
+        owners = list(fanout.recipients(self.requirement))
+
+        self.assertEqual(owners, [truck.user_id for truck in self.trucks[1:4]])
+
+    def test_nearby_lists_requirements_for_smaller_types(self):
+        client = APIClient()
+        client.force_authenticate(self.trucks[2].user)
+        url = '/api/search/requirements/nearby/'
+
+        by_truck = client.get(url, {'truck': self.trucks[2].id, 'lat': 19.1, 'lng': 72.9})
+        by_type = client.get(url, {'truck_type': 'large', 'lat': 19.1, 'lng': 72.9})
+        too_small = client.get(url, {'truck_type': 'small', 'lat': 19.1, 'lng': 72.9})
+
+        self.assertEqual([r['id'] for r in by_truck.data['results']], [self.requirement.id])
+        self.assertEqual([r['id'] for r in by_type.data['results']], [self.requirement.id])
+        self.assertEqual(too_small.data['results'], [])
+
+
+class NearbyRequirementsTests(TestCase):
+    url = '/api/search/requirements/nearby/'
+    delhi = {'lat': 28.6139, 'lng': 77.2090}
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x', role='admin')
+        self.truck, self.other_truck = create_trucks(2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.truck.user)
+        self.noida = self.near(28.5355, 77.3910)
+        self.gurgaon = self.near(28.4595, 77.0266)
+        self.heavy = self.near(28.4089, 77.3178, weight=50)
+        self.mini = self.near(28.6692, 77.4538, truck_type='mini')
+        self.jaipur = self.near(26.9124, 75.7873)
+
+    def near(self, latitude, longitude, weight=5, truck_type='medium'):
+        now = timezone.now()
+        return Requirement.objects.create(
+            admin=self.admin, title='Load', load_type='other', weight=weight, truck_type=truck_type,
+            from_location='Delhi NCR', to_location='Mumbai', from_latitude=latitude, from_longitude=longitude,
+            pickup_date=now + timedelta(days=3), delivery_date=now + timedelta(days=5),
+            bidding_end_date=now + timedelta(days=2),
+        ).pk
+
+    def ids(self, **params):
+        response = self.client.get(self.url, {**self.delhi, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        distances = [result['distance_km'] for result in response.data['results']]
+        self.assertEqual(distances, sorted(distances))
+        return {result['id'] for result in response.data['results']}
+
+    def test_radius(self):
+        self.assertEqual(self.ids(radius=21), {self.noida})
+        self.assertEqual(self.ids(radius=40), {self.noida, self.gurgaon, self.heavy, self.mini})
+        self.assertEqual(self.ids(radius=300), {self.noida, self.gurgaon, self.heavy, self.mini, self.jaipur})
+        self.assertEqual(self.ids(radius=5), set())
+
+    def test_type_and_capacity_filters(self):
+        self.assertEqual(self.ids(radius=40, capacity=10), {self.noida, self.gurgaon, self.mini})
+        self.assertEqual(self.ids(radius=40, truck_type='small'), {self.mini})
+
+    def test_truck_filters_by_what_it_can_carry(self):
+        self.assertEqual(self.ids(radius=40, truck=self.truck.id), {self.noida, self.gurgaon, self.mini})
+
+        response = self.client.get(self.url, {**self.delhi, 'truck': self.other_truck.id})
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_parameters(self):
+        for params in ({'lat': 28.6}, {**self.delhi, 'radius': 1000}, {'radius': 10}, {**self.delhi, 'truck': 'x'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+
+class RequirementCursorPaginationTests(TestCase):
+    def setUp(self):
+        admin, _ = create_requirement()
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        template = Requirement.objects.get()
+        for i in range(4):
+            template.pk = None
+            template.title = f'Load {i}'
+            template.save()
+        # Two share a creation time, so the id breaks the tie
+        same = timezone.now() - timedelta(hours=1)
+        Requirement.objects.filter(title__in=['Load 1', 'Load 2']).update(created_at=same)
+        self.expected = list(Requirement.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_cursor_round_trip(self):
+        pages = []
+        url = '/api/search/requirements/?pagination=cursor&page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            url = response.data['next']
+
+        self.assertEqual([requirement['id'] for page in pages for requirement in page['results']], self.expected)
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 1])
+        self.assertEqual((pages[0]['count'], pages[0]['count_is_estimate']), (5, False))
+        for page in pages[1:]:
+            self.assertEqual((page['count'], page['count_is_estimate']), (None, None))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get('/api/search/requirements/?pagination=cursor&cursor=bm90IGEgY3Vyc29y')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class SimplifyTests(SimpleTestCase):
+    # Straight east along 19N, except the middle fix, about 55 m north of the line
+    latitudes = [19, 19, 19.0005, 19, 19]
+    longitudes = [72, 72.001, 72.002, 72.003, 72.004]
+
+    def test_tolerance_decides_whether_a_bend_is_kept(self):
+        # Once the bend is kept, its neighbours are about 27 m off the lines to it
+        tight = simplify.simplify_mask([1] * 5, self.latitudes, self.longitudes, 30)
+        loose = simplify.simplify_mask([1] * 5, self.latitudes, self.longitudes, 100)
+
+        self.assertEqual(tight.tolist(), [True, False, True, False, True])
+        self.assertEqual(loose.tolist(), [True, False, False, False, True])
+
+    def test_each_order_keeps_its_first_and_last_fix(self):
+        keep = simplify.simplify_mask([1, 1, 1, 2, 2, 2], [19] * 6, [72, 72.001, 72.002] * 2, 1000)
+
+        self.assertEqual(keep.tolist(), [True, False, True, True, False, True])
+        self.assertEqual(simplify.simplify_mask([1], [19], [72], 10).tolist(), [True])
+        self.assertEqual(simplify.simplify_mask([], [], [], 10).tolist(), [])
+
+    def test_parse_tolerance(self):
+        self.assertEqual(simplify.parse_tolerance('25'), 25)
+        for value in ('0', '-5', 'nan', 'inf', 'abc', None, str(simplify.MAX_TOLERANCE_M + 1)):
+            with self.assertRaises(ValueError):
+                simplify.parse_tolerance(value)
+
+
+class TrackParserTests(SimpleTestCase):
+    def parse(self, body):
+        return TrackParser().parse(io.BytesIO(body))
+
+    def test_malformed_payloads_are_parse_errors(self):
+        for body in (
+            b'',
+            b'\x01',
+            b'\x01\x01\x00',  # truncated
+            b'\x01' + b'\xff' * 20 + b'\x01',  # varint longer than 64 bits
+            b'\x01\x01\xfe' + b'\xff' * 8 + b'\x01' + b'\x00' * 6,  # timestamp out of range
+        ):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                self.parse(body)
+
+    @override_settings(LOCATION_BATCH_MAX_FIXES=2)
+    def test_too_many_fixes_are_refused(self):
+        fixes = [Location(timestamp=timezone.now(), latitude=19, longitude=72) for _ in range(3)]
+        with self.assertRaises(ParseError):
+            self.parse(encode_fixes(fixes))
+        self.assertEqual(len(self.parse(encode_fixes(fixes[:2]))['fixes']), 2)
+        with self.assertRaises(ParseError):
+            self.parse(b'\x01\x02' + b'\x00' * 1000)
+
+
+class TrackEncodingTests(SimpleTestCase):
+    def test_fixes_round_trip(self):
+        start = timezone.now()
+        fixes = [
+            Location(timestamp=start, latitude=Decimal('19.0760000'), longitude=Decimal('-72.8777000'),
+                     speed=Decimal('61.50'), heading=Decimal('359.99'), altitude=None, accuracy=Decimal('4.80')),
+            Location(timestamp=start + timedelta(microseconds=1), latitude=Decimal('-33.8688197'),
+                     longitude=Decimal('151.2092955'), speed=None, heading=None, altitude=Decimal('-12.30'),
+                     accuracy=None),
+            Location(timestamp=start + timedelta(hours=5), latitude=Decimal('0E-7'), longitude=Decimal('180.0000000'),
+                     speed=Decimal('0.00'), heading=Decimal('0.00'), altitude=Decimal('8848.86'),
+                     accuracy=Decimal('999999.99')),
+        ]
+
+        decoded = decode_fixes(encode_fixes(fixes))
+
+        self.assertEqual(decoded, [
+            (fix.timestamp, fix.latitude, fix.longitude, fix.speed, fix.heading, fix.altitude, fix.accuracy)
+            for fix in fixes
+        ])
+
+    def test_empty_track_round_trips(self):
+        self.assertEqual(decode_fixes(encode_fixes([])), [])
+
+
+@override_settings(LOCATION_PACKING_ENABLED=True)
+class TrackHistoryTests(TestCase):
+    def setUp(self):
+        self.order = create_order()
+        self.start = timezone.now() - timedelta(hours=1)
+        Location.objects.bulk_create([
+            Location(order=self.order, latitude=19 + Decimal(i) / 1000, longitude=72,
+                     timestamp=self.start + timedelta(seconds=i))
+            for i in range(10)
+        ])
+        self.ids = list(Location.objects.filter(order=self.order).order_by('timestamp').values_list('id', flat=True))
+        self.assertEqual(pack_order(self.order.pk, self.start + timedelta(seconds=6), segment_size=2), (6, 3))
+        # A buffered upload older than the packed history lands between packed fixes
+        Location.objects.create(order=self.order, latitude=20, longitude=72,
+                                timestamp=self.start + timedelta(seconds=2.5))
+
+    def seconds(self, locations):
+        return [(location.timestamp - self.start).total_seconds() for location in locations]
+
+    def test_packed_and_unpacked_fixes_merge_in_time_order(self):
+        expected = [0, 1, 2, 2.5, 3, 4, 5, 6, 7, 8, 9]
+
+        self.assertEqual(self.seconds(order_track(self.order, descending=False)), expected)
+        self.assertEqual(self.seconds(order_track(self.order)), expected[::-1])
+        self.assertEqual(len(order_track(self.order)), 11)
+        self.assertEqual(self.seconds(order_track(self.order.pk)[2:6]), [7, 6, 5, 4])
+
+    def test_packed_fixes_read_like_rows(self):
+        packed = order_track(self.order, descending=False)[1]
+
+        self.assertEqual(packed.id, self.ids[1])
+        self.assertFalse(Location.objects.filter(id=packed.id).exists())
+        self.assertEqual(packed.order, self.order)
+        self.assertEqual(packed.latitude, Decimal('19.0010000'))
+        self.assertIsNone(packed.speed)
+
+    def test_since_and_until_bound_both_sources(self):
+        track = order_track(
+            self.order, since=self.start + timedelta(seconds=2), until=self.start + timedelta(seconds=7),
+        )
+
+        self.assertEqual(self.seconds(track), [7, 6, 5, 4, 3, 2.5, 2])
+        self.assertEqual(track.count(), 7)
+
+
+@override_settings(LOCATION_PACKING_ENABLED=True)
+class DownsampleOrderTests(TestCase):
+    def setUp(self):
+        self.order = create_order()
+        self.start = (timezone.now() - timedelta(hours=1)).replace(second=0, microsecond=0)
+        # North for 10 fixes, then east: fix 9 is the only turn
+        Location.objects.bulk_create([
+            Location(order=self.order, timestamp=self.start + timedelta(seconds=10 * i),
+                     latitude=19 + Decimal(min(i, 9)) / 1000, longitude=72 + Decimal(max(i - 9, 0)) / 1000)
+            for i in range(20)
+        ])
+        pack_order(self.order.pk, self.start + timedelta(seconds=75), segment_size=3)
+        with transaction.atomic():
+            tracks.refresh_track_stats(self.order.pk)
+
+    def seconds(self):
+        return [(location.timestamp - self.start).total_seconds() for location in order_track(self.order.pk, False)]
+
+    def summary(self):
+        return Order.objects.values(*Order.TRACK_STATS_FIELDS).get(pk=self.order.pk)
+
+    def test_keeps_the_first_fix_per_interval_and_the_route_shape(self):
+        before = self.summary()
+
+        result = tracks.downsample_order(self.order.pk, interval=60, tolerance=25)
+
+        # 0, 60, 120 and 180 s start their minute; 0, 90 (the turn) and 190 s are the route's corners
+        self.assertEqual(self.seconds(), [0, 60, 90, 120, 180, 190])
+        self.assertEqual(result[:2], (8, 6))
+        self.assertEqual(self.summary(), dict(before, fix_count=6))
+        self.assertIsNotNone(Order.objects.get(pk=self.order.pk).track_downsampled_at)
+
+    def test_fixes_packed_meanwhile_are_kept(self):
+        read_columns = tracks._track_columns
+
+        def pack_after_reading(order_id):
+            columns = read_columns(order_id)
+            pack_order(order_id, self.start + timedelta(hours=1), segment_size=3)
+            return columns
+
+        with mock.patch.object(tracks, '_track_columns', pack_after_reading):
+            rows, packed, _ = tracks.downsample_order(self.order.pk, interval=60, tolerance=25)
+
+        self.assertEqual(self.seconds(), [0, 60, 80, 90, 100, 110, 120, 130, 140, 150, 160, 170, 180, 190])
+        self.assertEqual((rows, packed), (0, 6))
+        self.assertEqual(self.summary()['fix_count'], 14)
+
+
+class TrackSummaryTests(TestCase):
+    def setUp(self):
+        self.order = create_order()
+        self.start = timezone.now() - timedelta(hours=1)
+        # Stored before the order had a summary, so none of it is set
+        Location.objects.bulk_create([
+            Location(order=self.order, timestamp=self.start + timedelta(minutes=i), latitude=19 + Decimal(i) / 100,
+                     longitude=72)
+            for i in range(2)
+        ])
+
+    def test_first_fix_after_untracked_history_summarizes_all_of_it(self):
+        with transaction.atomic():
+            location = Location.objects.create(
+                order=self.order, timestamp=self.start + timedelta(minutes=2), latitude=Decimal('19.02'), longitude=72,
+            )
+            tracks.record_fixes(self.order.pk, [location])
+
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.fix_count, 3)
+        self.assertEqual(order.first_fix_at, self.start)
+        self.assertEqual(order.last_fix_at, location.timestamp)
+        # Two hundredths of a degree of latitude
+        self.assertAlmostEqual(float(order.distance_travelled), 2224, delta=5)
+        self.assertEqual(order.last_location['id'], location.id)
+
+    def test_migration_backfills_the_summary_of_existing_orders(self):
+        migration = importlib.import_module('core.migrations.0005_order_track_stats')
+
+        migration.backfill_track_stats(django_apps, None)
+
+        order = Order.objects.get(pk=self.order.pk)
+        with transaction.atomic():
+            expected = tracks.refresh_track_stats(self.order.pk)
+        for field in ('fix_count', 'first_fix_at', 'last_fix_at', 'last_latitude', 'last_longitude',
+                      'distance_travelled'):
+            self.assertEqual(getattr(order, field), getattr(expected, field), field)
+        self.assertEqual(order.fix_count, 2)
+
+    def test_migration_copies_the_newest_fix_onto_existing_orders(self):
+        migration = importlib.import_module('core.migrations.0006_order_last_location')
+        newest = Location.objects.filter(order=self.order).latest('timestamp')
+        newest.speed, newest.address = Decimal('61.5'), 'Near Thane'
+        newest.save()
+
+        migration.backfill_last_location(django_apps, None)
+
+        self.assertEqual(Order.objects.get(pk=self.order.pk).last_location, dict(LocationSerializer(newest).data))
+        client = APIClient()
+        client.force_authenticate(self.order.user)
+        for url in ('/api/orders/', f'/api/orders/{self.order.pk}/'):
+            data = client.get(url).data
+            order = data['results'][0] if 'results' in data else data
+            self.assertEqual(order['current_location']['id'], newest.id, url)
+
+    def test_tracking_snapshot_looks_up_a_missing_copy(self):
+        consumer = TrackingConsumer()
+        consumer.order = async_to_sync(consumer.resolve_order)(str(self.order.pk))
+        newest = Location.objects.filter(order=self.order).latest('timestamp')
+
+        snapshot = json.loads(async_to_sync(consumer.build_snapshot)())
+
+        self.assertEqual(snapshot['data']['current_location']['id'], newest.id)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).last_location['id'], newest.id)
+
+    def test_current_location_of_untracked_history_is_looked_up_once(self):
+        client = APIClient()
+        client.force_authenticate(self.order.user)
+        newest = Location.objects.filter(order=self.order).latest('timestamp')
+
+        response = client.get(f'/api/orders/{self.order.pk}/current-location/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], newest.id)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).last_location['id'], newest.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(tracks.latest_location_data(Order.objects.get(pk=self.order.pk))['id'], newest.id)
+
+
+@override_settings(LOCATION_PACKING_ENABLED=True)
+class LocationCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.order = create_order()
+        self.client = APIClient()
+        self.client.force_authenticate(self.order.user)
+        self.moment = timezone.now() - timedelta(hours=1)
+        # Seven fixes share one timestamp, so packing two per segment splits them across segments
+        Location.objects.bulk_create([
+            Location(order=self.order, latitude=19, longitude=72, timestamp=self.moment + timedelta(seconds=offset))
+            for offset in [-1] + [0] * 7 + [1]
+        ])
+        self.expected = list(
+            Location.objects.filter(order=self.order).order_by('timestamp', 'id').values_list('id', flat=True)
+        )
+
+    def read_all(self, ordering, pack_after_first_page=False):
+        ids = []
+        url = f'/api/locations/?order_id={self.order.pk}&page_size=2&ordering={ordering}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids.extend(fix['id'] for fix in response.data['results'])
+            url = response.data['next']
+            if pack_after_first_page and len(ids) == 2:
+                pack_order(self.order.pk, self.moment + timedelta(seconds=2), segment_size=2)
+        return ids
+
+    def test_same_timestamp_fixes_split_across_segments_are_paged_once(self):
+        pack_order(self.order.pk, self.moment + timedelta(seconds=2), segment_size=2)
+
+        self.assertEqual(self.read_all('-timestamp'), self.expected[::-1])
+        self.assertEqual(self.read_all('timestamp'), self.expected)
+
+    def test_packing_between_requests_keeps_the_cursor_in_place(self):
+        self.assertEqual(self.read_all('-timestamp', pack_after_first_page=True), self.expected[::-1])
+
+    def test_short_page_has_no_next_link(self):
+        for ordering in ('timestamp', '-timestamp'):
+            response = self.client.get(f'/api/locations/?order_id={self.order.pk}&page_size=100&ordering={ordering}')
+
+            self.assertEqual(len(response.data['results']), 9)
+            self.assertIsNone(response.data['next'])
+
+    def test_last_link_of_the_final_page_tails_new_fixes(self):
+        response = self.client.get(f'/api/locations/?order_id={self.order.pk}&page_size=100&ordering=timestamp')
+        self.assertEqual([fix['id'] for fix in response.data['results']], self.expected)
+        self.assertIsNone(response.data['next'])
+
+        newer = Location.objects.bulk_create([
+            Location(order=self.order, latitude=19, longitude=72, timestamp=self.moment + timedelta(seconds=offset))
+            for offset in (1, 5)
+        ])
+        pack_order(self.order.pk, self.moment + timedelta(seconds=2), segment_size=2)
+        response = self.client.get(response.data['last'])
+
+        self.assertEqual([fix['id'] for fix in response.data['results']], [location.id for location in newer])
+        empty = self.client.get(response.data['last'])
+        self.assertEqual(empty.data['results'], [])
+        self.assertEqual(empty.data['last'], response.data['last'])
+
+    def test_simplified_pages_slice_the_whole_track_simplification(self):
+        # Zigzag east with shrinking swings. An endpoint is always kept, so simplifying
+        # each one-fix page on its own would keep every fix
+        Location.objects.bulk_create([
+            Location(order=self.order, timestamp=self.moment + timedelta(seconds=10 + i),
+                     latitude=19 + Decimal((-1) ** i * (12 - i)) / 10000, longitude=72 + Decimal(i) / 1000)
+            for i in range(12)
+        ])
+        pack_order(self.order.pk, self.moment + timedelta(seconds=15), segment_size=2)
+        url = f'/api/locations/?order_id={self.order.pk}&simplify=40&ordering=timestamp'
+
+        whole = [fix['id'] for fix in self.client.get(f'{url}&page_size=100').data['results']]
+        ids, page = [], f'{url}&page_size=1'
+        while page:
+            response = self.client.get(page)
+            ids.extend(fix['id'] for fix in response.data['results'])
+            page = response.data['next']
+
+        self.assertEqual(ids, whole)
+        self.assertLess(len(whole), 21)
+        response = self.client.get('/api/locations/?simplify=40')
+        self.assertEqual(response.status_code, 400)
+
+    def test_newest_first_pages_have_no_last_link(self):
+        response = self.client.get(f'/api/locations/?order_id={self.order.pk}&page_size=2')
+
+        self.assertIsNone(response.data['last'])
+
+    def test_count_within_bounds_matches_the_fixes_read(self):
+        Location.objects.create(
+            order=self.order, latitude=19, longitude=72, timestamp=self.moment + timedelta(seconds=3),
+        )
+        pack_order(self.order.pk, self.moment + timedelta(seconds=2), segment_size=2)
+        history = order_track(self.order, since=self.moment, until=self.moment + timedelta(seconds=3))
+        cursor = history[3]
+
+        for track in (history, history.after(cursor.timestamp, cursor.id)):
+            self.assertEqual(track.count(), len(list(track)))
+        self.assertEqual(history.count(), 9)
+
+
+class LocationWriteBufferTests(TransactionTestCase):
+    def test_failed_order_only_fails_its_own_fixes(self):
+        order = create_order()
+        deleted = Order(pk=order.pk + 1000)
+        entries = [
+            PendingFix(target, {'latitude': Decimal('19.1'), 'longitude': Decimal('72.8'), 'timestamp': timezone.now()},
+                       f'tracking_{target.pk}')
+            for target in (order, deleted, order)
+        ]
+
+        broadcasts, written, failed = _write_batch(entries)
+
+        self.assertEqual(written, [entries[0], entries[2]])
+        self.assertEqual(failed, [entries[1]])
+        self.assertEqual([group for group, _ in broadcasts], [f'tracking_{order.pk}'])
+        self.assertEqual(Location.objects.filter(order=order).count(), 2)
+
+
+class ResolveOrderTests(TestCase):
+    def resolve(self, value):
+        return async_to_sync(TrackingConsumer().resolve_order)(value)
+
+    def test_id_then_order_number(self):
+        order = create_order()
+        Order.objects.filter(pk=order.pk).update(order_number=str(order.pk + 1000))
+
+        self.assertEqual(self.resolve(str(order.pk)), order)
+        self.assertEqual(self.resolve(str(order.pk + 1000)), order)
+        self.assertIsNone(self.resolve(str(order.pk + 2000)))
+
+    def test_order_number(self):
+        order = create_order()
+
+        self.assertEqual(self.resolve(order.order_number), order)
+        self.assertIsNone(self.resolve('ORD-MISSING'))
+
+
+class PackLocationUpdateTests(SimpleTestCase):
+    def test_fixes_without_timestamp_get_the_packing_time(self):
+        before = timezone.now()
+        points = [['19.0760000', '72.8777000', None], ['19.0761000', '72.8778000', 'not a time']]
+
+        frame = pack_location_update({'latitude': '19.0762000', 'longitude': '72.8779000'}, points)
+        fixes = decode_fixes(frame[1:])
+
+        self.assertEqual(frame[0], LOCATION_UPDATE_FRAME)
+        self.assertEqual(len(fixes), 3)
+        self.assertTrue(all(fix[0] >= before - timedelta(microseconds=1) for fix in fixes))
+        self.assertEqual(fixes[-1][1], Decimal('19.0762000'))
+
+
+class BinaryFrameTests(SimpleTestCase):
+    def consumer(self, binary=True):
+        consumer = TrackingConsumer()
+        consumer.binary = binary
+        consumer.send = mock.AsyncMock()
+        consumer.handle_location_update = mock.AsyncMock()
+        return consumer
+
+    def test_broadcast_packs_the_frame_once_for_every_socket(self):
+        layer = mock.Mock(group_send=mock.AsyncMock())
+        data = {'latitude': '19.0760000', 'longitude': '72.8777000', 'timestamp': '2024-01-15T10:30:00Z'}
+        with mock.patch('core.broadcasts.get_channel_layer', return_value=layer):
+            async_to_sync(GroupBroadcaster(0, 0).push)('tracking_1', data)
+        event = layer.group_send.call_args.args[1]
+        consumers = [self.consumer(), self.consumer()]
+
+        with mock.patch('core.consumers.pack_location_update') as pack:
+            for consumer in consumers:
+                async_to_sync(consumer.location_update)(event)
+
+        pack.assert_not_called()
+        for consumer in consumers:
+            consumer.send.assert_awaited_once_with(bytes_data=event['frame'])
+        self.assertEqual(event['frame'], pack_location_update(data))
+
+    def test_update_location_frames_are_stored(self):
+        consumer = self.consumer()
+        fix = Location(latitude=Decimal('19.0760000'), longitude=Decimal('72.8777000'), timestamp=timezone.now())
+
+        async_to_sync(consumer.receive)(bytes_data=bytes([UPDATE_LOCATION_FRAME]) + encode_fixes([fix]))
+
+        fixes = consumer.handle_location_update.call_args.args[0]['data']
+        self.assertEqual([(f['timestamp'], f['latitude']) for f in fixes], [(fix.timestamp, fix.latitude)])
+
+    def test_other_frames_are_errors(self):
+        for frame in (pack_location_update({'latitude': '19', 'longitude': '72'}), bytes([UPDATE_LOCATION_FRAME, 9])):
+            consumer = self.consumer()
+
+            async_to_sync(consumer.receive)(bytes_data=frame)
+
+            consumer.handle_location_update.assert_not_called()
+            self.assertIn('"type": "error"', consumer.send.call_args.kwargs['text_data'])
+
+
+class LatestWinsTests(SimpleTestCase):
+    INTERVAL = 0.05
+
+    def fix(self, second):
+        return {'latitude': f'19.00{second}', 'longitude': '72.0', 'timestamp': f'2024-01-15T10:30:0{second}Z'}
+
+    def run_pushes(self, seconds, max_points):
+        sent = []
+
+        async def send(data, points):
+            sent.append((data['timestamp'][-3:-1], [point[2][-3:-1] for point in points]))
+
+        async def pushes():
+            throttle = LatestWins(self.INTERVAL, send, max_points)
+            for second in seconds:
+                await throttle.push(self.fix(second))
+            await asyncio.sleep(self.INTERVAL * 3)
+            self.assertTrue(throttle.idle)
+
+        async_to_sync(pushes)()
+        return sent
+
+    def test_newest_fix_wins_and_held_fixes_follow_in_time_order(self):
+        # 02 arrives after 03 and is only held; 01 was displaced by 03
+        sent = self.run_pushes([0, 1, 3, 2], max_points=5)
+
+        self.assertEqual(sent, [('00', []), ('03', ['01', '02'])])
+
+    def test_held_points_are_capped_to_the_newest(self):
+        self.assertEqual(self.run_pushes([0, 1, 2, 3, 4], max_points=2), [('00', []), ('04', ['02', '03'])])
+        self.assertEqual(self.run_pushes([0, 1, 2], max_points=0), [('00', []), ('02', [])])
+
+    def test_groups_are_throttled_separately(self):
+        layer = mock.Mock(group_send=mock.AsyncMock())
+
+        async def pushes():
+            broadcaster = GroupBroadcaster(self.INTERVAL * 1000, 1)
+            await broadcaster.push('tracking_1', self.fix(0))
+            await broadcaster.push('tracking_2', self.fix(1))
+            await broadcaster.push('tracking_1', self.fix(2))
+            await broadcaster.push('tracking_1', self.fix(3))
+            await asyncio.sleep(self.INTERVAL * 3)
+
+        with mock.patch('core.broadcasts.get_channel_layer', return_value=layer):
+            async_to_sync(pushes)()
+
+        sent = [(group, message['data']['timestamp'][-3:-1], message.get('points'))
+                for group, message in (call.args for call in layer.group_send.await_args_list)]
+        self.assertEqual(sent, [
+            ('tracking_1', '00', None),
+            ('tracking_2', '01', None),
+            ('tracking_1', '03', [['19.002', '72.0', '2024-01-15T10:30:02Z']]),
+        ])
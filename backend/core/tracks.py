@@ -0,0 +1,785 @@
+"""Packed track storage for Location history.
+
+Older fixes of an order can be packed into LocationSegment rows. Each
+segment stores a run of fixes as delta encoded, zigzag varint integers
+(timestamp in microseconds, coordinates and measurements at the
+precision of their Location columns). Newer fixes stay in Location rows
+until ``pack_locations`` moves them.
+
+Readers should go through ``TrackHistory``, ``latest_location`` and
+``recent_locations``. These merge packed and unpacked fixes and yield
+Location instances, so serializers don't care where a fix is stored.
+Packed fixes come back as unsaved instances with no address, keeping the
+``id`` of the row they were packed from (None in segments packed without ids).
+The current position is served by ``latest_location_data`` from the copy
+kept on Order, reading Location only to fill in a missing copy.
+
+Once an order has been finished for LOCATION_RETENTION_DAYS,
+``downsample_order`` thins its track to one fix per
+LOCATION_RETENTION_INTERVAL_SECONDS plus the turning points needed to keep
+the route within LOCATION_RETENTION_TOLERANCE_M (``manage.py
+downsample_tracks``).
+"""
+import heapq
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import dropwhile, islice
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.db.models.base import ModelState
+from django.utils import timezone
+
+from .geo import path_length_m
+from .models import Order, Location, LocationSegment
+from .simplify import simplify_mask
+
+FORMAT_VERSION = 1
+
+# (Location field, decimal places) in the order they are encoded after the timestamp
+PACKED_FIELDS = (
+    ('latitude', 7),
+    ('longitude', 7),
+    ('speed', 2),
+    ('heading', 2),
+    ('altitude', 2),
+    ('accuracy', 2),
+)
+
+# Stands in for NULL measurements; consecutive NULLs delta-encode to zero
+NULL_VALUE = -(1 << 40)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+SCALES = {places: Decimal(1).scaleb(-places) for _, places in PACKED_FIELDS}
+
+# Every value fits in a 64-bit varint: ten bytes at most, so a fix is at most 70
+MAX_VARINT_SHIFT = 63
+MAX_FIX_BYTES = 10 * (len(PACKED_FIELDS) + 1)
+
+
+def packing_enabled():
+    return getattr(settings, 'LOCATION_PACKING_ENABLED', False)
+
+
+# Encoding
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _write_varint(buffer, value):
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _to_fixed(value, places):
+    if value is None:
+        return NULL_VALUE
+    return int(Decimal(str(value)).scaleb(places).to_integral_value())
+
+
+def encode_fixes(locations):
+    """Pack Location-like objects (ascending by timestamp) into bytes"""
+    buffer = bytearray([FORMAT_VERSION])
+    locations = list(locations)
+    _write_varint(buffer, len(locations))
+
+    previous = [0] * (len(PACKED_FIELDS) + 1)
+    for location in locations:
+        current = [(location.timestamp - EPOCH) // ONE_MICROSECOND]
+        current.extend(_to_fixed(getattr(location, name), places) for name, places in PACKED_FIELDS)
+        for index, value in enumerate(current):
+            _write_varint(buffer, _zigzag(value - previous[index]))
+        previous = current
+    return bytes(buffer)
+
+
+def _read_varints(data):
+    """Decode a buffer of unsigned varints with NumPy, one uint64 per varint"""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buffer < 0x80)
+    if not len(ends) or ends[-1] != len(buffer) - 1:
+        raise ValueError('Truncated location segment')
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+    if lengths.max() * 7 > MAX_VARINT_SHIFT + 7:
+        raise ValueError('Varint longer than 64 bits')
+    shifts = (np.arange(len(buffer)) - np.repeat(starts, lengths)).astype(np.uint64) * np.uint64(7)
+    return np.add.reduceat((buffer & 0x7F).astype(np.uint64) << shifts, starts)
+
+
+def _unzigzag(values):
+    return ((values >> np.uint64(1)) ^ (np.uint64(0) - (values & np.uint64(1)))).view(np.int64)
+
+
+def decode_values(data, max_fixes=None):
+    """The fixes as an int64 array of (microseconds, fixed-point PACKED_FIELDS) rows, oldest first"""
+    data = bytes(data)
+    if not data or data[0] != FORMAT_VERSION:
+        raise ValueError('Unsupported location segment format')
+
+    integers = _read_varints(data[1:])
+    total, deltas = int(integers[0]), integers[1:]
+    if max_fixes is not None and total > max_fixes:
+        raise ValueError(f'More than {max_fixes} fixes')
+    width = len(PACKED_FIELDS) + 1
+    if len(deltas) != total * width:
+        raise ValueError('Truncated location segment')
+
+    # Un-zigzag and undo the delta encoding a column at a time
+    return np.cumsum(_unzigzag(deltas).reshape(total, width), axis=0)
+
+
+def decode_fixes(data, max_fixes=None):
+    """Return (timestamp, latitude, longitude, speed, heading, altitude, accuracy) tuples, oldest first"""
+    values = decode_values(data, max_fixes)
+    columns = [[EPOCH + micros * ONE_MICROSECOND for micros in values[:, 0].tolist()]]
+    for index, (_, places) in enumerate(PACKED_FIELDS, start=1):
+        # Measurements repeat a lot (and NULLs always do); build each distinct Decimal once.
+        # Multiplying by 1E-places gives the same Decimal as scaleb(), faster.
+        distinct, positions = np.unique(values[:, index], return_inverse=True)
+        decimals = list(map(SCALES[places].__mul__, map(Decimal, distinct.tolist())))
+        if len(distinct) and distinct[0] == NULL_VALUE:
+            # NULL_VALUE is below any real value, so it can only sort first
+            decimals[0] = None
+        columns.append(list(map(decimals.__getitem__, positions.tolist())))
+    return list(zip(*columns))
+
+
+def encode_ids(ids):
+    """Pack Location ids as zigzag varint deltas"""
+    buffer = bytearray()
+    previous = 0
+    for value in ids:
+        _write_varint(buffer, _zigzag(value - previous))
+        previous = value
+    return bytes(buffer)
+
+
+def decode_ids(data, count):
+    """The ids packed by ``encode_ids``, or ``count`` Nones when none were kept"""
+    data = bytes(data)
+    if not data:
+        return [None] * count
+    return np.cumsum(_unzigzag(_read_varints(data))).tolist()
+
+
+FIX_FIELDS = ('timestamp',) + tuple(name for name, _ in PACKED_FIELDS)
+_UNPACKED_VALUES = {
+    field.attname: None for field in Location._meta.concrete_fields if field.attname not in FIX_FIELDS
+}
+_ORDER_CACHE_NAME = Location._meta.get_field('order').get_cache_name()
+
+
+def _build_locations(fixes, order):
+    """Unsaved Location instances for ``(fix, location id)`` pairs of one order.
+
+    Packed histories run to tens of thousands of fixes; filling __dict__
+    directly is several times faster than Model.__init__ per instance.
+    """
+    base = _UNPACKED_VALUES.copy()
+    base['order_id'] = order.pk
+    new = Location.__new__
+    for fix, location_id in fixes:
+        state = ModelState()
+        state.fields_cache = {_ORDER_CACHE_NAME: order}
+        values = base.copy()
+        values.update(zip(FIX_FIELDS, fix))
+        values['_state'] = state
+        values['id'] = location_id
+        location = new(Location)
+        location.__dict__ = values
+        yield location
+
+
+def _build_location(fix, order, location_id=None):
+    return next(_build_locations([(fix, location_id)], order))
+
+
+def segment_fixes(segment):
+    """``(fix, location id)`` pairs of one segment in ``stream_key`` order, oldest first"""
+    fixes = decode_fixes(segment.data)
+    return list(zip(fixes, decode_ids(segment.location_ids, len(fixes))))
+
+
+def iter_segment_locations(segment, descending=True, since=None, until=None):
+    """Yield the fixes of one segment as unsaved Location instances"""
+    fixes = segment_fixes(segment)
+    if since is not None or until is not None:
+        fixes = [
+            pair for pair in fixes
+            if (since is None or pair[0][0] >= since) and (until is None or pair[0][0] <= until)
+        ]
+    if descending:
+        fixes.reverse()
+    return _build_locations(fixes, segment.order)
+
+
+# Reading
+
+def _merge_segments(segments, descending, since, until):
+    """Lazily merge segments into one stream in ``stream_key`` order.
+
+    ``segments`` must arrive ordered by end_time descending (or start_time
+    ascending). A segment is only decoded once its newest (oldest) fix may
+    be next in the stream, and fixes are drained from the current segment
+    without heap operations until another segment could come first. A
+    segment that ends before anything else could start is drained without
+    comparisons, so a single order's non-overlapping segments stream at
+    decode speed.
+    """
+    heap = []
+    sequence = 0
+    sign = -1 if descending else 1
+    segments = iter(segments)
+    pending = next(segments, None)
+
+    # The first and last keys a segment could yield, whatever the ids of its fixes
+    def boundary(segment):
+        return (segment.end_time, math.inf) if descending else (segment.start_time, 0)
+
+    def far_end(segment):
+        return (segment.start_time, 0) if descending else (segment.end_time, math.inf)
+
+    def comes_first(key, other):
+        return key >= other if descending else key <= other
+
+    def push(location, iterator, segment):
+        nonlocal sequence
+        micros = (location.timestamp - EPOCH) // ONE_MICROSECOND
+        heapq.heappush(heap, (sign * micros, sign * (location.id or 0), sequence, location, iterator, segment))
+        sequence += 1
+
+    while heap or pending is not None:
+        while pending is not None and (not heap or comes_first(boundary(pending), stream_key(heap[0][3]))):
+            iterator = iter_segment_locations(pending, descending, since, until)
+            location = next(iterator, None)
+            if location is not None:
+                push(location, iterator, pending)
+            pending = next(segments, None)
+        if not heap:
+            continue
+
+        _, _, _, location, iterator, segment = heapq.heappop(heap)
+        limits = [stream_key(entry[3]) for entry in heap[:1]]
+        if pending is not None:
+            limits.append(boundary(pending))
+        limit = (max(limits) if descending else min(limits)) if limits else None
+
+        yield location
+        if limit is None or comes_first(far_end(segment), limit):
+            yield from iterator
+            continue
+        for location in iterator:
+            if not comes_first(stream_key(location), limit):
+                push(location, iterator, segment)
+                break
+            yield location
+
+
+def stream_key(location):
+    """Sort key of a fix within a track; fixes packed without their id sort as 0"""
+    return location.timestamp, location.id or 0
+
+
+class TrackHistory:
+    """Sequence of the fixes of one or more orders, rows and segments merged.
+
+    Supports ``len()``/``count()``, iteration and slicing, so it can be handed
+    to Django's Paginator or DRF pagination in place of a Location queryset.
+    Fixes stream in ``stream_key`` order. With a ``tolerance`` the history
+    yields only the fixes kept by track simplification.
+    """
+
+    def __init__(self, locations, segments=None, descending=True, since=None, until=None, tolerance=None):
+        self._source = (locations, segments)
+        if since is not None:
+            locations = locations.filter(timestamp__gte=since)
+        if until is not None:
+            locations = locations.filter(timestamp__lte=until)
+        self.locations = locations.order_by(*(('-timestamp', '-id') if descending else ('timestamp', 'id')))
+        if segments is not None and packing_enabled():
+            if since is not None:
+                segments = segments.filter(end_time__gte=since)
+            if until is not None:
+                segments = segments.filter(start_time__lte=until)
+            segments = segments.select_related('order').order_by(
+                '-end_time' if descending else 'start_time'
+            )
+        else:
+            segments = None
+        self.segments = segments
+        self.descending = descending
+        self.since = since
+        self.until = until
+        self.tolerance = tolerance
+        self.after_key = None
+        self._count = None
+
+    def after(self, timestamp, location_id):
+        """The same history from just past the fix keyed ``(timestamp, location_id)``.
+
+        Used for keyset pagination. Packed fixes keep the id of the row they
+        were packed from, so the key of a fix doesn't change when it's packed.
+        A simplified history still simplifies the whole track and skips the
+        kept fixes up to the key, so every page is a slice of the same result.
+        """
+        locations, segments = self._source
+        if self.tolerance is not None:
+            history = TrackHistory(locations, segments, self.descending, self.since, self.until, self.tolerance)
+            history.after_key = (timestamp, location_id)
+            return history
+        if self.descending:
+            locations = locations.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=location_id))
+        else:
+            locations = locations.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=location_id))
+        history = TrackHistory(locations, segments, self.descending, self.since, self.until, self.tolerance)
+        if history.segments is not None:
+            if self.descending:
+                history.until = timestamp if self.until is None else min(self.until, timestamp)
+                history.segments = history.segments.filter(start_time__lte=history.until)
+            else:
+                history.since = timestamp if self.since is None else max(self.since, timestamp)
+                history.segments = history.segments.filter(end_time__gte=history.since)
+            history.after_key = (timestamp, location_id)
+        return history
+
+    def _seen(self, key):
+        """True for keys at or before ``after_key`` in stream order"""
+        return key >= self.after_key if self.descending else key <= self.after_key
+
+    def _drop_seen(self, locations):
+        if self.after_key is None:
+            return locations
+        return dropwhile(lambda location: self._seen(stream_key(location)), locations)
+
+    def count(self):
+        if self._count is None and self.tolerance is not None:
+            self._count = sum(1 for _ in self._stream())
+        if self._count is None:
+            total = self.locations.count()
+            if self.segments is not None:
+                total += self._count_packed()
+            self._count = total
+        return self._count
+
+    __len__ = count
+
+    def _count_packed(self):
+        """Sum point_count of the segments entirely within the bounds and decode only the rest"""
+        inside = Q()
+        if self.since is not None:
+            inside &= Q(start_time__gte=self.since)
+        if self.until is not None:
+            inside &= Q(end_time__lte=self.until)
+        if self.after_key is not None:
+            inside &= Q(end_time__lt=self.after_key[0]) if self.descending else Q(start_time__gt=self.after_key[0])
+        total = self.segments.filter(inside).aggregate(total=Sum('point_count'))['total'] or 0
+        if inside:
+            for segment in self.segments.exclude(inside).iterator(chunk_size=100):
+                total += sum(1 for _ in self._drop_seen(
+                    iter_segment_locations(segment, self.descending, self.since, self.until)
+                ))
+        return total
+
+    def _segment_stream(self):
+        return self._drop_seen(_merge_segments(
+            self.segments.iterator(chunk_size=100), self.descending, self.since, self.until
+        ))
+
+    def _stream(self, stop=None):
+        if self.tolerance is not None:
+            return self._drop_seen(iter(self.simplified(self.tolerance)))
+        rows = self.locations if stop is None else self.locations[:stop]
+        if self.segments is None:
+            return iter(rows)
+        return heapq.merge(
+            rows.iterator(chunk_size=2000) if stop is None else rows,
+            self._segment_stream(),
+            key=stream_key,
+            reverse=self.descending,
+        )
+
+    def __iter__(self):
+        return self._stream()
+
+    def _points(self):
+        """``(timestamp, order_id, latitude, longitude, id, fix, segment order)`` in stream order.
+
+        Reads only the coordinate columns of rows and skips building Location
+        instances; packed points also carry their decoded fix and order, rows None.
+        """
+        points = [
+            (timestamp, order_id, latitude, longitude, location_id, None, None)
+            for location_id, order_id, timestamp, latitude, longitude in self.locations.values_list(
+                'id', 'order_id', 'timestamp', 'latitude', 'longitude'
+            ).iterator(chunk_size=2000)
+        ]
+        if self.segments is not None:
+            for segment in self.segments.iterator(chunk_size=100):
+                for fix, location_id in segment_fixes(segment):
+                    if self.since is not None and fix[0] < self.since:
+                        continue
+                    if self.until is not None and fix[0] > self.until:
+                        continue
+                    points.append((fix[0], segment.order_id, fix[1], fix[2], location_id, fix, segment.order))
+            points.sort(key=lambda point: (point[0], point[4] or 0), reverse=self.descending)
+        return points
+
+    def simplified(self, tolerance):
+        """The fixes needed to draw each order's route within ``tolerance`` meters, in stream order.
+
+        The full history is read as coordinates only; Location instances are
+        built for the kept fixes alone.
+        """
+        points = self._points()
+        keep = simplify_mask(
+            [point[1] for point in points],
+            [float(point[2]) for point in points],
+            [float(point[3]) for point in points],
+            tolerance,
+        )
+        kept = [point for point, kept in zip(points, keep) if kept]
+        rows = Location.objects.select_related('order').in_bulk(
+            [point[4] for point in kept if point[5] is None]
+        )
+        return [
+            rows[point[4]] if point[5] is None else _build_location(point[5], point[6], point[4])
+            for point in kept
+        ]
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.step not in (None, 1) or (item.start or 0) < 0 or (item.stop is not None and item.stop < 0):
+                raise ValueError('TrackHistory only supports forward slices')
+            if self.segments is None and self.tolerance is None:
+                return list(self.locations[item])
+            return list(islice(self._stream(item.stop), item.start or 0, item.stop))
+        if item < 0:
+            raise IndexError('Negative indexing is not supported')
+        result = self[item:item + 1]
+        if not result:
+            raise IndexError('Track index out of range')
+        return result[0]
+
+
+def order_track(order, descending=True, since=None, until=None):
+    """TrackHistory for a single order, given as an instance or an id"""
+    if isinstance(order, Order):
+        # The related manager hands the order to every fix without joining it per row
+        locations, segments = order.locations.all(), order.location_segments.all()
+    else:
+        locations = Location.objects.filter(order_id=order).select_related('order')
+        segments = LocationSegment.objects.filter(order_id=order)
+    return TrackHistory(locations, segments, descending=descending, since=since, until=until)
+
+
+def recent_locations(order, limit=50):
+    """The newest ``limit`` fixes of an order, newest first"""
+    return order_track(order)[:limit]
+
+
+def latest_location(order):
+    """The newest fix of an order or None"""
+    location = Location.objects.filter(order=order).select_related('order').order_by('-timestamp').first()
+    if not packing_enabled():
+        return location
+    # Buffered device uploads can carry timestamps older than packed history,
+    # so the newest row is not necessarily newer than the newest segment.
+    segment = LocationSegment.objects.filter(order=order).select_related('order').order_by('-end_time').first()
+    if segment is None or (location is not None and location.timestamp >= segment.end_time):
+        return location
+    return next(iter_segment_locations(segment), None)
+
+
+# Track summary
+
+def refresh_track_stats(order_id):
+    """Lock the order and recompute its track summary from the whole history.
+
+    Must be called inside ``transaction.atomic()``.
+    """
+    order = Order.objects.select_for_update().only('id', *Order.TRACK_STATS_FIELDS).get(pk=order_id)
+    points = order_track(order_id, descending=False)._points()
+    order.fix_count = len(points)
+    order.first_fix_at = points[0][0] if points else None
+    order.last_fix_at = points[-1][0] if points else None
+    order.last_latitude = points[-1][2] if points else None
+    order.last_longitude = points[-1][3] if points else None
+    order.distance_travelled = _meters(path_length_m(
+        [float(point[2]) for point in points], [float(point[3]) for point in points]
+    ))
+    order.last_location = _location_data(latest_location(order_id)) if points else None
+    _save_track_stats(order)
+    return order
+
+
+def record_fixes(order_id, locations):
+    """Fold newly stored fixes into the order's track summary.
+
+    Call inside the transaction that stored them. Appended fixes update the
+    summary incrementally; a fix older than the newest recorded one changes
+    the path, so the summary is recomputed. So is an unset summary over
+    earlier fixes, which orders tracked before the summary existed have.
+    """
+    if not locations:
+        return None
+    order = Order.objects.select_for_update().only('id', *Order.TRACK_STATS_FIELDS).get(pk=order_id)
+    fixes = sorted(locations, key=stream_key)
+    if order.last_fix_at is not None and fixes[0].timestamp < order.last_fix_at:
+        return refresh_track_stats(order_id)
+    if order.last_fix_at is None and _has_other_fixes(order_id, len(fixes)):
+        return refresh_track_stats(order_id)
+
+    latitudes = [float(fix.latitude) for fix in fixes]
+    longitudes = [float(fix.longitude) for fix in fixes]
+    if order.last_fix_at is not None:
+        latitudes.insert(0, float(order.last_latitude))
+        longitudes.insert(0, float(order.last_longitude))
+    else:
+        order.first_fix_at = fixes[0].timestamp
+    order.fix_count += len(fixes)
+    order.last_fix_at = fixes[-1].timestamp
+    order.last_latitude = fixes[-1].latitude
+    order.last_longitude = fixes[-1].longitude
+    order.distance_travelled += _meters(path_length_m(latitudes, longitudes))
+    order.last_location = _location_data(fixes[-1])
+    _save_track_stats(order)
+    return order
+
+
+def _has_other_fixes(order_id, stored):
+    """True if the order has fixes besides the ``stored`` just written"""
+    if LocationSegment.objects.filter(order_id=order_id).exists():
+        return True
+    return Location.objects.filter(order_id=order_id)[:stored + 1].count() > stored
+
+
+def _save_track_stats(order):
+    # Queryset update: Order.save() would load the deferred order_number
+    Order.objects.filter(pk=order.pk).update(
+        **{field: getattr(order, field) for field in Order.TRACK_STATS_FIELDS}
+    )
+
+
+def _location_data(location):
+    from .serializers import LocationSerializer
+    return dict(LocationSerializer(location).data) if location is not None else None
+
+
+def latest_location_data(order):
+    """Serialized newest fix of an order, or None.
+
+    Reads the copy kept on Order. Only when it is unset, as on orders tracked
+    before the copy existed, is the newest fix read and written back.
+    """
+    if order.last_location is not None:
+        return order.last_location
+    data = _location_data(latest_location(order.pk))
+    if data is not None:
+        # A concurrent upload may have stored a newer copy meanwhile; keep it
+        Order.objects.filter(pk=order.pk, last_location__isnull=True).update(last_location=data)
+        order.last_location = data
+    return data
+
+
+def _meters(value):
+    return Decimal(str(value)).quantize(Decimal('0.1'))
+
+
+# Packing
+
+def pack_order(order_id, before, segment_size=None):
+    """Move the order's Location rows older than ``before`` into segments.
+
+    Returns ``(fixes_packed, segments_created)``.
+    """
+    segment_size = segment_size or getattr(settings, 'LOCATION_SEGMENT_SIZE', 1000)
+    packed = created = 0
+    with transaction.atomic():
+        rows = list(
+            Location.objects.select_for_update()
+            .filter(order_id=order_id, timestamp__lt=before)
+            .order_by('timestamp', 'id')
+        )
+        segments = []
+        for start in range(0, len(rows), segment_size):
+            chunk = rows[start:start + segment_size]
+            segments.append(LocationSegment(
+                order_id=order_id,
+                start_time=chunk[0].timestamp,
+                end_time=chunk[-1].timestamp,
+                point_count=len(chunk),
+                data=encode_fixes(chunk),
+                location_ids=encode_ids([row.id for row in chunk]),
+            ))
+        if segments:
+            LocationSegment.objects.bulk_create(segments)
+            Location.objects.filter(id__in=[row.id for row in rows]).delete()
+            packed, created = len(rows), len(segments)
+    return packed, created
+
+
+def unpack_order(order_id):
+    """Turn the order's segments back into Location rows. Returns the number of fixes restored.
+
+    Rows get back the id they were packed from, where the segment kept it.
+    """
+    restored = 0
+    with transaction.atomic():
+        segments = list(LocationSegment.objects.select_for_update().filter(order_id=order_id))
+        for segment in segments:
+            locations = [
+                Location(
+                    id=location_id, order_id=order_id, timestamp=fix[0], latitude=fix[1], longitude=fix[2],
+                    speed=fix[3], heading=fix[4], altitude=fix[5], accuracy=fix[6],
+                )
+                for fix, location_id in segment_fixes(segment)
+            ]
+            Location.objects.bulk_create(locations, batch_size=1000)
+            restored += len(locations)
+        LocationSegment.objects.filter(id__in=[segment.id for segment in segments]).delete()
+    return restored
+
+
+# Downsampling
+
+FINISHED_STATUSES = ('delivered', 'completed', 'cancelled')
+
+# Location row plus its index entries, where the database can't tell (see location_row_bytes)
+ESTIMATED_LOCATION_ROW_BYTES = 150
+
+
+def downsample_mask(micros, latitudes, longitudes, interval, tolerance):
+    """Boolean mask of the time ordered fixes of one order to keep.
+
+    The first fix of every ``interval`` seconds is kept, and so is every fix
+    track simplification needs to stay within ``tolerance`` meters of the
+    route, which includes the turns and both ends.
+    """
+    buckets = np.floor(np.asarray(micros) / (interval * 1e6))
+    keep = np.ones(len(buckets), dtype=bool)
+    keep[1:] = buckets[1:] != buckets[:-1]
+    return keep | simplify_mask(np.zeros(len(buckets)), latitudes, longitudes, tolerance)
+
+
+def _track_columns(order_id):
+    """Time ordered arrays of an order's fixes: ``(micros, latitudes, longitudes, segment_ids, positions)``.
+
+    Read a segment at a time, keeping only what ``downsample_mask`` needs.
+    A fix stored as a row has segment id 0 and its row id as position; a
+    packed fix has its segment's id and its index in the segment.
+    """
+    rows = np.array([
+        ((timestamp - EPOCH) // ONE_MICROSECOND, location_id, float(latitude), float(longitude), 0, location_id)
+        for location_id, timestamp, latitude, longitude in Location.objects.filter(order_id=order_id)
+        .values_list('id', 'timestamp', 'latitude', 'longitude').iterator(chunk_size=2000)
+    ], dtype=float).reshape(-1, 6)
+    parts = [rows]
+    scale = 10.0 ** -np.array([places for _, places in PACKED_FIELDS[:2]])
+    segments = LocationSegment.objects.filter(order_id=order_id).only('id', 'data', 'location_ids', 'point_count')
+    for segment in segments.iterator(chunk_size=100):
+        values = decode_values(segment.data)
+        part = np.empty((len(values), 6))
+        part[:, 0] = values[:, 0]
+        part[:, 1] = [location_id or 0 for location_id in decode_ids(segment.location_ids, len(values))]
+        part[:, 2:4] = values[:, 1:3] * scale
+        part[:, 4] = segment.id
+        part[:, 5] = np.arange(len(values))
+        parts.append(part)
+    columns = np.vstack(parts)
+    # Microsecond timestamps and ids fit a float64 exactly
+    columns = columns[np.lexsort((columns[:, 1], columns[:, 0]))]
+    return (
+        columns[:, 0], columns[:, 2], columns[:, 3],
+        columns[:, 4].astype(np.int64), columns[:, 5].astype(np.int64),
+    )
+
+
+def _thin_segment(segment, positions):
+    """Rewrite a locked segment with only the fixes at ``positions``; returns (fixes dropped, bytes saved)"""
+    fixes = segment_fixes(segment)
+    kept = [fixes[position] for position in positions]
+    size = len(segment.data)
+    if not kept:
+        segment.delete()
+        return len(fixes), size
+    locations = [
+        Location(id=location_id, order_id=segment.order_id, **dict(zip(FIX_FIELDS, fix)))
+        for fix, location_id in kept
+    ]
+    ids = [location.id for location in locations]
+    segment.start_time = locations[0].timestamp
+    segment.end_time = locations[-1].timestamp
+    segment.point_count = len(locations)
+    segment.data = encode_fixes(locations)
+    segment.location_ids = encode_ids(ids) if all(ids) else b''
+    segment.save(update_fields=['start_time', 'end_time', 'point_count', 'data', 'location_ids'])
+    return len(fixes) - len(kept), size - len(segment.data)
+
+
+def location_row_bytes():
+    """Average bytes a Location row takes with its indexes"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_total_relation_size(oid) / NULLIF(reltuples, 0) FROM pg_class WHERE oid = %s::regclass",
+                [Location._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] and row[0] > 0:
+            return float(row[0])
+    return ESTIMATED_LOCATION_ROW_BYTES
+
+
+def downsample_order(order_id, interval, tolerance, batch_size=5000):
+    """Thin a finished order's track and lower its fix count.
+
+    Dropped Location rows are deleted ``batch_size`` per transaction. Each
+    packed segment is rewritten with its kept fixes in its own transaction,
+    once locked; a segment that ``pack_order``, ``unpack_order`` or another
+    run replaced or rewrote meanwhile is left alone, so no fix is lost. The rest of the
+    track summary, including ``distance_travelled``, still describes the
+    full track and is kept. Returns ``(rows_deleted, packed_fixes_dropped,
+    segment_bytes_saved)``.
+    """
+    micros, latitudes, longitudes, segment_ids, positions = _track_columns(order_id)
+    keep = downsample_mask(micros, latitudes, longitudes, interval, tolerance)
+
+    dropped_rows = positions[(segment_ids == 0) & ~keep].tolist()
+    deleted = 0
+    for start in range(0, len(dropped_rows), batch_size):
+        with transaction.atomic():
+            deleted += Location.objects.filter(
+                order_id=order_id, id__in=dropped_rows[start:start + batch_size]
+            ).delete()[0]
+
+    dropped_packed = saved_bytes = 0
+    for segment_id in np.unique(segment_ids[(segment_ids != 0) & ~keep]).tolist():
+        read = segment_ids == segment_id
+        with transaction.atomic():
+            segment = (
+                LocationSegment.objects.select_for_update()
+                .filter(pk=segment_id, point_count=np.count_nonzero(read))
+                .first()
+            )
+            if segment is None:
+                continue
+            dropped, saved = _thin_segment(segment, positions[read & keep].tolist())
+            dropped_packed += dropped
+            saved_bytes += saved
+
+    with transaction.atomic():
+        order = Order.objects.select_for_update().only('id', 'fix_count').get(pk=order_id)
+        Order.objects.filter(pk=order_id).update(
+            fix_count=max(order.fix_count - deleted - dropped_packed, 0), track_downsampled_at=timezone.now()
+        )
+    return deleted, dropped_packed, saved_bytes
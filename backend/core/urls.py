@@ -29,12 +29,17 @@ urlpatterns = [
     # Dashboard URLs
     path('dashboard/admin/', views.admin_dashboard, name='admin_dashboard'),
     path('dashboard/truck-owner/', views.truck_owner_dashboard, name='truck_owner_dashboard'),
+    path('dashboard/admin/timeseries/', views.admin_timeseries, name='admin_timeseries'),
+    path('dashboard/truck-owner/timeseries/', views.truck_owner_timeseries, name='truck_owner_timeseries'),
+    path('dashboard/cache-stats/', views.dashboard_cache_stats, name='dashboard_cache_stats'),
     
     # Location tracking URLs
     path('orders/<int:order_id>/current-location/', views.current_location, name='current_location'),
+    path('orders/<int:order_id>/locations/batch/', views.location_batch, name='location_batch'),
     
     # Search URLs
     path('search/requirements/', views.search_requirements, name='search_requirements'),
+    path('search/requirements/nearby/', views.nearby_requirements, name='nearby_requirements'),
     
     # Include router URLs
     path('', include(router.urls)),
@@ -1,22 +1,34 @@
 from rest_framework import generics, viewsets, status, permissions
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, parser_classes
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.core.cache import cache
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, Avg, Sum
+from django.db import transaction
+from django.db.models import Prefetch
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from datetime import timedelta
 
-from .models import User, Truck, Requirement, Bid, Order, Location, Notification
+from .models import (
+    User, Truck, Requirement, Bid, Order, Location, LocationSegment, Notification, NotificationArchive
+)
+from . import auctions, broadcasts, dashboards, gazetteer, matching, notifications, proximity, rollups, search, simplify, tracks
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer,
     TruckSerializer, RequirementSerializer, RequirementDetailSerializer,
     BidSerializer, BidResponseSerializer, OrderSerializer, OrderDetailSerializer,
-    OrderStatusUpdateSerializer, LocationSerializer, NotificationSerializer,
-    DashboardStatsSerializer, TruckOwnerStatsSerializer
+    OrderStatusUpdateSerializer, LocationSerializer, LocationBatchSerializer,
+    NotificationSerializer, OrderTimeseriesSerializer, NearbyRequirementSerializer,
+    TruckMatchSerializer, RequirementMatchSerializer
 )
+from .pagination import LocationCursorPagination, RequirementCursorPagination
+from .parsers import TrackParser
 from .permissions import (
     IsAdmin, IsTruckOwner, IsAdminOrTruckOwner, IsOwnerOrAdmin,
     IsAdminOrReadOnly, IsTruckOwnerOrReadOnly, CanBidOnRequirement,
@@ -25,10 +37,48 @@ from .permissions import (
 
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from .models import Order, Location
-from .serializers import LocationSerializer
 import random
-import time
+
+
+def lock_requirements(*requirement_ids):
+    """Lock requirement rows in id order, before writing the bids that reference them.
+
+    Inserting a bid takes a key-share lock on its requirement, so locking the
+    requirement only afterwards lets two concurrent bids deadlock. Must be
+    called inside ``transaction.atomic()`` together with the bid writes.
+    """
+    return list(Requirement.objects.select_for_update().filter(pk__in=set(requirement_ids)).order_by('pk'))
+
+
+def send_tracking_update(order_id, message_type, data):
+    """Send a message to everyone tracking the order over WebSocket.
+
+    ``order_id`` must be the pk: TrackingConsumer joins ``tracking_<pk>`` even
+    when the socket was opened with the order number. Location updates are
+    coalesced per order by core.broadcasts; other messages go out at once.
+    """
+    if message_type == 'location_update':
+        async_to_sync(broadcasts.broadcast_location)(f'tracking_{order_id}', data)
+        return
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        f'tracking_{order_id}',
+        {
+            'type': message_type,
+            'data': data
+        }
+    )
+
+
+def get_simplify_tolerance(request):
+    """Tolerance in meters from ``?simplify=``, or None when not requested"""
+    value = request.query_params.get('simplify')
+    if value in (None, ''):
+        return None
+    try:
+        return simplify.parse_tolerance(value)
+    except ValueError as exc:
+        raise ValidationError({'simplify': [str(exc)]})
 
 
 # Authentication Views
@@ -90,11 +140,22 @@ class TruckViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         if self.request.user.role == 'admin':
-            return Truck.objects.all()
-        return Truck.objects.filter(user=self.request.user)
+            queryset = Truck.objects.all()
+        else:
+            queryset = Truck.objects.filter(user=self.request.user)
+        return queryset.select_related('user').order_by('-created_at')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+    
+    @action(detail=True, methods=['get'])
+    def matches(self, request, pk=None):
+        """Best open requirements for a truck, as of the last match_trucks run"""
+        truck = self.get_object()
+        matches = truck.matches.filter(
+            requirement__status='open', requirement__is_active=True
+        ).select_related('requirement__admin')
+        return Response(RequirementMatchSerializer(matches, many=True).data)
 
 
 # Requirement Management Views
@@ -135,10 +196,28 @@ class RequirementViewSet(viewsets.ModelViewSet):
             else:
                 queryset = queryset.filter(admin=self.request.user)
         
-        return queryset.select_related('admin').prefetch_related('bids')
+        queryset = queryset.select_related('admin')
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                Prefetch('bids', queryset=Bid.objects.select_related('user', 'truck'))
+            )
+        return queryset
     
     def perform_create(self, serializer):
-        serializer.save(admin=self.request.user)
+        data = serializer.validated_data
+        serializer.save(
+            admin=self.request.user,
+            # Matching truck owners are notified by the fan-out job (core/fanout.py)
+            fanout_cursor=0,
+            **gazetteer.requirement_coordinates(data['from_location'], data['to_location'])
+        )
+    
+    def perform_update(self, serializer):
+        data, requirement = serializer.validated_data, serializer.instance
+        serializer.save(**gazetteer.requirement_coordinates(
+            data.get('from_location', requirement.from_location),
+            data.get('to_location', requirement.to_location),
+        ))
     
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def bids(self, request, pk=None):
@@ -153,6 +232,26 @@ class RequirementViewSet(viewsets.ModelViewSet):
         
         return Response({'detail': 'Permission denied'}, 
                        status=status.HTTP_403_FORBIDDEN)
+    
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def matches(self, request, pk=None):
+        """Available trucks best suited to a requirement, best first"""
+        requirement = self.get_object()
+        if not (request.user.role == 'admin' and requirement.admin_id == request.user.id):
+            return Response({'detail': 'Permission denied'}, 
+                           status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            limit = int(request.query_params.get('limit', matching.DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': ['Must be an integer']})
+        limit = min(max(limit, 1), matching.MAX_LIMIT)
+        
+        matches = matching.match_trucks(requirement, limit)
+        trucks = Truck.objects.select_related('user').in_bulk([match['truck_id'] for match in matches])
+        for match in matches:
+            match['truck'] = trucks[match['truck_id']]
+        return Response(TruckMatchSerializer(matches, many=True).data)
 
 
 # Bid Management Views
@@ -174,7 +273,34 @@ class BidViewSet(viewsets.ModelViewSet):
             ).select_related('requirement', 'user', 'truck')
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            requirements = lock_requirements(serializer.validated_data['requirement'].pk)
+            serializer.save(user=self.request.user)
+            for requirement in requirements:
+                requirement.refresh_bid_stats()
+    
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            requirement = serializer.validated_data.get('requirement', serializer.instance.requirement)
+            requirements = lock_requirements(serializer.instance.requirement_id, requirement.pk)
+            # An accepted bid's amount is in its order's rollups
+            order = Order.objects.select_related('requirement', 'accepted_bid').filter(
+                accepted_bid=serializer.instance
+            ).first()
+            old_facts = rollups.order_facts(order) if order is not None else None
+            bid = serializer.save()
+            for requirement in requirements:
+                requirement.refresh_bid_stats()
+            if order is not None:
+                order.accepted_bid = bid
+                rollups.record_order_change(old_facts, rollups.order_facts(order))
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            requirements = lock_requirements(instance.requirement_id)
+            instance.delete()
+            for requirement in requirements:
+                requirement.refresh_bid_stats()
     
     @action(detail=True, methods=['patch'], permission_classes=[IsAdmin])
     def respond(self, request, pk=None):
@@ -188,52 +314,14 @@ class BidViewSet(viewsets.ModelViewSet):
         
         serializer = BidResponseSerializer(bid, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
-            
-            # If bid is accepted, create an order
-            if serializer.validated_data['status'] == 'accepted':
-                # Mark requirement as assigned
-                bid.requirement.status = 'assigned'
-                bid.requirement.save()
-                
-                # Reject all other bids for this requirement
-                Bid.objects.filter(
-                    requirement=bid.requirement
-                ).exclude(id=bid.id).update(
-                    status='rejected',
-                    response_message='Another bid was selected'
-                )
-                
-                # Create order
-                order = Order.objects.create(
-                    requirement=bid.requirement,
-                    user=bid.user,
-                    truck=bid.truck,
-                    accepted_bid=bid,
-                    estimated_delivery_time=timezone.now() + bid.estimated_delivery_time
-                )
-                
-                # Create notification for truck owner
-                Notification.objects.create(
-                    user=bid.user,
-                    title='Bid Accepted',
-                    message=f'Your bid for "{bid.requirement.title}" has been accepted!',
-                    notification_type='bid_accepted',
-                    requirement=bid.requirement,
-                    order=order,
-                    bid=bid
-                )
-            
-            # Create notification for bid rejection
-            elif serializer.validated_data['status'] == 'rejected':
-                Notification.objects.create(
-                    user=bid.user,
-                    title='Bid Rejected',
-                    message=f'Your bid for "{bid.requirement.title}" has been rejected.',
-                    notification_type='bid_rejected',
-                    requirement=bid.requirement,
-                    bid=bid
-                )
+            with transaction.atomic():
+                try:
+                    if serializer.validated_data['status'] == 'accepted':
+                        auctions.accept_bid(bid, serializer.validated_data.get('response_message'))
+                    else:
+                        auctions.reject_bid(bid, serializer.validated_data.get('response_message'))
+                except auctions.BidNotAcceptable as exc:
+                    raise ValidationError({'status': [str(exc)]})
             
             return Response(BidSerializer(bid).data)
         
@@ -252,15 +340,31 @@ class OrderViewSet(viewsets.ModelViewSet):
             return OrderStatusUpdateSerializer
         return OrderSerializer
     
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'retrieve':
+            context['simplify'] = get_simplify_tolerance(self.request)
+        return context
+    
     def get_queryset(self):
         if self.request.user.role == 'admin':
-            return Order.objects.filter(
+            queryset = Order.objects.filter(
                 requirement__admin=self.request.user
             ).select_related('requirement', 'user', 'truck', 'accepted_bid')
         else:
-            return Order.objects.filter(
+            queryset = Order.objects.filter(
                 user=self.request.user
             ).select_related('requirement', 'user', 'truck', 'accepted_bid')
+        if self.action == 'retrieve':
+            # requirement_details shows the admin's name
+            queryset = queryset.select_related('requirement__admin')
+        return queryset
+    
+    def perform_update(self, serializer):
+        old_facts = rollups.order_facts(serializer.instance)
+        with transaction.atomic():
+            order = serializer.save()
+            rollups.record_order_change(old_facts, rollups.order_facts(order))
     
     @action(detail=True, methods=['patch'], permission_classes=[IsAuthenticated])
     def update_status(self, request, pk=None):
@@ -270,37 +374,40 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         if serializer.is_valid():
             old_status = order.status
-            serializer.save()
-            
-            # Update actual times based on status
-            new_status = serializer.validated_data.get('status', order.status)
-            
-            if new_status == 'loaded' and old_status != 'loaded':
-                order.actual_pickup_time = timezone.now()
-            elif new_status == 'delivered' and old_status != 'delivered':
-                order.actual_delivery_time = timezone.now()
-            
-            order.save()
+            old_facts = rollups.order_facts(order)
+            with transaction.atomic():
+                serializer.save()
+                
+                # Update actual times based on status
+                new_status = serializer.validated_data.get('status', order.status)
+                
+                if new_status == 'loaded' and old_status != 'loaded':
+                    order.actual_pickup_time = timezone.now()
+                elif new_status == 'delivered' and old_status != 'delivered':
+                    order.actual_delivery_time = timezone.now()
+                
+                order.save()
+                rollups.record_order_change(old_facts, rollups.order_facts(order))
             
             # Create notification for status change
             if old_status != new_status:
                 # Notify admin
                 if request.user.role == 'user':
-                    Notification.objects.create(
-                        user=order.requirement.admin,
-                        title='Order Status Updated',
-                        message=f'Order {order.order_number} status changed to {order.get_status_display()}',
-                        notification_type='order_status_changed',
+                    notifications.notify(
+                        order.requirement.admin,
+                        'Order Status Updated',
+                        f'Order {order.order_number} status changed to {order.get_status_display()}',
+                        'order_status_changed',
                         requirement=order.requirement,
                         order=order
                     )
                 # Notify truck owner
                 else:
-                    Notification.objects.create(
-                        user=order.user,
-                        title='Order Status Updated',
-                        message=f'Order {order.order_number} status changed to {order.get_status_display()}',
-                        notification_type='order_status_changed',
+                    notifications.notify(
+                        order.user,
+                        'Order Status Updated',
+                        f'Order {order.order_number} status changed to {order.get_status_display()}',
+                        'order_status_changed',
                         requirement=order.requirement,
                         order=order
                     )
@@ -315,30 +422,87 @@ class LocationViewSet(viewsets.ModelViewSet):
     """ViewSet for location tracking"""
     serializer_class = LocationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = LocationCursorPagination
     
-    def get_queryset(self):
+    def _visible(self, queryset):
         order_id = self.request.query_params.get('order_id', None)
-        queryset = Location.objects.all().select_related('order')
-        
         if order_id:
             queryset = queryset.filter(order_id=order_id)
         
         # Filter based on user role
         if self.request.user.role == 'admin':
-            queryset = queryset.filter(order__requirement__admin=self.request.user)
-        else:
-            queryset = queryset.filter(order__user=self.request.user)
-        
-        return queryset
+            return queryset.filter(order__requirement__admin=self.request.user)
+        return queryset.filter(order__user=self.request.user)
+    
+    def get_queryset(self):
+        return self._visible(Location.objects.all().select_related('order'))
+    
+    def get_segment_queryset(self):
+        return self._visible(LocationSegment.objects.all())
+    
+    def list(self, request, *args, **kwargs):
+        tolerance = get_simplify_tolerance(request)
+        if tolerance is not None and not request.query_params.get('order_id'):
+            # Every page simplifies the whole track; bound that to one order
+            raise ValidationError({'simplify': ['Requires order_id']})
+        # Read through the track store so packed history is listed too
+        history = tracks.TrackHistory(
+            self.get_queryset(),
+            self.get_segment_queryset(),
+            descending=self._descending(),
+            since=self._time_param('since'),
+            until=self._time_param('until'),
+            tolerance=tolerance,
+        )
+        page = self.paginate_queryset(history)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(history, many=True)
+        return Response(serializer.data)
+    
+    def _descending(self):
+        ordering = self.request.query_params.get('ordering', '-timestamp')
+        if ordering not in ('timestamp', '-timestamp'):
+            raise ValidationError({'ordering': ["Must be 'timestamp' or '-timestamp'"]})
+        return ordering == '-timestamp'
+    
+    def _time_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({name: ['Must be an ISO 8601 date and time']})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
     
     def perform_create(self, serializer):
         order = serializer.validated_data['order']
         
         # Check if user can add location to this order
         if self.request.user.role == 'user' and order.user == self.request.user:
-            serializer.save()
+            with transaction.atomic():
+                location = serializer.save()
+                tracks.record_fixes(order.id, [location])
         else:
             raise PermissionError("You can only add location to your own orders")
+    
+    def perform_update(self, serializer):
+        old_order_id = serializer.instance.order_id
+        with transaction.atomic():
+            location = serializer.save()
+            for order_id in {old_order_id, location.order_id}:
+                tracks.refresh_track_stats(order_id)
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            tracks.refresh_track_stats(instance.order_id)
 
 
 @api_view(['GET'])
@@ -346,16 +510,16 @@ class LocationViewSet(viewsets.ModelViewSet):
 def current_location(request, order_id):
     """Get current location of an order"""
     try:
-        order = Order.objects.get(id=order_id)
+        order = Order.objects.select_related('requirement').get(id=order_id)
         
         # Check permissions
-        if (request.user.role == 'admin' and order.requirement.admin == request.user) or \
-           (request.user.role == 'user' and order.user == request.user):
+        if (request.user.role == 'admin' and order.requirement.admin_id == request.user.id) or \
+           (request.user.role == 'user' and order.user_id == request.user.id):
             
-            latest_location = order.locations.first()
+            # Served from the copy on the order; Location is only read when the copy is missing
+            latest_location = tracks.latest_location_data(order)
             if latest_location:
-                serializer = LocationSerializer(latest_location)
-                return Response(serializer.data)
+                return Response(latest_location)
             else:
                 return Response({'detail': 'No location data available'}, 
                                status=status.HTTP_404_NOT_FOUND)
@@ -368,6 +532,41 @@ def current_location(request, order_id):
                        status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['POST'])
+@permission_classes([IsTruckOwner])
+@parser_classes([JSONParser, TrackParser])
+def location_batch(request, order_id):
+    """Upload many buffered location fixes for an order in one request"""
+    order = get_object_or_404(Order, id=order_id)
+    if order.user_id != request.user.id:
+        return Response({'detail': 'You can only add location to your own orders'}, 
+                       status=status.HTTP_403_FORBIDDEN)
+    
+    data = request.data
+    if isinstance(data, list):
+        data = {'fixes': data}
+    serializer = LocationBatchSerializer(data=data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    with transaction.atomic():
+        locations = Location.objects.bulk_create(
+            [Location(order=order, **fix) for fix in serializer.validated_data['fixes']],
+            batch_size=500
+        )
+        tracks.record_fixes(order.id, locations)
+    
+    # Subscribers only need the newest position, not every buffered fix
+    latest = max(locations, key=lambda location: location.timestamp)
+    latest_data = LocationSerializer(latest).data
+    send_tracking_update(order.id, 'location_update', latest_data)
+    
+    return Response({
+        'created': len(locations),
+        'latest': latest_data,
+    }, status=status.HTTP_201_CREATED)
+
+
 # Notification Views
 class NotificationViewSet(viewsets.ModelViewSet):
     """ViewSet for notifications"""
@@ -385,102 +584,106 @@ class NotificationViewSet(viewsets.ModelViewSet):
         notification = self.get_object()
         notification.is_read = True
         notification.save()
+        notifications.push_unread_count(request.user.id)
         return Response({'status': 'notification marked as read'})
     
     @action(detail=False, methods=['patch'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
-        self.get_queryset().update(is_read=True)
-        return Response({'status': 'all notifications marked as read'})
+        updated = notifications.mark_all_read(request.user.id, settings.NOTIFICATION_MARK_READ_CHUNK_SIZE)
+        if updated:
+            notifications.push_unread_count(request.user.id)
+        return Response({'status': 'all notifications marked as read', 'updated': updated})
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Unread count, and how many old read notifications were purged"""
+        archive = NotificationArchive.objects.filter(user=request.user).first()
+        return Response({
+            'unread_count': notifications.unread_counts([request.user.id])[request.user.id],
+            'archived_count': archive.archived_count if archive else 0,
+        })
 
 
 # Dashboard Views
+def wants_fresh(request):
+    """``?fresh=1`` recomputes a cached response instead of reading it"""
+    return request.query_params.get('fresh', '').lower() in ('1', 'true')
+
+
 @api_view(['GET'])
 @permission_classes([IsAdmin])
 def admin_dashboard(request):
     """Admin dashboard statistics"""
-    user = request.user
-    
-    # Calculate statistics
-    total_requirements = Requirement.objects.filter(admin=user).count()
-    active_orders = Order.objects.filter(
-        requirement__admin=user, 
-        status__in=['pending', 'confirmed', 'pickup_scheduled', 'loaded', 'on_the_way']
-    ).count()
-    completed_orders = Order.objects.filter(
-        requirement__admin=user, 
-        status='completed'
-    ).count()
-    total_bids = Bid.objects.filter(requirement__admin=user).count()
-    pending_bids = Bid.objects.filter(
-        requirement__admin=user, 
-        status='pending'
-    ).count()
-    
-    # Calculate total revenue from completed orders
-    total_revenue = Order.objects.filter(
-        requirement__admin=user,
-        status='completed'
-    ).aggregate(
-        total=Sum('accepted_bid__amount')
-    )['total'] or 0
-    
-    stats = {
-        'total_requirements': total_requirements,
-        'active_orders': active_orders,
-        'completed_orders': completed_orders,
-        'total_bids': total_bids,
-        'pending_bids': pending_bids,
-        'total_revenue': total_revenue,
-    }
-    
-    serializer = DashboardStatsSerializer(stats)
-    return Response(serializer.data)
+    return Response(dashboards.get_dashboard(dashboards.ADMIN, request.user.id, fresh=wants_fresh(request)))
 
 
 @api_view(['GET'])
 @permission_classes([IsTruckOwner])
 def truck_owner_dashboard(request):
     """Truck owner dashboard statistics"""
-    user = request.user
-    
-    # Calculate statistics
-    total_trucks = Truck.objects.filter(user=user, is_active=True).count()
-    active_orders = Order.objects.filter(
-        user=user, 
-        status__in=['pending', 'confirmed', 'pickup_scheduled', 'loaded', 'on_the_way']
-    ).count()
-    completed_orders = Order.objects.filter(user=user, status='completed').count()
-    pending_bids = Bid.objects.filter(user=user, status='pending').count()
-    
-    # Calculate total earnings
-    total_earnings = Order.objects.filter(
-        user=user,
-        status='completed'
-    ).aggregate(
-        total=Sum('accepted_bid__amount')
-    )['total'] or 0
-    
-    # Calculate average rating
-    average_rating = Order.objects.filter(
-        user=user,
-        status='completed',
-        rating__isnull=False
-    ).aggregate(
-        avg_rating=Avg('rating')
-    )['avg_rating']
-    
-    stats = {
-        'total_trucks': total_trucks,
-        'active_orders': active_orders,
-        'completed_orders': completed_orders,
-        'pending_bids': pending_bids,
-        'total_earnings': total_earnings,
-        'average_rating': average_rating,
-    }
-    
-    serializer = TruckOwnerStatsSerializer(stats)
-    return Response(serializer.data)
+    return Response(dashboards.get_dashboard(dashboards.TRUCK_OWNER, request.user.id, fresh=wants_fresh(request)))
+
+
+# Default range when ``since`` is not given: the current period plus this much before it
+TIMESERIES_DEFAULT_SPAN = {
+    'day': timedelta(days=29),
+    'week': timedelta(weeks=11),
+    'month': timedelta(days=334),
+}
+TIMESERIES_MAX_DAYS = 3 * 366
+
+
+def timeseries_response(request, role):
+    """Dashboard timeseries of the requesting user from ``?granularity=&since=&until=``"""
+    granularity = request.query_params.get('granularity', 'day')
+    if granularity not in rollups.GRANULARITIES:
+        raise ValidationError({'granularity': [f"Must be one of: {', '.join(rollups.GRANULARITIES)}"]})
+
+    dates = {}
+    for name in ('since', 'until'):
+        value = request.query_params.get(name)
+        if not value:
+            continue
+        try:
+            dates[name] = parse_date(value)
+        except ValueError:
+            dates[name] = None
+        if dates[name] is None:
+            raise ValidationError({name: ['Must be a date (YYYY-MM-DD)']})
+
+    until = dates.get('until') or timezone.localdate()
+    since = dates.get('since') or rollups.period_start(
+        rollups.period_start(until, granularity) - TIMESERIES_DEFAULT_SPAN[granularity], granularity
+    )
+    if since > until:
+        raise ValidationError({'since': ['Must not be after until']})
+    if (until - since).days > TIMESERIES_MAX_DAYS:
+        raise ValidationError({'since': [f'The range can span at most {TIMESERIES_MAX_DAYS} days']})
+
+    series = rollups.timeseries(request.user.id, role, granularity, since, until)
+    return Response(OrderTimeseriesSerializer(series, many=True).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def admin_timeseries(request):
+    """Admin order counts, revenue and rating per day, week or month"""
+    return timeseries_response(request, rollups.ADMIN)
+
+
+@api_view(['GET'])
+@permission_classes([IsTruckOwner])
+def truck_owner_timeseries(request):
+    """Truck owner order counts, earnings and rating per day, week or month"""
+    return timeseries_response(request, rollups.TRUCK_OWNER)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def dashboard_cache_stats(request):
+    """Hit and miss counters of the dashboard statistics cache (staff only)"""
+    return Response(dashboards.cache_counters())
 
 
 # Search and Filter Views
@@ -502,14 +705,6 @@ def search_requirements(request):
     pickup_date_to = request.GET.get('pickup_date_to', '')
     
     # Apply filters
-    if search_query:
-        queryset = queryset.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(from_location__icontains=search_query) |
-            Q(to_location__icontains=search_query)
-        )
-    
     if truck_type:
         queryset = queryset.filter(truck_type=truck_type)
     
@@ -552,6 +747,12 @@ def search_requirements(request):
         except ValueError:
             pass
     
+    if request.GET.get('pagination') == 'cursor':
+        return search_requirements_by_cursor(request, queryset, search_query)
+    
+    if search_query:
+        queryset = search.search_requirements(queryset, search_query)
+    
     # Paginate results
     from django.core.paginator import Paginator
     
@@ -570,6 +771,98 @@ def search_requirements(request):
         'has_previous': page_obj.has_previous(),
     })
 
+
+def search_requirements_by_cursor(request, queryset, search_query):
+    """Newest-first keyset pages of the filtered requirements; first pages are cached"""
+    cache_key = None
+    if not request.GET.get(RequirementCursorPagination.cursor_query_param):
+        cache_key = search.first_page_cache_key(request.GET)
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+
+    if search_query:
+        queryset = search.match_requirements(queryset, search_query)
+    paginator = RequirementCursorPagination()
+    page = paginator.paginate_queryset(queryset.select_related('admin'), request)
+    data = paginator.get_paginated_data(RequirementSerializer(page, many=True).data)
+    if cache_key is not None:
+        cache.set(cache_key, data, settings.SEARCH_FIRST_PAGE_CACHE_TIMEOUT)
+    return Response(data)
+
+
+def float_param(request, name, minimum, maximum, default=None):
+    """Query parameter ``name`` as a float within [minimum, maximum]"""
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None or not minimum <= number <= maximum:
+        raise ValidationError({name: [f'Must be a number between {minimum} and {maximum}']})
+    return number
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def nearby_requirements(request):
+    """Open requirements picking up within ``radius`` km of one of the caller's trucks or of ``lat``/``lng``, nearest first"""
+    queryset = Requirement.objects.filter(is_active=True, status='open')
+    radius = float_param(request, 'radius', 0, proximity.MAX_RADIUS_KM, proximity.DEFAULT_RADIUS_KM)
+    latitude = float_param(request, 'lat', -90, 90)
+    longitude = float_param(request, 'lng', -180, 180)
+    if (latitude is None) != (longitude is None):
+        raise ValidationError({'lat' if latitude is None else 'lng': ['lat and lng must be given together']})
+    
+    truck_id = request.query_params.get('truck')
+    if truck_id:
+        if not truck_id.isdigit():
+            raise ValidationError({'truck': ['Must be a truck id']})
+        truck = get_object_or_404(Truck, pk=truck_id, user=request.user, is_active=True)
+        queryset = queryset.filter(truck_type__in=matching.carried_types(truck.truck_type), weight__lte=truck.capacity)
+        if latitude is None:
+            position = proximity.truck_position(truck)
+            if position is None:
+                raise ValidationError({'truck': ['The truck has no known position; pass lat and lng']})
+            latitude, longitude = position
+    elif latitude is None:
+        raise ValidationError({'truck': ['Pass a truck or lat and lng']})
+    else:
+        truck_type = request.query_params.get('truck_type')
+        capacity = float_param(request, 'capacity', 0, 10 ** 8)
+        if truck_type:
+            queryset = queryset.filter(truck_type__in=matching.carried_types(truck_type))
+        if capacity is not None:
+            queryset = queryset.filter(weight__lte=capacity)
+    
+    ids, distances = proximity.requirements_near(queryset, latitude, longitude, radius)
+    
+    from django.core.paginator import Paginator
+    
+    paginator = Paginator(range(len(ids)), 20)
+    page_obj = paginator.get_page(request.GET.get('page', 1))
+    page = slice(page_obj.start_index() - 1, page_obj.end_index())
+    requirements = Requirement.objects.select_related('admin').in_bulk(ids[page].tolist())
+    results = []
+    for requirement_id, distance in zip(ids[page].tolist(), distances[page].tolist()):
+        requirement = requirements[requirement_id]
+        requirement.distance_km = round(distance, 2)
+        results.append(requirement)
+    
+    return Response({
+        'origin': {'latitude': latitude, 'longitude': longitude},
+        'radius_km': radius,
+        'results': NearbyRequirementSerializer(results, many=True).data,
+        'count': paginator.count,
+        'num_pages': paginator.num_pages,
+        'current_page': page_obj.number,
+        'has_next': page_obj.has_next(),
+        'has_previous': page_obj.has_previous(),
+    })
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def simulate_location_update(request, order_id):
@@ -584,66 +877,46 @@ def simulate_location_update(request, order_id):
         # Get source and destination from order requirement
         from_location = order.requirement.from_location
         to_location = order.requirement.to_location
-        # Define coordinates for major cities (you can expand this)
-        city_coordinates = {
-            'Chandigarh': {'lat': 30.7333, 'lng': 76.7794},
-            'Delhi': {'lat': 28.6139, 'lng': 77.2090},
-            'Mumbai': {'lat': 19.0760, 'lng': 72.8777},
-            'Bangalore': {'lat': 12.9716, 'lng': 77.5946},
-            'Chennai': {'lat': 13.0827, 'lng': 80.2707},
-            'Kolkata': {'lat': 22.5726, 'lng': 88.3639},
-            'Pune': {'lat': 18.5204, 'lng': 73.8567},
-            'Hyderabad': {'lat': 17.3850, 'lng': 78.4867},
-            'Ahmedabad': {'lat': 23.0225, 'lng': 72.5714},
-            'Jaipur': {'lat': 26.9124, 'lng': 75.7873},
-            'Gujrat': {'lat': 23.0225, 'lng': 72.5714},  # Gujarat
-            'Nagpur': {'lat': 21.1458, 'lng': 79.0882},
-        }
-
-        # Normalize the from/to locations
-        from_location_key = from_location.split(",")[0].strip()
-        to_location_key = to_location.split(",")[0].strip()
-        # Lookup coordinates
-        source_coords = city_coordinates.get(from_location_key, {'lat': 30.7333, 'lng': 76.7794})
-        dest_coords = city_coordinates.get(to_location_key, {'lat': 28.6139, 'lng': 77.2090})
-        #print(f"Source coords: {source_coords}, Dest coords: {dest_coords}")
+        source = gazetteer.geocode(from_location)
+        destination = gazetteer.geocode(to_location)
+        if source is None or destination is None:
+            unknown = from_location if source is None else to_location
+            return Response({'error': f'Unknown location: {unknown}'}, status=400)
         
         # Generate location between source and destination
         # Calculate progress (0 to 1) based on current time or random
         progress = random.uniform(0.1, 0.9)  # Between 10% to 90% of journey
         
         # Interpolate between source and destination
-        lat = source_coords['lat'] + (dest_coords['lat'] - source_coords['lat']) * progress
-        lng = source_coords['lng'] + (dest_coords['lng'] - source_coords['lng']) * progress
+        lat = source.latitude + (destination.latitude - source.latitude) * progress
+        lng = source.longitude + (destination.longitude - source.longitude) * progress
         
         # Add some random variation to simulate real movement
         lat += random.uniform(-0.01, 0.01)
         lng += random.uniform(-0.01, 0.01)
         
+        near, _ = gazetteer.get_gazetteer().nearest(lat, lng)
+        
         # Create location record
-        location = Location.objects.create(
-            order=order,
-            latitude=lat,
-            longitude=lng,
-            address=f"En route from {from_location} to {to_location}",
-            speed=random.uniform(30, 80),
-            heading=random.uniform(0, 360),
-            accuracy=random.uniform(5, 20)
-        )
+        with transaction.atomic():
+            location = Location.objects.create(
+                order=order,
+                latitude=lat,
+                longitude=lng,
+                address=f"En route from {from_location} to {to_location}, near {near.name}",
+                speed=random.uniform(30, 80),
+                heading=random.uniform(0, 360),
+                accuracy=random.uniform(5, 20)
+            )
+            tracks.record_fixes(order.id, [location])
         
-        # Send WebSocket update
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'tracking_{order_id}',
-            {
-                'type': 'location_update',
-                'data': LocationSerializer(location).data
-            }
-        )
+        # Send WebSocket update; consumers join the group by pk, whatever the URL used
+        location_data = LocationSerializer(location).data
+        send_tracking_update(order.id, 'location_update', location_data)
         
         return Response({
             'message': 'Location update sent',
-            'location': LocationSerializer(location).data,
+            'location': location_data,
             'source': from_location,
             'destination': to_location,
             'progress': f"{progress*100:.1f}%"
@@ -662,30 +935,26 @@ def update_order_status(request, order_id):
     try:
         # Try to get order by ID first, then by order_number
         try:
-            order = Order.objects.get(id=int(order_id))
+            order = Order.objects.select_related('requirement', 'accepted_bid').get(id=int(order_id))
         except (ValueError, Order.DoesNotExist):
-            order = Order.objects.get(order_number=order_id)
+            order = Order.objects.select_related('requirement', 'accepted_bid').get(order_number=order_id)
         
         new_status = request.data.get('status')
         
         if new_status not in dict(Order.STATUS_CHOICES):
             return Response({'error': 'Invalid status'}, status=400)
         
+        old_facts = rollups.order_facts(order)
         order.status = new_status
-        order.save()
+        with transaction.atomic():
+            order.save()
+            rollups.record_order_change(old_facts, rollups.order_facts(order))
         
         # Send WebSocket update
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'tracking_{order_id}',
-            {
-                'type': 'order_status_update',
-                'data': {
-                    'status': order.status,
-                    'status_display': order.get_status_display()
-                }
-            }
-        )
+        send_tracking_update(order.id, 'order_status_update', {
+            'status': order.status,
+            'status_display': order.get_status_display()
+        })
         
         return Response({
             'message': 'Order status updated',